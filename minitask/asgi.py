@@ -2,6 +2,8 @@
 ASGI config for minitask project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The task event stream is served by a plain ASGI application, everything else
+by Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
@@ -13,4 +15,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "minitask.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Django must be set up before importing the apps
+# pylint: disable=wrong-import-position
+from tasks.event_stream import EVENTS_PATH, task_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == EVENTS_PATH:
+        await task_events(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
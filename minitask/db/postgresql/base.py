@@ -0,0 +1,178 @@
+"""
+PostgreSQL backend with connection health checks and an optional pool
+
+Persistent connections (CONN_MAX_AGE) save the connection handshake, TLS
+included, on every request. Django only finds out that a reused connection
+was closed by the server when a query of the request fails. With
+CONN_HEALTH_CHECKS, a reused connection is checked before its first query
+in a request and replaced if it does not work, like Django 4.1 does.
+
+Persistent connections are kept per thread, which does not help servers
+starting a thread per request, like the ASGI server. The POOL setting keeps
+the closed connections of a process for reuse instead, eg.:
+
+    DATABASES["default"]["POOL"] = {"size": 10, "timeout": 5}
+
+No more than size connections are open at a time, more threads wait up to
+timeout seconds for one to be returned.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.base import Database
+from psycopg2 import extensions
+
+Idle = Tuple[extensions.connection, Optional[int]]
+"""A pooled connection and its isolation level"""
+
+
+class Pool:
+    """Connections of a process available for reuse"""
+
+    def __init__(self, size: int, timeout: float = 5):
+        self.size = size
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._idle: List[Idle] = []
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        """Wait for a connection to be available"""
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise Database.OperationalError(
+                f"No database connection available in {self.timeout} seconds, "
+                f"all {self.size} are in use"
+            )
+
+    def release(self):
+        """Make a connection available for another thread"""
+
+        self._slots.release()
+
+    def take(self) -> Optional[Idle]:
+        """The most recently returned connection, if any"""
+
+        with self._lock:
+            return self._idle.pop() if self._idle else None
+
+    def give(self, idle: Idle):
+        """Return a connection for reuse"""
+
+        with self._lock:
+            self._idle.append(idle)
+
+
+_pools: Dict[str, Pool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(alias: str, options: dict) -> Pool:
+    with _pools_lock:
+        pool = _pools.get(alias)
+        # Connections inherited from the parent process can not be shared
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[alias] = Pool(**options)
+        return pool
+
+
+def _is_usable(connection: extensions.connection) -> bool:
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_enabled = self.settings_dict.get("CONN_HEALTH_CHECKS", False)
+        self.health_check_done = False
+        # Set when connecting, from the database or a pooled connection
+        self.isolation_level: Optional[int] = None
+
+    def _get_pool(self) -> Optional[Pool]:
+        options = self.settings_dict.get("POOL")
+        return _get_pool(self.alias, options) if options else None
+
+    def connect(self):
+        super().connect()
+        # New and pooled connections are checked already
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Kept for the next request, check it before it is used again
+        self.health_check_done = False
+
+    def _cursor(self, name=None):
+        self._close_if_health_check_failed()
+        return super()._cursor(name)
+
+    def _close_if_health_check_failed(self):
+        if (
+            self.connection is None
+            or not self.health_check_enabled
+            or self.health_check_done
+        ):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def get_new_connection(self, conn_params):
+        pool = self._get_pool()
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        pool.acquire()
+        try:
+            while True:
+                idle = pool.take()
+                if idle is None:
+                    return super().get_new_connection(conn_params)
+                connection, self.isolation_level = idle
+                if not self.health_check_enabled or _is_usable(connection):
+                    return connection
+                connection.close()
+        except BaseException:
+            pool.release()
+            raise
+
+    def _close(self):
+        pool = self._get_pool()
+        if pool is None or self.connection is None:
+            super()._close()
+            return
+
+        try:
+            with self.wrap_database_errors:
+                if self._reset_for_reuse():
+                    pool.give((self.connection, self.isolation_level))
+                else:
+                    self.connection.close()
+        finally:
+            pool.release()
+
+    def _reset_for_reuse(self) -> bool:
+        """Whether the connection can be reused, rolled back if in a transaction"""
+
+        connection = self.connection
+        if connection.closed or (self.errors_occurred and not self.is_usable()):
+            return False
+
+        status = connection.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except Database.Error:
+                return False
+        return True
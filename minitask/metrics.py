@@ -0,0 +1,340 @@
+"""
+Metrics in the Prometheus text format
+
+Metrics are declared at the module level, like loggers, and served at
+/metrics by metrics_view. MetricsMiddleware observes the latency of the
+requests by view, the database connections left open are sampled when
+requests finish.
+
+The values are kept in memory by each process. When the METRICS_DIR
+setting is set, each process also writes them to a file of its own in that
+directory when a request finishes, at most every FLUSH_SECONDS, and when it
+exits. /metrics sums the files of all processes, eg. of all gunicorn workers.
+Counters and histograms of exited processes are kept, gauges are only summed
+from running processes. The directory is meant to be emptied whenever the
+server is started.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from hmac import compare_digest
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.signals import request_finished
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+Labels = Tuple[Tuple[str, str], ...]
+Key = Tuple[str, Labels]
+
+FLUSH_SECONDS = 5
+"""Minimum interval of writing the values of a process to its file"""
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+"""Upper bounds of the histogram buckets in seconds"""
+
+
+class _Store:
+    """Metric values of this process, and of the others if shared in files"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = False
+        self._flushed_at = float("-inf")
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._filename = f"{self._pid}-{uuid.uuid4().hex}.json"
+        self._counters: Dict[Key, float] = {}
+        self._gauges: Dict[Key, float] = {}
+        self._changed = False
+
+    def add(self, key: Key, value: float):
+        """Add to a counter value"""
+
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._changed = True
+
+    def set(self, key: Key, value: float):
+        """Set a gauge value"""
+
+        with self._lock:
+            self._check_fork()
+            if self._gauges.get(key) != value:
+                self._gauges[key] = value
+                self._changed = True
+
+    def _check_fork(self):
+        # Values inherited from the parent process were counted there
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def flush(self, force: bool = False):
+        """
+        Write the values of this process to its file if shared in files
+
+        Not more often than every FLUSH_SECONDS unless forced.
+        """
+
+        directory = settings.METRICS_DIR
+        with self._lock:
+            now = time.monotonic()
+            if (
+                not directory
+                or not self._changed
+                or (not force and now - self._flushed_at < FLUSH_SECONDS)
+            ):
+                return
+            self._check_fork()
+            self._flushed_at = now
+            data = {
+                "pid": self._pid,
+                "counters": _dump(self._counters),
+                "gauges": _dump(self._gauges),
+            }
+            self._changed = False
+
+        # Written to a temporary file first, readers never see partial files
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, suffix=".tmp", delete=False
+        ) as file:
+            json.dump(data, file)
+        os.replace(file.name, os.path.join(directory, self._filename))
+
+    def collect(self) -> Tuple[Dict[Key, float], Dict[Key, float]]:
+        """The counter and gauge values of all processes"""
+
+        directory = settings.METRICS_DIR
+        if not directory:
+            with self._lock:
+                return dict(self._counters), dict(self._gauges)
+
+        self.flush(force=True)
+        counters: Dict[Key, float] = {}
+        gauges: Dict[Key, float] = {}
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as file:
+                    data = json.load(file)
+            except FileNotFoundError:
+                continue
+            _sum(counters, data["counters"])
+            if _is_running(data["pid"]):
+                _sum(gauges, data["gauges"])
+        return counters, gauges
+
+
+def _dump(values: Dict[Key, float]) -> list:
+    return [[name, list(labels), value] for (name, labels), value in values.items()]
+
+
+def _sum(values: Dict[Key, float], dumped: list):
+    for name, labels, value in dumped:
+        key = (name, tuple(tuple(label) for label in labels))
+        values[key] = values.get(key, 0) + value
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_store = _Store()
+atexit.register(_store.flush, force=True)
+
+_metrics: List["Metric"] = []
+
+
+class Metric:
+    """A metric family, registered to be served when created"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _metrics.append(self)
+
+    def _labels(self, labels: Dict[str, str]) -> Labels:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} has the labels {self.labelnames}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def sample_names(self) -> Tuple[str, ...]:
+        """Names of the samples of the family"""
+
+        return (self.name,)
+
+
+class Counter(Metric):
+    """A value only increasing"""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        _store.add((self.name, self._labels(labels)), amount)
+
+
+class Gauge(Metric):
+    """A value going up and down, summed over the running processes"""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        _store.set((self.name, self._labels(labels)), value)
+
+
+class Histogram(Metric):
+    """Observed values counted in buckets"""
+
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        labels = self._labels(labels)
+        # Buckets are cumulative, a value is counted in all greater or equal.
+        # All buckets are added for them to be served, even if empty.
+        for bound in self.buckets:
+            _store.add(
+                (f"{self.name}_bucket", labels + (("le", str(bound)),)),
+                int(value <= bound),
+            )
+        _store.add((f"{self.name}_bucket", labels + (("le", "+Inf"),)), 1)
+        _store.add((f"{self.name}_sum", labels), value)
+        _store.add((f"{self.name}_count", labels), 1)
+
+    def sample_names(self):
+        return (f"{self.name}_bucket", f"{self.name}_sum", f"{self.name}_count")
+
+
+REQUEST_DURATION = Histogram(
+    "minitask_request_duration_seconds",
+    "Time spent responding to requests by URL name",
+    ["view"],
+)
+
+DB_CONNECTIONS = Gauge(
+    "minitask_db_connections", "Open database connections", ["database"]
+)
+
+DB_CONNECTIONS_OPENED = Counter(
+    "minitask_db_connections_opened_total", "Database connections opened", ["database"],
+)
+
+
+def _on_connection_created(connection, **_kwargs):
+    DB_CONNECTIONS_OPENED.inc(database=connection.alias)
+
+
+def _on_request_finished(**_kwargs):
+    # Connected after close_old_connections() by importing django.db first,
+    # the connections not kept for the next request are closed already
+    for connection in connections.all():
+        DB_CONNECTIONS.set(
+            int(connection.connection is not None), database=connection.alias
+        )
+    _store.flush()
+
+
+connection_created.connect(_on_connection_created)
+request_finished.connect(_on_request_finished)
+
+
+def exposition() -> str:
+    """All metrics in the Prometheus text format"""
+
+    counters, gauges = _store.collect()
+    samples: Dict[str, List[Tuple[Labels, float]]] = {}
+    for (name, labels), value in sorted({**counters, **gauges}.items()):
+        samples.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name in metric.sample_names():
+            for labels, value in _sort_buckets(samples.get(name, [])):
+                lines.append(f"{name}{_format_labels(labels)} {value!r}")
+    return "\n".join(lines) + "\n"
+
+
+def _sort_buckets(samples: List[Tuple[Labels, float]]):
+    def key(sample):
+        labels = dict(sample[0])
+        bound = labels.pop("le", None)
+        return (
+            sorted(labels.items()),
+            float("inf") if bound in (None, "+Inf") else float(bound),
+        )
+
+    return sorted(samples, key=key)
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+class MetricsMiddleware:
+    """Observes the latency of the requests"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        resolver_match = getattr(request, "resolver_match", None)
+        REQUEST_DURATION.observe(
+            duration, view=resolver_match.view_name if resolver_match else ""
+        )
+        return response
+
+
+def metrics_view(request):
+    """
+    The metrics for Prometheus
+
+    Requires the METRICS_TOKEN setting as a bearer token, or a staff user.
+    """
+
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    if not (
+        (token and compare_digest(authorization, f"Bearer {token}"))
+        or request.user.is_staff
+    ):
+        raise PermissionDenied
+
+    return HttpResponse(
+        exposition(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
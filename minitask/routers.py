@@ -0,0 +1,136 @@
+"""
+Routing reads of requests to a read replica
+
+When a "replica" database is configured (REPLICA_DATABASE_URL), the queries
+reading data in requests are sent to it, everything else to the primary
+"default" database:
+
+- Writes, and reads in transactions, which may be followed by writes.
+- Reads outside of requests, eg. of management commands.
+- Reads of requests with unsafe methods (POST, PATCH, ...), which write.
+- Reads of a session for REPLICA_PIN_SECONDS after it wrote, so that users
+  see their own changes even if the replica lags behind.
+- Reads of code decorated with use_primary(), eg. comparing versions for
+  optimistic locking.
+- Sessions, which have to be read before knowing any of the above.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA = "replica"
+
+PINNED_UNTIL_KEY = "_replica_pinned_until"
+"""Session key of the time until reading from the primary"""
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+
+class _RequestState:
+    def __init__(self, primary: bool):
+        self.primary = primary
+        self.wrote = False
+
+
+_state: ContextVar[Optional[_RequestState]] = ContextVar(
+    "replica_routing", default=None
+)
+
+
+class ReplicaRouter:
+    """Database router sending reads of requests to the replica, see above"""
+
+    # The methods and arguments are the ones Django calls routers with
+    # pylint: disable=unused-argument,no-self-use,invalid-name
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is None
+            or state.primary
+            or REPLICA not in settings.DATABASES
+            or model._meta.app_label == "sessions"
+            or connections["default"].in_atomic_block
+        ):
+            return "default"
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica has the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary database within, usable as a decorator too"""
+
+    state = _state.get()
+    if state is None:
+        yield
+        return
+
+    primary = state.primary
+    state.primary = True
+    try:
+        yield
+    finally:
+        state.primary = primary
+
+
+class ReplicaMiddleware:
+    """Routes the reads of requests to the replica when possible"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if REPLICA not in settings.DATABASES:
+            return self.get_response(request)
+
+        pinned_until = request.session.get(PINNED_UNTIL_KEY, 0)
+        state = _RequestState(
+            primary=request.method not in SAFE_METHODS or time.time() < pinned_until
+        )
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if response.streaming:
+            response.streaming_content = _stream_in_state(
+                state, response.streaming_content
+            )
+        if state.wrote:
+            request.session[PINNED_UNTIL_KEY] = time.time() + (
+                settings.REPLICA_PIN_SECONDS
+            )
+        return response
+
+
+def _stream_in_state(state: _RequestState, content):
+    # Streamed after the middleware returned, eg. exports reading the tasks
+    iterator = iter(content)
+    while True:
+        token = _state.set(state)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _state.reset(token)
+        yield chunk
@@ -57,7 +57,10 @@ if bool(distutils.util.strtobool(os.environ.get("ENABLE_HEROKU_LOGGING", "False"
                 "formatter": "verbose",
             },
         },
-        "loggers": {"testlogger": {"handlers": ["console"], "level": "INFO",}},
+        "loggers": {
+            "testlogger": {"handlers": ["console"], "level": "INFO",},
+            "minitask.timing": {"handlers": ["console"], "level": "INFO",},
+        },
     }
 elif bool(distutils.util.strtobool(os.environ.get("DEBUG_SQL", "False"))):
     LOGGING = {
@@ -81,6 +84,16 @@ elif bool(distutils.util.strtobool(os.environ.get("DEBUG_SQL", "False"))):
         },
         # "root": {"handlers": ["console"],},
     }
+else:
+    LOGGING = {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "handlers": {"console": {"class": "logging.StreamHandler",},},
+        "loggers": {
+            # Timing of sampled requests, see minitask/timing.py
+            "minitask.timing": {"handlers": ["console"], "level": "INFO",},
+        },
+    }
 
 ALLOWED_HOSTS = [os.environ["ALLOWED_HOSTS"]] if "ALLOWED_HOSTS" in os.environ else []
 
@@ -103,8 +116,14 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = "accounts.User"
 
 MIDDLEWARE = [
+    "minitask.metrics.MetricsMiddleware",
+    # Outside of the timing, recording the findings is not timed
+    "tasks.query_inspection.QueryInspectionMiddleware",
+    "minitask.timing.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
+    # Uses the session, before the views read from the database
+    "minitask.routers.ReplicaMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -116,7 +135,8 @@ ROOT_URLCONF = "minitask.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates timing the rendering of sampled requests
+        "BACKEND": "minitask.timing.TimedDjangoTemplates",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -137,17 +157,65 @@ FORMAT_MODULE_PATH = ["tasks.formats"]
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+
+def database_from_url(env):
+    """Configure a database from the URL in an environment variable"""
+
+    database = dj_database_url.config(
+        env,
+        # Seconds to keep connections open for, saving the handshake
+        conn_max_age=int(os.environ.get("CONN_MAX_AGE", 0)),
+        ssl_require=True,
+    )
+    if database["ENGINE"] == "django.db.backends.postgresql_psycopg2":
+        # PostgreSQL with health checks and pooling, see minitask/db/postgresql
+        database["ENGINE"] = "minitask.db.postgresql"
+        database["CONN_HEALTH_CHECKS"] = bool(
+            distutils.util.strtobool(os.environ.get("CONN_HEALTH_CHECKS", "True"))
+        )
+        if int(os.environ.get("DATABASE_POOL_SIZE", 0)):
+            database["POOL"] = {
+                "size": int(os.environ["DATABASE_POOL_SIZE"]),
+                "timeout": float(os.environ.get("DATABASE_POOL_TIMEOUT", 5)),
+            }
+    return database
+
+
 if "DATABASE_URL" in os.environ:
     # Configure Django from DATABASE_URL environment variable
-    DATABASES = {"default": dj_database_url.config(ssl_require=True)}
+    DATABASES = {"default": database_from_url("DATABASE_URL")}
 else:
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            "CONN_MAX_AGE": int(os.environ.get("CONN_MAX_AGE", 0)),
         }
     }
 
+if "REPLICA_DATABASE_URL" in os.environ:
+    # Read-only queries of requests, see minitask/routers.py
+    DATABASES["replica"] = database_from_url("REPLICA_DATABASE_URL")
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["minitask.routers.ReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+# The default in-memory cache is per process. Deployments running multiple
+# processes should use a shared cache, eg. memcached, otherwise invalidation
+# only reaches the process that changed the data.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -213,3 +281,39 @@ REQUIRE_DUE_DATE = os.environ.get("REQUIRE_DUE_DATE", False)
 
 REQUIRE_ASSIGNEE = os.environ.get("REQUIRE_ASSIGNEE", False)
 """Require a non-blank assignee on tasks"""
+
+TASKS_PER_PAGE = int(os.environ.get("TASKS_PER_PAGE", 100))
+"""Number of tasks shown on one page of the task list"""
+
+NOTES_PER_PAGE = int(os.environ.get("NOTES_PER_PAGE", 50))
+"""Number of latest notes shown on the task detail page"""
+
+TASK_ROW_CACHE_TIMEOUT = int(os.environ.get("TASK_ROW_CACHE_TIMEOUT", 24 * 60 * 60))
+"""Seconds the rendered rows of the task list are cached for, 0 disables it"""
+
+TASK_EVENTS = bool(distutils.util.strtobool(os.environ.get("TASK_EVENTS", "False")))
+"""Whether the task list subscribes to live updates, only served over ASGI"""
+
+TASK_EVENTS_BROKER = os.environ.get("TASK_EVENTS_BROKER", "tasks.events.LocalBroker")
+"""Class delivering live task list updates, see tasks/events.py"""
+
+REQUEST_TIMING_SAMPLE_RATE = float(os.environ.get("REQUEST_TIMING_SAMPLE_RATE", 0))
+"""Fraction of requests timed, between 0 and 1, see minitask/timing.py"""
+
+QUERY_INSPECTION_SAMPLE_RATE = float(os.environ.get("QUERY_INSPECTION_SAMPLE_RATE", 0))
+"""Fraction of requests inspected, see tasks/query_inspection.py"""
+
+SLOW_QUERY_MS = int(os.environ.get("SLOW_QUERY_MS", 100))
+"""Queries taking at least this many milliseconds are slow"""
+
+DUPLICATE_QUERY_THRESHOLD = int(os.environ.get("DUPLICATE_QUERY_THRESHOLD", 5))
+"""The same query made this many times in a request is repeated"""
+
+METRICS_DIR = os.environ.get("METRICS_DIR")
+"""Directory the processes share the metrics in, see minitask/metrics.py"""
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+"""Bearer token required to read the metrics, staff users can always read them"""
+
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 10))
+"""Seconds a session reads from the primary database after writing"""
@@ -0,0 +1,180 @@
+"""
+Timing of requests
+
+RequestTimingMiddleware measures a sample of the requests, set by the
+REQUEST_TIMING_SAMPLE_RATE setting. For a sampled request it records:
+
+- the total time spent in Django,
+- the number and time of database queries, on all connections,
+- the time spent rendering templates, which includes the queries run while
+  rendering,
+- the cache hits and misses counted with count_cache().
+
+The measurements are sent to the browser in a Server-Timing header, shown
+by the network panel of the developer tools, and logged to the
+minitask.timing logger as one line of key=value pairs. The values are also
+passed to log handlers as the "timing" attribute of the log record.
+
+Templates are only timed when rendered by the TimedDjangoTemplates backend.
+"""
+
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTiming:
+    """Measurements of one request"""
+
+    def __init__(self):
+        self.total = 0.0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._rendering = False
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Database execute wrapper timing the queries"""
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.db_queries += 1
+
+    @contextmanager
+    def rendering(self):
+        """Time rendering a template, unless rendered by another template"""
+
+        if self._rendering:
+            yield
+            return
+
+        self._rendering = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.template_time += time.perf_counter() - start
+            self._rendering = False
+
+    def as_dict(self) -> dict:
+        """The measurements, times in milliseconds"""
+
+        return {
+            "total_ms": round(self.total * 1000, 1),
+            "db_queries": self.db_queries,
+            "db_ms": round(self.db_time * 1000, 1),
+            "template_ms": round(self.template_time * 1000, 1),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+    def server_timing(self) -> str:
+        """The value of the Server-Timing header"""
+
+        values = self.as_dict()
+        return ", ".join(
+            [
+                f"total;dur={values['total_ms']}",
+                f'db;dur={values["db_ms"]};desc="{self.db_queries} queries"',
+                f"template;dur={values['template_ms']}",
+                f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            ]
+        )
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar(
+    "request_timing", default=None
+)
+
+
+def count_cache(hits: int = 0, misses: int = 0):
+    """Count cache hits and misses of the request being measured"""
+
+    timing = _current.get()
+    if timing is not None:
+        timing.cache_hits += hits
+        timing.cache_misses += misses
+
+
+class RequestTimingMiddleware:
+    """Measures a sample of the requests, see the module documentation"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.REQUEST_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timing.execute_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            timing.total = time.perf_counter() - start
+            _current.reset(token)
+
+        response["Server-Timing"] = timing.server_timing()
+        self._log(request, response, timing)
+        return response
+
+    @staticmethod
+    def _log(request, response, timing: RequestTiming):
+        resolver_match = getattr(request, "resolver_match", None)
+        values = {
+            "method": request.method,
+            "path": request.path,
+            "view": resolver_match.view_name if resolver_match else None,
+            "status": response.status_code,
+            **timing.as_dict(),
+        }
+        logger.info(
+            " ".join(f"{name}=%({name})s" for name in values),
+            values,
+            extra={"timing": values},
+        )
+
+
+class TimedTemplate(Template):
+    """Template of the Django template language, timed while rendering"""
+
+    def render(self, context=None, request=None):
+        timing = _current.get()
+        if timing is None:
+            return super().render(context, request)
+        with timing.rendering():
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend with templates timed while rendering"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -18,8 +18,11 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from . import metrics
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics.metrics_view, name="metrics"),
     path("", include("tasks.urls")),
     path("", include("accounts.urls")),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
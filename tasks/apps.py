@@ -5,3 +5,7 @@ from django.utils.translation import gettext_lazy as _
 class TasksConfig(AppConfig):
     name = "tasks"
     verbose_name = _("tasks")
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel,unused-import
+        from . import signals
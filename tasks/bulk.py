@@ -0,0 +1,141 @@
+"""
+Changing many tasks at once
+
+Changes are applied with one UPDATE (plus a few tag and project stats
+queries) for all tasks instead of saving them one by one. The optimistic
+locking of VersionField is still respected: the tasks are locked and their
+versions compared before updating, tasks changed by someone else in the
+meantime are reported as conflicts and left untouched.
+"""
+
+from typing import Dict, List, NamedTuple
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+from taggit.models import Tag, TaggedItem
+
+from . import events
+from .events import TaskEvent
+from .models import CountedState, Task
+from .stats import Delta
+
+BULK_LIMIT = 1000
+"""Maximum number of tasks changed at once"""
+
+
+class BulkResult(NamedTuple):
+    """Outcome of a bulk change"""
+
+    updated: List[int]
+    """Ids of the changed tasks"""
+
+    conflicts: List[int]
+    """Ids of the tasks that were changed since the given version"""
+
+    not_found: List[int]
+    """Ids of the tasks that do not exist or are not visible to the user"""
+
+
+def bulk_change(user, versions: Dict[int, int], action: str, value=None) -> BulkResult:
+    """
+    Change the tasks with the given ids if they are still at the given version
+
+    Actions and their values:
+
+    - "status": set the status to value
+    - "assignee": set the assignee to value, a user or None
+    - "add_tags": add the tags in value, a list of names
+    - "remove_tags": remove the tags in value, a list of names
+    - "archive": archive the tasks
+    """
+
+    with transaction.atomic():
+        current = {
+            task_id: (version, CountedState(*state))
+            for task_id, version, *state in Task.objects.visible_to_user(user)
+            .select_for_update()
+            .filter(id__in=versions.keys())
+            .values_list(
+                "id", "version", "project_id", "status", "is_archived", "due_date"
+            )
+        }
+        current_versions = {
+            task_id: version for task_id, (version, _) in current.items()
+        }
+
+        not_found = [task_id for task_id in versions if task_id not in current_versions]
+        conflicts = [
+            task_id
+            for task_id, version in current_versions.items()
+            if version != versions[task_id]
+        ]
+        updated = [
+            task_id
+            for task_id, version in current_versions.items()
+            if version == versions[task_id]
+        ]
+
+        if updated:
+            # update() does not call save(), which syncs status_order
+            fields = {}
+            if action == "status":
+                fields = {"status": value, "status_order": Task.STATUS_ORDER[value]}
+            elif action == "assignee":
+                fields = {"assignee": value}
+            elif action == "archive":
+                fields = {"is_archived": True}
+            elif action == "add_tags":
+                _add_tags(updated, value)
+            elif action == "remove_tags":
+                _remove_tags(updated, value)
+
+            Task.objects.filter(id__in=updated).update(
+                version=F("version") + 1, **fields
+            )
+
+            # update() does not send the signals updating the project stats
+            # and publishing the changes
+            delta = Delta()
+            task_events = []
+            for task_id in updated:
+                version, state = current[task_id]
+                delta.change(state, state.with_changes(fields))
+                task_events.append(
+                    TaskEvent(
+                        "archived" if action == "archive" else "updated",
+                        task_id,
+                        state.project_id,
+                        version + 1,
+                    )
+                )
+            delta.apply()
+            events.publish(task_events)
+
+    return BulkResult(
+        updated=sorted(updated), conflicts=sorted(conflicts), not_found=not_found
+    )
+
+
+def _add_tags(task_ids: List[int], names: List[str]):
+    tags = [Tag.objects.get_or_create(name=name)[0] for name in set(names)]
+    content_type = ContentType.objects.get_for_model(Task)
+    existing = set(
+        TaggedItem.objects.filter(
+            content_type=content_type, object_id__in=task_ids, tag__in=tags
+        ).values_list("object_id", "tag_id")
+    )
+    TaggedItem.objects.bulk_create(
+        TaggedItem(content_type=content_type, object_id=task_id, tag=tag)
+        for task_id in task_ids
+        for tag in tags
+        if (task_id, tag.id) not in existing
+    )
+
+
+def _remove_tags(task_ids: List[int], names: List[str]):
+    TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Task),
+        object_id__in=task_ids,
+        tag__name__in=names,
+    ).delete()
@@ -0,0 +1,66 @@
+"""
+Cached choice lists of the project dropdowns
+
+The choices of a user are stored under one cache key together with the
+"generation" they were computed in. Saving or deleting users, projects or
+memberships starts a new generation (see signals.py), which invalidates all
+cached choices at once. Reading the generation and the choices is a single
+cache round trip.
+"""
+
+from typing import List, NamedTuple, Tuple
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from minitask.timing import count_cache
+
+from .models import Project
+
+GENERATION_KEY = "choices:generation"
+
+CACHE_TIMEOUT = 60 * 60
+"""Upper bound of staleness when invalidation does not reach the cache"""
+
+
+class Choices(NamedTuple):
+    """Dropdown choices available to a user"""
+
+    projects: List[Tuple[int, str]]
+
+
+def choices_for_user(user) -> Choices:
+    """Project choices of the user"""
+
+    # Memberships can expire, start over every day
+    key = f"choices:{user.pk}:{timezone.localdate().isoformat()}"
+    cached = cache.get_many([GENERATION_KEY, key])
+    generation = cached.get(GENERATION_KEY)
+
+    if generation is not None and key in cached:
+        cached_generation, choices = cached[key]
+        if cached_generation == generation:
+            count_cache(hits=1)
+            return choices
+
+    count_cache(misses=1)
+
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+
+    choices = Choices(
+        projects=[
+            (project.id, str(project))
+            for project in Project.objects.visible_to_user(user)
+        ],
+    )
+    cache.set(key, (generation, choices), CACHE_TIMEOUT)
+    return choices
+
+
+def invalidate_choices():
+    """Invalidate the cached choices of all users"""
+
+    cache.set(GENERATION_KEY, uuid4().hex, None)
@@ -0,0 +1,131 @@
+"""
+Server-sent events of task changes
+
+Django can only stream responses from synchronous iterators, which would
+hold a thread for every open task list. The event stream is a plain ASGI
+application instead, routed to in minitask/asgi.py. It authenticates with
+the Django session and sends the events (see events.py) of the projects
+visible to the user.
+"""
+
+import asyncio
+import json
+from importlib import import_module
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+
+from . import events
+from .choices import choices_for_user
+
+EVENTS_PATH = "/tasks/events"
+
+KEEPALIVE_SECONDS = 15
+"""Interval of comments sent to keep idle connections open"""
+
+RETRY_MILLISECONDS = 5000
+"""How long browsers wait before reconnecting"""
+
+
+async def task_events(scope, receive, send):
+    """ASGI application streaming the task events visible to the user"""
+
+    user = await _get_user(scope)
+    if not user.is_authenticated:
+        await send({"type": "http.response.start", "status": 403, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    broker = events.get_broker()
+    subscription = broker.subscribe()
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    # Disable response buffering of nginx
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        await _send_message(send, f"retry: {RETRY_MILLISECONDS}\n\n")
+
+        while not disconnected.done():
+            received = asyncio.ensure_future(subscription.get())
+            await asyncio.wait(
+                [received, disconnected],
+                timeout=KEEPALIVE_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not received.done():
+                received.cancel()
+
+            if disconnected.done():
+                break
+            if subscription.lost_events:
+                subscription.reset()
+                message = "event: reload\ndata: {}\n\n"
+            elif received.done():
+                message = await _events_message(user, received.result())
+            else:
+                message = ": keepalive\n\n"
+
+            if message:
+                await _send_message(send, message)
+    finally:
+        broker.unsubscribe(subscription)
+        disconnected.cancel()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_message(send, message: str):
+    await send(
+        {"type": "http.response.body", "body": message.encode(), "more_body": True}
+    )
+
+
+async def _events_message(user, published) -> str:
+    visible_project_ids = await _get_visible_project_ids(user)
+    return "".join(
+        "event: task\ndata: %s\n\n"
+        % json.dumps(
+            {"type": event.type, "task_id": event.task_id, "version": event.version}
+        )
+        for event in published
+        if event.project_id in visible_project_ids
+    )
+
+
+@sync_to_async
+def _get_user(scope):
+    request = ASGIRequest(scope, BytesIO())
+    session_engine = import_module(settings.SESSION_ENGINE)
+    request.session = session_engine.SessionStore(
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    try:
+        return get_user(request)
+    finally:
+        close_old_connections()
+
+
+@sync_to_async
+def _get_visible_project_ids(user):
+    # The cached dropdown choices are the visible projects, they are
+    # invalidated when memberships change
+    try:
+        return {project_id for project_id, _ in choices_for_user(user).projects}
+    finally:
+        close_old_connections()
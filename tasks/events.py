@@ -0,0 +1,250 @@
+"""
+Live events of task changes
+
+Saving and deleting tasks (see signals.py), bulk changes and imports publish
+events once their transaction is committed. The event stream (see
+event_stream.py) subscribes to the broker and forwards the events of the
+projects visible to the user to the browser.
+
+The broker is chosen with the TASK_EVENTS_BROKER setting:
+
+- LocalBroker delivers the events within the process. Enough when a single
+  server process serves both the pages and the event streams.
+- PostgresBroker delivers the events to all processes with LISTEN/NOTIFY,
+  for running multiple server processes on PostgreSQL.
+
+Other brokers can implement the same methods.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Set
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+from minitask import metrics
+
+logger = logging.getLogger(__name__)
+
+TASK_CHANGES = metrics.Counter(
+    "minitask_task_changes_total",
+    "Tasks created, updated, archived or deleted",
+    ["type"],
+)
+
+SUBSCRIPTION_QUEUE_SIZE = 1000
+"""Events waiting to be sent to one subscriber, more are dropped"""
+
+
+class TaskEvent(NamedTuple):
+    """A task changed"""
+
+    type: str
+    """One of created, updated, archived or deleted"""
+
+    task_id: int
+    project_id: int
+    version: int
+
+
+class Subscription:
+    """Events delivered to one subscriber in an event loop"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(SUBSCRIPTION_QUEUE_SIZE)
+
+        self.lost_events = False
+        """Events were dropped, the subscriber has to start over"""
+
+    def put(self, events: List[TaskEvent]):
+        """Deliver the events, can be called from any thread"""
+
+        self.loop.call_soon_threadsafe(self._put, events)
+
+    def _put(self, events: List[TaskEvent]):
+        for event in events:
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.lost_events = True
+                return
+
+    async def get(self) -> List[TaskEvent]:
+        """Wait for events and return all delivered so far"""
+
+        events = [await self.queue.get()]
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+    def reset(self):
+        """Drop the delivered events and start over"""
+
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.lost_events = False
+
+
+class LocalBroker:
+    """Delivers events to the subscribers in the same process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: Set[Subscription] = set()
+
+    def publish(self, events: List[TaskEvent]):
+        """Deliver the events to all subscribers, can be called from any thread"""
+
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.put(events)
+            except RuntimeError:
+                # The event loop of the subscriber is closed
+                self.unsubscribe(subscription)
+
+    def subscribe(self) -> Subscription:
+        """Start receiving events, must be called in the event loop"""
+
+        subscription = Subscription(asyncio.get_event_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Stop receiving events"""
+
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def _lose_events(self):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.lost_events = True
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Delivers events to the subscribers in all processes
+
+    Events are sent with NOTIFY. Each process listens on a connection of its
+    own once the first subscriber is added and delivers the notifications to
+    its subscribers.
+    """
+
+    CHANNEL = "minitask_task_events"
+
+    NOTIFY_BATCH_SIZE = 50
+    """Events per notification, the payload must be shorter than 8000 bytes"""
+
+    RETRY_SECONDS = 1
+    """Wait before listening again after a failure, doubled on every failure"""
+
+    MAX_RETRY_SECONDS = 60
+
+    def __init__(self, using="default"):
+        super().__init__()
+        self.using = using
+        self._listener = None
+        self._connecting: Optional[asyncio.Future] = None
+        self._retry_seconds = self.RETRY_SECONDS
+
+    def publish(self, events: List[TaskEvent]):
+        with connections[self.using].cursor() as cursor:
+            for start in range(0, len(events), self.NOTIFY_BATCH_SIZE):
+                payload = json.dumps(events[start : start + self.NOTIFY_BATCH_SIZE])
+                cursor.execute("SELECT pg_notify(%s, %s)", [self.CHANNEL, payload])
+
+    def subscribe(self) -> Subscription:
+        subscription = super().subscribe()
+        self._start_listening(subscription.loop)
+        return subscription
+
+    def _start_listening(self, loop: asyncio.AbstractEventLoop):
+        if self._listener is None and self._connecting is None:
+            self._connecting = loop.create_task(self._listen(loop))
+
+    async def _listen(self, loop: asyncio.AbstractEventLoop):
+        try:
+            # Connecting blocks, which must not happen in the event loop
+            self._listener = await loop.run_in_executor(None, self._connect)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Listening to task events failed")
+            self._retry(loop)
+            return
+        finally:
+            self._connecting = None
+        loop.add_reader(self._listener.fileno(), self._receive, loop)
+        if self._retry_seconds != self.RETRY_SECONDS:
+            # Events were missed since the subscribers started over
+            self._lose_events()
+            self._retry_seconds = self.RETRY_SECONDS
+
+    def _retry(self, loop: asyncio.AbstractEventLoop):
+        """Make subscribers start over and listen again after a while"""
+
+        self._lose_events()
+        loop.call_later(self._retry_seconds, self._start_listening, loop)
+        self._retry_seconds = min(self._retry_seconds * 2, self.MAX_RETRY_SECONDS)
+
+    def _connect(self):
+        """A connection listening to the events"""
+
+        # Only needed on PostgreSQL
+        import psycopg2  # pylint: disable=import-outside-toplevel
+
+        # Not a connection of Django, which would take a slot of the pool
+        # and is not meant to be used by the event loop
+        listener = psycopg2.connect(**connections[self.using].get_connection_params())
+        listener.autocommit = True
+        with listener.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.CHANNEL}")
+        return listener
+
+    def _receive(self, loop: asyncio.AbstractEventLoop):
+        try:
+            self._listener.poll()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Listening to task events failed")
+            loop.remove_reader(self._listener.fileno())
+            self._listener.close()
+            self._listener = None
+            self._retry(loop)
+            return
+
+        while self._listener.notifies:
+            notification = self._listener.notifies.pop(0)
+            super().publish(
+                [TaskEvent(*event) for event in json.loads(notification.payload)]
+            )
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """The broker of the process"""
+
+    return import_string(settings.TASK_EVENTS_BROKER)()
+
+
+def publish(events: List[TaskEvent], using="default"):
+    """Publish and count the events once the current transaction is committed"""
+
+    def publish_events():
+        for event in events:
+            TASK_CHANGES.inc(type=event.type)
+        try:
+            get_broker().publish(events)
+        except Exception:  # pylint: disable=broad-except
+            # The changes are saved already, live updates are best effort
+            logger.exception("Publishing task events failed")
+
+    if events:
+        transaction.on_commit(publish_events, using=using)
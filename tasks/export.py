@@ -0,0 +1,132 @@
+"""
+Export of task lists as CSV or JSON
+
+The tasks are read with a database cursor in chunks and written to the
+response while reading, so the memory use does not depend on the number of
+exported tasks. Tags are fetched with one query per chunk because
+prefetch_related does not work with iterator().
+"""
+
+import csv
+import json
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.text import capfirst
+from taggit.models import TaggedItem
+
+from .models import Task
+from .templatetags.tasks_extras import user_str
+
+EXPORT_CHUNK_SIZE = 500
+"""Number of tasks read at once, also the number of ids in the tag queries"""
+
+FIELDS = [
+    "id",
+    "project",
+    "title",
+    "status",
+    "priority",
+    "assignee",
+    "tags",
+    "due_date",
+    "created_at",
+    "description",
+]
+
+
+def iter_tasks(tasks, chunk_size=EXPORT_CHUNK_SIZE) -> Iterator[Tuple[Task, List]]:
+    """Iterate over the tasks and their tag names"""
+
+    tasks = tasks.select_related("project", "assignee").prefetch_related(None)
+    iterator = tasks.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        tags = _tags_by_task([task.id for task in chunk])
+        for task in chunk:
+            yield task, tags.get(task.id, [])
+
+
+def _tags_by_task(task_ids: List[int]) -> Dict[int, List[str]]:
+    tags: Dict[int, List[str]] = {}
+    tagged_items = (
+        TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Task),
+            object_id__in=task_ids,
+        )
+        .order_by("tag__name")
+        .values_list("object_id", "tag__name")
+    )
+    for task_id, tag in tagged_items:
+        tags.setdefault(task_id, []).append(tag)
+    return tags
+
+
+class _Echo:
+    """File-like object returning what is written to it"""
+
+    @staticmethod
+    def write(value):
+        return value
+
+
+def csv_lines(tasks, chunk_size=EXPORT_CHUNK_SIZE) -> Iterable[str]:
+    """The tasks as lines of a CSV file with a header"""
+
+    writer = csv.writer(_Echo())
+    # Translating the labels once rather than with get_FOO_display() per row
+    status_labels = {value: str(label) for value, label in Task.STATUS_CHOICES}
+    priority_labels = {value: str(label) for value, label in Task.PRIORITY_CHOICES}
+
+    # Byte order mark for spreadsheet applications to detect UTF-8
+    yield "\ufeff" + writer.writerow(
+        [capfirst(Task._meta.get_field(field).verbose_name) for field in FIELDS]
+    )
+    for task, tags in iter_tasks(tasks, chunk_size):
+        yield writer.writerow(
+            [
+                task.id,
+                task.project,
+                task.title,
+                status_labels.get(task.status, task.status),
+                priority_labels.get(task.priority, task.priority),
+                user_str(task.assignee) if task.assignee else "",
+                ", ".join(tags),
+                task.due_date.isoformat() if task.due_date else "",
+                timezone.localtime(task.created_at).isoformat(),
+                task.description,
+            ]
+        )
+
+
+def json_lines(tasks, chunk_size=EXPORT_CHUNK_SIZE) -> Iterable[str]:
+    """The tasks as a JSON array, one task per line"""
+
+    separator = "[\n"
+    for task, tags in iter_tasks(tasks, chunk_size):
+        task_json = json.dumps(
+            {
+                "id": task.id,
+                "project": {"id": task.project_id, "title": task.project.title},
+                "title": task.title,
+                "status": task.status,
+                "priority": task.priority,
+                "assignee": {"id": task.assignee_id, "name": user_str(task.assignee)}
+                if task.assignee
+                else None,
+                "tags": tags,
+                "due_date": task.due_date,
+                "created_at": task.created_at,
+                "description": task.description,
+            },
+            cls=DjangoJSONEncoder,
+            ensure_ascii=False,
+        )
+        yield separator + task_json
+        separator = ",\n"
+    yield "[]\n" if separator == "[\n" else "\n]\n"
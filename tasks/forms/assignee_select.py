@@ -0,0 +1,36 @@
+from django import forms
+from django.urls import reverse_lazy
+from django.utils.translation import gettext_lazy as _
+
+from accounts.models import User
+
+from ..templatetags.tasks_extras import user_str
+
+
+class AssigneeSelect(forms.Select):
+    """
+    User dropdown rendering only the selected option
+
+    The rest of the options are loaded on demand by assignee_picker.js from
+    the assignees endpoint, which keeps the size of the page independent of
+    the number of users.
+    """
+
+    def __init__(self, attrs=None, project_field="project"):
+        attrs = {
+            "data-assignee-picker": reverse_lazy("assignees"),
+            "data-project-field": project_field,
+            "data-search-placeholder": _("Search users"),
+            **(attrs or {}),
+        }
+        super(AssigneeSelect, self).__init__(attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        selected_ids = [v for v in value if str(v).isdigit()]
+        selected_users = (
+            User.objects.filter(pk__in=selected_ids) if selected_ids else []
+        )
+        self.choices = [("", "")] + [
+            (user.pk, user_str(user)) for user in selected_users
+        ]
+        return super(AssigneeSelect, self).optgroups(name, value, attrs)
@@ -0,0 +1,93 @@
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+from taggit.forms import TagField
+
+from accounts.models import User
+from tasks.bulk import BULK_LIMIT
+from tasks.models import Task
+
+
+class TaskVersionsField(forms.Field):
+    """
+    List of tasks as "id:version" values
+
+    Cleans to a dictionary of versions by task id.
+    """
+
+    widget = forms.MultipleHiddenInput
+
+    default_error_messages = {
+        "invalid": _("Enter tasks as id:version."),
+        "too_many": _("At most %(limit)d tasks can be changed at once."),
+    }
+
+    def to_python(self, value):
+        versions = {}
+        for item in value or []:
+            try:
+                task_id, version = item.split(":")
+                versions[int(task_id)] = int(version)
+            except ValueError as error:
+                raise ValidationError(
+                    self.error_messages["invalid"], code="invalid"
+                ) from error
+        if len(versions) > BULK_LIMIT:
+            raise ValidationError(
+                self.error_messages["too_many"],
+                code="too_many",
+                params={"limit": BULK_LIMIT},
+            )
+        return versions
+
+
+class BulkTaskForm(forms.Form):
+    """Form to change many tasks at once"""
+
+    ACTION_CHOICES = [
+        ("status", _("Set status")),
+        ("assignee", _("Set assignee")),
+        ("add_tags", _("Add tags")),
+        ("remove_tags", _("Remove tags")),
+        ("archive", _("Archive")),
+    ]
+
+    tasks = TaskVersionsField()
+
+    action = forms.ChoiceField(choices=ACTION_CHOICES)
+
+    status = forms.ChoiceField(choices=Task.STATUS_CHOICES, required=False)
+
+    assignee = forms.ModelChoiceField(queryset=User.objects.all(), required=False)
+
+    tags = TagField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get("action")
+
+        if action == "status" and not cleaned_data.get("status"):
+            self.add_error("status", self.fields["status"].error_messages["required"])
+
+        if (
+            action == "assignee"
+            and settings.REQUIRE_ASSIGNEE
+            and not cleaned_data.get("assignee")
+        ):
+            self.add_error(
+                "assignee", self.fields["assignee"].error_messages["required"]
+            )
+
+        if action in ("add_tags", "remove_tags") and not cleaned_data.get("tags"):
+            self.add_error("tags", self.fields["tags"].error_messages["required"])
+
+        return cleaned_data
+
+    def value(self):
+        """The value of the action"""
+
+        action = self.cleaned_data["action"]
+        if action in ("add_tags", "remove_tags"):
+            return self.cleaned_data["tags"]
+        return self.cleaned_data.get(action)
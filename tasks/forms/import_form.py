@@ -0,0 +1,28 @@
+from django import forms
+from django.core.validators import FileExtensionValidator
+from django.utils.translation import gettext_lazy as _
+
+
+class ImportForm(forms.Form):
+    """Form to upload tasks to import"""
+
+    file = forms.FileField(
+        label=_("File"),
+        help_text=_(
+            "CSV or JSON with the columns project, title, description, status, "
+            "priority, due_date, assignee and tags."
+        ),
+        validators=[FileExtensionValidator(["csv", "json"])],
+        widget=forms.ClearableFileInput(
+            attrs={"accept": ".csv,.json", "class": "form-control-file"}
+        ),
+    )
+
+    skip = forms.IntegerField(
+        label=_("Skip rows"),
+        help_text=_("Number of rows already imported when resuming an import."),
+        min_value=0,
+        initial=0,
+        required=False,
+        widget=forms.NumberInput(attrs={"class": "form-control"}),
+    )
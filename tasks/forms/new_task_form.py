@@ -1,10 +1,10 @@
 from django.conf import settings
 from django.forms import DateInput, ModelForm
 
-from accounts.models import User
-from tasks.models import Project, Task
+from tasks.models import Task
 
-from ..templatetags.tasks_extras import user_str
+from ..choices import choices_for_user
+from .assignee_select import AssigneeSelect
 
 UNRESTRICTED_FIELDS = set(["version", "status"])
 """Fields that can be edited even if the user is restricted from editing all fields"""
@@ -23,14 +23,7 @@ class NewTaskForm(ModelForm):
         for visible in self.visible_fields():
             visible.field.widget.attrs["class"] = "form-control"
 
-        # TODO: There should be a better way of doing this,
-        # maybe look at limit_choices_to:
-        # https://docs.djangoproject.com/en/3.1/ref/models/fields/#django.db.models.ForeignKey.limit_choices_to
-        projects = Project.objects.visible_to_user(user)
-        project_choices = [(project.id, str(project)) for project in projects]
-        assignee_choices = [(user.id, user_str(user)) for user in User.objects.all()]
-        self.fields["project"].choices = [("", "")] + (project_choices or [])
-        self.fields["assignee"].choices = [("", "")] + (assignee_choices or [])
+        self.fields["project"].choices = [("", "")] + choices_for_user(user).projects
 
         # Some fields can be configured to be required
         self.fields["due_date"].required = settings.REQUIRE_DUE_DATE
@@ -60,4 +53,5 @@ class NewTaskForm(ModelForm):
                 format="%Y-%m-%d",
                 attrs={"type": "date"},
             ),
+            "assignee": AssigneeSelect(),
         }
@@ -0,0 +1,47 @@
+from django import forms
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+
+from tasks.models import Task
+from tasks.patch import PATCH_FIELDS
+
+
+class TaskFieldsForm(forms.Form):
+    """
+    Form to change some fields of a task
+
+    Only the fields present in the data are validated and changed.
+    """
+
+    version = forms.IntegerField(min_value=0)
+
+    def __init__(self, data, *args, **kwargs):
+        super().__init__(data, *args, **kwargs)
+        for name in PATCH_FIELDS:
+            if name in data:
+                self.fields[name] = Task._meta.get_field(name).formfield()
+
+        # Some fields can be configured to be required
+        if "due_date" in self.fields:
+            self.fields["due_date"].required = settings.REQUIRE_DUE_DATE
+        if "assignee" in self.fields:
+            self.fields["assignee"].required = settings.REQUIRE_ASSIGNEE
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.changes():
+            raise forms.ValidationError(
+                _("Give at least one of these fields to change: %(fields)s"),
+                code="no_changes",
+                params={"fields": ", ".join(PATCH_FIELDS)},
+            )
+        return cleaned_data
+
+    def changes(self):
+        """The changed fields and their values"""
+
+        return {
+            name: value
+            for name, value in self.cleaned_data.items()
+            if name in PATCH_FIELDS
+        }
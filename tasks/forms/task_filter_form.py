@@ -5,8 +5,11 @@ from django import forms
 from django.utils.translation import gettext_lazy as _
 from taggit.forms import TagField, TagWidget
 
+from accounts.models import User
 from tasks.models import Task
 
+from .assignee_select import AssigneeSelect
+
 
 class TaskFilterForm(forms.Form):
     """Form to filter the task list"""
@@ -22,10 +25,18 @@ class TaskFilterForm(forms.Form):
         ]
     )
 
-    def __init__(self, *args, project_choices=None, assignee_choices=None, **kwargs):
+    def __init__(self, *args, project_choices=None, **kwargs):
         super(TaskFilterForm, self).__init__(*args, **kwargs)
         self.fields["project"].choices = [("", "")] + (project_choices or [])
-        self.fields["assignee"].choices = [("", "")] + (assignee_choices or [])
+
+    q = forms.CharField(
+        label=_("Search"),
+        required=False,
+        empty_value=None,
+        widget=forms.TextInput(
+            attrs={"class": "form-control form-control-sm", "type": "search"}
+        ),
+    )
 
     project = forms.TypedChoiceField(
         label=_("Project"),
@@ -82,11 +93,11 @@ class TaskFilterForm(forms.Form):
         widget=forms.Select(attrs={"class": "custom-select custom-select-sm"}),
     )
 
-    assignee = forms.TypedChoiceField(
+    assignee = forms.ModelChoiceField(
         label=_("Assignee"),
+        queryset=User.objects.all(),
         required=False,
-        empty_value=None,
-        widget=forms.Select(attrs={"class": "custom-select custom-select-sm"}),
+        widget=AssigneeSelect(attrs={"class": "custom-select custom-select-sm"}),
     )
 
     tags = TagField(
@@ -97,6 +108,14 @@ class TaskFilterForm(forms.Form):
         # widget=forms.Select(attrs={"class": "custom-select custom-select-sm"}),
     )
 
+    tags_match = forms.TypedChoiceField(
+        label=_("Tag matching"),
+        choices=[("", ""), ("all", _("All tags")), ("any", _("Any tag"))],
+        required=False,
+        empty_value=None,
+        widget=forms.Select(attrs={"class": "custom-select custom-select-sm"}),
+    )
+
     is_archived = forms.BooleanField(required=False, widget=forms.HiddenInput())
 
     def previous_due_date(self):
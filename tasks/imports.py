@@ -0,0 +1,277 @@
+"""
+Import of tasks from CSV or JSON
+
+The columns (or keys) are the fields of NewTaskForm: project, title,
+description, status, priority, due_date, assignee and tags. Projects are
+given by id or title, assignees by username or id, tags as a comma separated
+string or a list. The JSON produced by the export is accepted too.
+
+Rows are validated with the rules of NewTaskForm and inserted with
+bulk_create in batches. Each batch is committed separately, an import that
+failed at a batch can be continued by skipping the rows already imported.
+"""
+
+import csv
+import json
+from itertools import islice
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from django import forms
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from taggit.models import Tag, TaggedItem
+
+from accounts.models import User
+
+from . import events, search, stats
+from .choices import choices_for_user
+from .events import TaskEvent
+from .forms.new_task_form import NewTaskForm
+from .models import Task
+
+IMPORT_BATCH_SIZE = 500
+"""Default number of tasks inserted at once"""
+
+COLUMNS = tuple(field for field in NewTaskForm.Meta.fields if field != "version")
+"""Columns or keys of the imported rows"""
+
+
+class ImportFailed(Exception):
+    """A batch of the import has invalid rows"""
+
+    def __init__(self, result: "ImportResult", errors: Dict[int, Dict]):
+        super().__init__(f"Invalid rows: {', '.join(str(row) for row in errors)}")
+        self.result = result
+        self.errors = errors
+        """Validation errors of the form by row number"""
+
+
+class ImportResult(NamedTuple):
+    """Outcome of an import"""
+
+    imported: int
+    """Number of tasks created"""
+
+    last_row: int
+    """Number of the rows done including the skipped ones, skip these to resume"""
+
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """Imported tasks per second"""
+
+        return self.imported / self.seconds if self.seconds else 0.0
+
+
+class ImportTaskForm(NewTaskForm):
+    """
+    NewTaskForm validating one imported row
+
+    Projects and assignees are looked up for a whole batch rather than
+    by the model choice fields one by one.
+    """
+
+    project = forms.TypedChoiceField(label=_("project"), coerce=int)
+
+    assignee = forms.TypedChoiceField(
+        label=_("assignee"), coerce=int, required=False, empty_value=None
+    )
+
+    def __init__(self, *args, assignee_choices, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["assignee"].choices = [("", "")] + assignee_choices
+
+    class Meta(NewTaskForm.Meta):
+        fields = ("title", "description", "status", "priority", "due_date", "tags")
+
+
+def read_rows(file, file_format: str) -> Iterator[Dict]:
+    """Read the rows of a text file as dictionaries"""
+
+    if file_format == "csv":
+        return csv.DictReader(file)
+    elif file_format == "json":
+        return iter(_json_rows(json.load(file)))
+    else:
+        raise ValueError(f"Unknown import format: {file_format}")
+
+
+def _json_rows(data) -> List[Dict]:
+    """Check that the JSON is a list of rows _normalize can handle"""
+
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of tasks")
+    for row_number, row in enumerate(data, 1):
+        if not isinstance(row, dict):
+            raise ValueError(f"Row {row_number} is not an object")
+        for key, value in row.items():
+            if isinstance(value, list) and not all(
+                isinstance(item, str) for item in value
+            ):
+                raise ValueError(f"Row {row_number}, {key}: expected strings")
+    return data
+
+
+def import_tasks(
+    rows: Iterable[Dict],
+    user,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    skip: int = 0,
+    progress=None,
+) -> ImportResult:
+    """
+    Create the tasks in the rows as the user
+
+    The first skip rows are not imported. Raises ImportFailed with the rows
+    imported so far if a batch has invalid rows. The progress callback is
+    called with the result so far after each batch.
+    """
+
+    start = perf_counter()
+    imported = 0
+    row_number = skip
+    rows = islice(rows, skip, None)
+    project_ids = _project_ids(user)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+
+        tasks, tags, errors = _validate(batch, user, row_number, project_ids)
+        if errors:
+            raise ImportFailed(
+                ImportResult(imported, row_number, perf_counter() - start), errors
+            )
+
+        with transaction.atomic():
+            _insert(tasks, tags)
+
+        imported += len(tasks)
+        row_number += len(batch)
+        if progress:
+            progress(ImportResult(imported, row_number, perf_counter() - start))
+
+    return ImportResult(imported, row_number, perf_counter() - start)
+
+
+def _validate(batch: List[Dict], user, first_row: int, project_ids: Dict):
+    """Validate a batch of rows, return tasks, their tags and the errors"""
+
+    rows = [_normalize(row) for row in batch]
+    assignees = _assignee_choices(rows)
+    assignee_ids = {
+        **{str(user_id): user_id for user_id, _ in assignees},
+        **{username: user_id for user_id, username in assignees},
+    }
+
+    tasks, tags, errors = [], [], {}
+    for row_number, row in enumerate(rows, first_row + 1):
+        row["project"] = project_ids.get(row["project"], row["project"])
+        row["assignee"] = assignee_ids.get(row["assignee"], row["assignee"])
+
+        form = ImportTaskForm(row, user=user, assignee_choices=assignees)
+        if not form.is_valid():
+            errors[row_number] = form.errors
+            continue
+
+        task = form.save(commit=False)
+        task.project_id = form.cleaned_data["project"]
+        task.assignee_id = form.cleaned_data["assignee"]
+        task.created_by = user
+        # bulk_create does not call save(), which syncs this
+        task.status_order = Task.STATUS_ORDER[task.status]
+        tasks.append(task)
+        tags.append(form.cleaned_data["tags"])
+
+    return tasks, tags, errors
+
+
+def _normalize(row: Dict) -> Dict:
+    """Turn an imported row into form data"""
+
+    def value(key) -> Optional[str]:
+        value = row.get(key)
+        if isinstance(value, dict):
+            # Exported JSON has the id and the name of related objects
+            value = value.get("id")
+        if isinstance(value, list):
+            return ", ".join(f'"{item}"' if "," in item else item for item in value)
+        return "" if value is None else str(value).strip()
+
+    data = {key: value(key) for key in COLUMNS}
+    # Fall back to the defaults of the model like the form would
+    data["status"] = data["status"] or Task._meta.get_field("status").default
+    data["priority"] = data["priority"] or Task._meta.get_field("priority").default
+    return data
+
+
+def _project_ids(user) -> Dict[str, str]:
+    """Ids of the projects the user can add tasks to by id and title"""
+
+    project_ids = {}
+    for project_id, title in choices_for_user(user).projects:
+        project_ids.setdefault(title, str(project_id))
+        project_ids[str(project_id)] = str(project_id)
+    return project_ids
+
+
+def _assignee_choices(rows: List[Dict]):
+    """Users referenced as assignees in the rows as (id, username) pairs"""
+
+    references = {row["assignee"] for row in rows if row["assignee"]}
+    ids = [int(reference) for reference in references if reference.isdigit()]
+    return list(
+        User.objects.filter(Q(username__in=references) | Q(id__in=ids)).values_list(
+            "id", "username"
+        )
+    )
+
+
+def _insert(tasks: List[Task], tags: List[List[str]]):
+    """Insert the tasks with their tags"""
+
+    tasks = bulk_create(Task, tasks)
+
+    names = {name for task_tags in tags for name in task_tags}
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list("name", "id"))
+    # Concurrent imports may create the same new tags
+    for name in names - tag_ids.keys():
+        tag_ids[name] = Tag.objects.get_or_create(name=name)[0].id
+
+    content_type = ContentType.objects.get_for_model(Task)
+    TaggedItem.objects.bulk_create(
+        TaggedItem(content_type=content_type, object_id=task.id, tag_id=tag_ids[name])
+        for task, task_tags in zip(tasks, tags)
+        for name in set(task_tags)
+    )
+
+    # bulk_create does not send the signals updating the search index and
+    # the project stats and publishing the changes
+    search.update_index([task.id for task in tasks])
+    delta = stats.Delta()
+    for task in tasks:
+        delta.add(task.counted_state())
+    delta.apply()
+    events.publish(
+        [TaskEvent("created", task.id, task.project_id, task.version) for task in tasks]
+    )
+
+
+def bulk_create(model, objects, batch_size=None):
+    """
+    Insert the objects and return them with primary keys
+
+    Must be called in a transaction.
+    """
+
+    created = model.objects.bulk_create(objects, batch_size=batch_size)
+    if created and created[0].pk is None:
+        # Not all databases return primary keys from bulk_create, the
+        # objects were inserted last in the transaction
+        created = list(model.objects.order_by("-pk")[: len(created)])[::-1]
+    return created
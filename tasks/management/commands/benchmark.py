@@ -0,0 +1,231 @@
+import json
+import platform
+from statistics import mean, quantiles
+from time import perf_counter
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from tasks import row_cache
+from tasks.models import Note, Project, ProjectMembership, Task
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class ConnectionCounter:
+    """Receiver of connection_created counting the database connections"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, **kwargs):
+        self.count += 1
+
+
+def close_old_connections():
+    """
+    Close the connections like servers do between requests
+
+    The test client leaves the connections open, closing them according to
+    CONN_MAX_AGE includes the cost of connecting in the measurements.
+    """
+
+    for conn in connections.all():
+        # Closing would break the transaction, eg. of tests
+        if not conn.in_atomic_block:
+            conn.close_if_unusable_or_obsolete()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the latency and throughput of the main pages as a logged in "
+        "user, using the Django test client. Only pages that do not change "
+        "data are requested. Database connections are closed between requests "
+        "according to CONN_MAX_AGE. Use seed_dataset to generate data first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help="Username to make the requests as, defaults to the first "
+            "non-superuser with a project membership",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=100, help="Number of requests per page"
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=5,
+            help="Number of requests per page before measuring",
+        )
+        parser.add_argument(
+            "--output", help="Write the results as JSON to this file",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 2:
+            raise CommandError("--requests must be at least 2")
+
+        user = get_user(options["user"])
+        client = Client()
+        client.force_login(user)
+
+        results = []
+        # The test client sends requests to "testserver"
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name, url in page_urls(user):
+                results.append(measure(client, name, url, options))
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+            "pool": connection.settings_dict.get("POOL"),
+            "user": user.username,
+            "dataset": {
+                "users": User.objects.count(),
+                "projects": Project.objects.count(),
+                "tasks": Task.objects.count(),
+                "notes": Note.objects.count(),
+            },
+            "results": results,
+        }
+
+        self.stdout.write(
+            "page\tp50 ms\tp95 ms\tp99 ms\trequests/s\tqueries\tconnects\t"
+            "row hits\terrors"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['name']}\t{result['p50_ms']:.1f}\t{result['p95_ms']:.1f}\t"
+                f"{result['p99_ms']:.1f}\t{result['throughput']:.1f}\t"
+                f"{result['queries']:.1f}\t{result['connections']:.2f}\t"
+                f"{_hit_ratio(result)}\t{result['errors']}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+
+def get_user(username=None) -> User:
+    """The user given, or the first non-superuser with a project membership"""
+
+    if username:
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            raise CommandError(f"User '{username}' does not exist")
+        return user
+
+    user = (
+        User.objects.filter(
+            is_superuser=False, membership__in=ProjectMembership.objects.active(),
+        )
+        .order_by("pk")
+        .first()
+    )
+    if user is None:
+        raise CommandError("There are no project members, use --user")
+    return user
+
+
+def page_urls(user):
+    """The pages to measure"""
+
+    tasks = Task.objects.visible_to_user(user).all_visible()
+    task = tasks.first()
+    project = Project.objects.visible_to_user(user).first()
+    note = Note.objects.visible_to_user(user).first()
+
+    yield "index", reverse("index")
+    if project is not None:
+        yield "index_project", f"{reverse('index')}?project={project.id}"
+    yield "index_open", f"{reverse('index')}?status=!done"
+    yield "new", reverse("new")
+    yield "assignees", reverse("assignees")
+    if task is not None:
+        yield "detail", reverse("detail", args=[task.id])
+        yield "edit", reverse("edit", args=[task.id])
+        yield "copy", reverse("copy", args=[task.id])
+    if note is not None:
+        yield "edit_note", reverse("edit_note", args=[note.id])
+
+
+def measure(client, name, url, options) -> dict:
+    """Request a page, the results of the measurements"""
+
+    for _ in range(options["warmup"]):
+        client.get(url)
+        close_old_connections()
+
+    queries = QueryCounter()
+    connection_counter = ConnectionCounter()
+    row_cache_counters = row_cache.counters.copy()
+    connection_created.connect(connection_counter)
+    try:
+        with connection.execute_wrapper(queries):
+            start = perf_counter()
+            timings, errors = _request(client, url, options["requests"])
+            elapsed = perf_counter() - start
+    finally:
+        connection_created.disconnect(connection_counter)
+
+    row_cache_counters = row_cache.counters - row_cache_counters
+    percentiles = quantiles(timings, n=100, method="inclusive")
+    return {
+        "name": name,
+        "url": url,
+        "requests": len(timings),
+        "errors": errors,
+        "mean_ms": mean(timings) * 1000,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "throughput": len(timings) / elapsed,
+        "queries": queries.count / len(timings),
+        "connections": connection_counter.count / len(timings),
+        "row_cache_hits": row_cache_counters["hits"],
+        "row_cache_misses": row_cache_counters["misses"],
+    }
+
+
+def _request(client, url, count: int):
+    """Seconds taken by each of the requests and the number of errors"""
+
+    timings = []
+    errors = 0
+    for _ in range(count):
+        start = perf_counter()
+        response = client.get(url)
+        close_old_connections()
+        timings.append(perf_counter() - start)
+        if response.status_code >= 400:
+            errors += 1
+    return timings, errors
+
+
+def _hit_ratio(result) -> str:
+    """Percentage of task rows rendered from the cache, if any were rendered"""
+
+    rows = result["row_cache_hits"] + result["row_cache_misses"]
+    return f"{result['row_cache_hits'] / rows:.0%}" if rows else "-"
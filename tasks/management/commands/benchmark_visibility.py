@@ -0,0 +1,100 @@
+from statistics import median
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import User
+from tasks.models import Project, ProjectMembership, Task
+
+
+class Rollback(Exception):
+    """Raised to roll back the benchmark data"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the task list query of a member user as the number of "
+        "memberships grows. All data is created in a transaction that is "
+        "rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--memberships",
+            default="10,100,1000,10000",
+            help="Comma-separated list of membership counts to measure",
+        )
+        parser.add_argument(
+            "--tasks", type=int, default=1000, help="Number of tasks to create"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Number of runs per measurement"
+        )
+        parser.add_argument(
+            "--explain", action="store_true", help="Print the query plans"
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options["memberships"].split(","))
+
+        try:
+            with transaction.atomic():
+                self._benchmark(sizes, options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _benchmark(self, sizes, options):
+        user = User.objects.create_user("benchmark-visibility")
+        project = Project.objects.create(title="Benchmark project")
+        ProjectMembership.objects.create(user=user, project=project)
+        Task.objects.bulk_create(
+            Task(project=project, created_by=user, title=f"Task {i}")
+            for i in range(options["tasks"])
+        )
+
+        self.stdout.write("memberships\tmedian ms\tplan lines")
+        memberships = 1
+        for size in sizes:
+            # Add other users' memberships of the same project and the
+            # user's memberships of other projects
+            new_memberships = size - memberships
+            users = User.objects.bulk_create(
+                User(username=f"benchmark-visibility-{memberships + i}")
+                for i in range(new_memberships // 2)
+            )
+            projects = Project.objects.bulk_create(
+                Project(title=f"Benchmark project {memberships + i}")
+                for i in range(new_memberships - len(users))
+            )
+            if not users or users[0].pk is None:
+                # Not all databases return primary keys from bulk_create
+                users = User.objects.filter(
+                    username__startswith="benchmark-visibility-"
+                ).order_by("-pk")[: len(users)]
+                projects = Project.objects.filter(
+                    title__startswith="Benchmark project "
+                ).order_by("-pk")[: len(projects)]
+            ProjectMembership.objects.bulk_create(
+                [ProjectMembership(user=other, project=project) for other in users]
+                + [ProjectMembership(user=user, project=other) for other in projects]
+            )
+            memberships = size
+
+            tasks = Task.objects.visible_to_user(user).all_visible()[
+                : settings.TASKS_PER_PAGE
+            ]
+            timings = []
+            for _ in range(options["repeat"]):
+                start = perf_counter()
+                list(tasks.all())
+                timings.append(perf_counter() - start)
+
+            plan = tasks.explain()
+            self.stdout.write(
+                f"{size}\t{median(timings) * 1000:.2f}\t{len(plan.splitlines())}"
+            )
+            if options["explain"]:
+                self.stdout.write(plan)
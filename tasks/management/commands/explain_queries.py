@@ -0,0 +1,130 @@
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from accounts.models import User
+from tasks.models import Note, Project, Task
+from tasks.pagination import TaskCursor
+
+SEQUENTIAL_SCAN = {
+    # "SCAN table" without an index, "SEARCH" and "SCAN ... USING INDEX" are fine
+    "sqlite": re.compile(r"\bSCAN (TABLE )?\w+$", re.MULTILINE),
+    "postgresql": re.compile(r"\bSeq Scan on \w+"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query plans of the canonical task list queries to verify "
+        "that they use indexes instead of sequential scans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help="Username to run the queries as, defaults to the first non-superuser",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Execute the queries and show actual timings (PostgreSQL only)",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Exit with an error if any of the queries uses a sequential scan",
+        )
+
+    def handle(self, *args, **options):
+        user = get_user(options["user"])
+        explain_options = (
+            {"analyze": True}
+            if options["analyze"] and connection.vendor == "postgresql"
+            else {}
+        )
+        sequential_scan = SEQUENTIAL_SCAN.get(connection.vendor)
+
+        scans = []
+        for name, query in task_list_queries(user):
+            plan = query.explain(**explain_options)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan + "\n")
+            if sequential_scan and sequential_scan.search(plan):
+                scans.append(name)
+
+        if scans:
+            message = "Sequential scans in: " + ", ".join(scans)
+            if options["check"]:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+
+
+def get_user(username=None) -> User:
+    """The user given, or the first non-superuser"""
+
+    if username:
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist as error:
+            raise CommandError(f"User '{username}' does not exist") from error
+    else:
+        user = User.objects.filter(is_superuser=False).first()
+        if user is None:
+            raise CommandError("There are no users, use --user")
+        return user
+
+
+def task_list_queries(user):
+    """The queries of the most frequently used pages"""
+
+    per_page = settings.TASKS_PER_PAGE
+    tasks = Task.objects.visible_to_user(user)
+    project = Project.objects.visible_to_user(user).first()
+    first_task = tasks.all_visible().first()
+
+    yield "Task list", tasks.all_visible()[:per_page]
+
+    if first_task is not None:
+        cursor = TaskCursor.from_task(first_task)
+        yield (
+            "Task list, next page",
+            tasks.all_visible().filter(cursor.following())[:per_page],
+        )
+
+    if project is not None:
+        yield (
+            "Task list filtered by project",
+            tasks.filtered_by(project=project).all_visible()[:per_page],
+        )
+
+    yield (
+        "Task list filtered by status",
+        tasks.filtered_by(status="!done").all_visible()[:per_page],
+    )
+    yield (
+        "Task list filtered by tags",
+        tasks.filtered_by(tags=["foo", "bar"]).all_visible()[:per_page],
+    )
+    yield (
+        "Task list filtered by creation date",
+        tasks.filtered_by(
+            created_after=timezone.localdate() - timedelta(days=7),
+            created_before=timezone.localdate(),
+        ).all_visible()[:per_page],
+    )
+    yield (
+        "Task list search",
+        tasks.all_visible().search("foo bar")[:per_page],
+    )
+    yield "Archived tasks", tasks.all_visible(is_archived=True)[:per_page]
+    yield "Project choices", Project.objects.visible_to_user(user)
+
+    if first_task is not None:
+        yield (
+            "Task notes",
+            Note.objects.visible_to_user(user).filter(task=first_task),
+        )
@@ -0,0 +1,78 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import User
+from tasks.imports import IMPORT_BATCH_SIZE, ImportFailed, import_tasks, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Import tasks from a CSV or JSON file. The columns are project (id or "
+        "title), title, description, status, priority, due_date, assignee "
+        "(username or id) and tags."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="CSV or JSON file to import")
+        parser.add_argument(
+            "--user", required=True, help="Username to create the tasks as"
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "json"],
+            help="Format of the file, defaults to the file extension",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help="Number of tasks inserted at once",
+        )
+        parser.add_argument(
+            "--skip",
+            type=int,
+            default=0,
+            help="Number of rows to skip, use it to resume a failed import",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist as error:
+            raise CommandError(f"User '{options['user']}' does not exist") from error
+
+        file_format = (
+            options["format"] or os.path.splitext(options["file"])[1][1:].lower()
+        )
+        if file_format not in ("csv", "json"):
+            raise CommandError("Unknown file format, use --format")
+
+        with open(options["file"], encoding="utf-8-sig", newline="") as file:
+            try:
+                result = import_tasks(
+                    read_rows(file, file_format),
+                    user,
+                    batch_size=options["batch_size"],
+                    skip=options["skip"],
+                    progress=self._progress if options["verbosity"] > 1 else None,
+                )
+            except ImportFailed as error:
+                for row, errors in error.errors.items():
+                    for field, messages in errors.items():
+                        self.stderr.write(f"Row {row}, {field}: {' '.join(messages)}")
+                raise CommandError(
+                    f"Imported {error.result.imported} tasks before the failed "
+                    f"batch, fix the file and resume with --skip "
+                    f"{error.result.last_row}"
+                ) from error
+
+        self.stdout.write(
+            f"Imported {result.imported} tasks in {result.seconds:.1f}s "
+            f"({result.throughput:.0f} tasks/s)"
+        )
+
+    def _progress(self, result):
+        self.stdout.write(
+            f"{result.last_row} rows done, {result.throughput:.0f} tasks/s"
+        )
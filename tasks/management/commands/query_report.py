@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from tasks.models import QueryFinding
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the slow and repeated queries found in the sampled requests "
+        "of the last days, the most time consuming first. Requests are only "
+        "inspected when QUERY_INSPECTION_SAMPLE_RATE is set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=7, help="Number of days to report on"
+        )
+        parser.add_argument(
+            "--limit", type=int, default=20, help="Number of findings to report"
+        )
+        parser.add_argument(
+            "--kind",
+            choices=[kind for kind, _ in QueryFinding.KIND_CHOICES],
+            help="Only report slow or duplicate queries",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Delete the findings older than the reported days",
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.localdate() - timedelta(days=options["days"] - 1)
+
+        if options["prune"]:
+            deleted, _ = QueryFinding.objects.filter(day__lt=since).delete()
+            self.stdout.write(f"{deleted} old findings deleted")
+
+        findings = QueryFinding.objects.filter(day__gte=since)
+        if options["kind"]:
+            findings = findings.filter(kind=options["kind"])
+        findings = (
+            findings.values("kind", "view", "location", "sql_hash")
+            .annotate(
+                requests=Sum("requests"),
+                queries=Sum("queries"),
+                duration=Sum("duration"),
+                sql=Max("sql"),
+                last_day=Max("day"),
+            )
+            .order_by("-duration", "kind", "view", "location")[: options["limit"]]
+        )
+
+        for finding in findings:
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    f"{finding['kind']} {finding['view']} {finding['location']}"
+                )
+            )
+            self.stdout.write(
+                f"{finding['requests']} requests, {finding['queries']} queries, "
+                f"{finding['duration'] * 1000:.1f} ms, "
+                f"{finding['queries'] / finding['requests']:.1f} queries and "
+                f"{finding['duration'] * 1000 / finding['requests']:.1f} ms "
+                f"per request, last on {finding['last_day']}"
+            )
+            self.stdout.write(finding["sql"] + "\n")
+
+        if not findings:
+            self.stdout.write(f"No findings since {since}")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tasks import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the full-text search index of all tasks. Only needed after "
+        "changing tasks or notes without saving them through the models, "
+        "eg. with bulk inserts or raw SQL."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.update_index()
+        self.stdout.write("Search index rebuilt")
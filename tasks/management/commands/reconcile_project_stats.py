@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from tasks import stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the tasks of all projects and fix the project stats that "
+        "drifted from the actual counts. Only needed after changing tasks "
+        "without saving them through the models, eg. with raw SQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the drifted counts, do not fix them",
+        )
+
+    def handle(self, *args, **options):
+        drifts = stats.reconcile(fix=not options["dry_run"])
+
+        for drift in drifts:
+            self.stdout.write(
+                f"Project {drift.project_id} {drift.counter}: "
+                f"stored {drift.stored}, actual {drift.actual}"
+            )
+
+        if not drifts:
+            self.stdout.write("No drift")
+        elif options["dry_run"]:
+            self.stdout.write(f"{len(drifts)} drifted counts")
+        else:
+            self.stdout.write(f"{len(drifts)} drifted counts fixed")
@@ -0,0 +1,240 @@
+import random
+from datetime import timedelta
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django_seed import Seed
+from taggit.models import Tag, TaggedItem
+
+from accounts.models import User
+from tasks import search, stats
+from tasks.imports import bulk_create
+from tasks.models import Note, Project, ProjectMembership, Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a dataset for benchmarking: users, projects, memberships "
+        "(some of them expired), tasks with tags and notes. All users get the "
+        "same password."
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Seeded in handle()
+        self.random = random.Random()
+        self.faker = Seed.faker()
+        self.batch_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=100, help="Number of users to create"
+        )
+        parser.add_argument(
+            "--projects", type=int, default=20, help="Number of projects to create"
+        )
+        parser.add_argument(
+            "--memberships",
+            type=int,
+            default=5,
+            help="Number of project memberships per user",
+        )
+        parser.add_argument(
+            "--expired",
+            type=float,
+            default=0.1,
+            help="Fraction of the memberships that are expired",
+        )
+        parser.add_argument(
+            "--tasks", type=int, default=10000, help="Number of tasks to create"
+        )
+        parser.add_argument(
+            "--notes", type=int, default=3, help="Average number of notes per task"
+        )
+        parser.add_argument(
+            "--tags", type=int, default=50, help="Number of distinct tags"
+        )
+        parser.add_argument(
+            "--tags-per-task", type=int, default=2, help="Maximum tags per task"
+        )
+        parser.add_argument(
+            "--prefix",
+            default="seed",
+            help="Prefix of the generated usernames, project titles and tags",
+        )
+        parser.add_argument(
+            "--password", default="seed", help="Password of the generated users"
+        )
+        parser.add_argument(
+            "--random-seed",
+            type=int,
+            default=0,
+            help="Seed of the random generator, the same seed gives the same dataset",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows per INSERT statement"
+        )
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if User.objects.filter(username__startswith=f"{prefix}-").exists():
+            raise CommandError(
+                f"There are already users with the '{prefix}' prefix, use --prefix"
+            )
+        if options["memberships"] > options["projects"]:
+            raise CommandError("--memberships can not be more than --projects")
+
+        self.random.seed(options["random_seed"])
+        self.faker.seed_instance(options["random_seed"])
+        self.batch_size = options["batch_size"]
+
+        start = perf_counter()
+        with transaction.atomic():
+            counts = self._seed(options)
+        elapsed = perf_counter() - start
+
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(f"Done in {elapsed:.1f}s")
+
+    def _seed(self, options):
+        prefix = options["prefix"]
+
+        password = make_password(options["password"])
+        users = bulk_create(
+            User,
+            (
+                User(
+                    username=f"{prefix}-{i}",
+                    first_name=self.faker.first_name(),
+                    last_name=self.faker.last_name(),
+                    password=password,
+                )
+                for i in range(options["users"])
+            ),
+            self.batch_size,
+        )
+
+        projects = bulk_create(
+            Project,
+            (
+                Project(title=f"{prefix} {self.faker.catch_phrase()}")
+                for _ in range(options["projects"])
+            ),
+            self.batch_size,
+        )
+
+        memberships, members = self._seed_memberships(users, projects, options)
+
+        # Tasks are created in a project by one of its active members
+        projects_with_members = [project for project in projects if members[project.pk]]
+        if not projects_with_members:
+            raise CommandError("No project has active members, add more --users")
+
+        tasks = self._seed_tasks(projects_with_members, members, options)
+        tags, tagged_items = self._seed_tags(tasks, options)
+
+        notes = [
+            Note(
+                task=task,
+                author=self.random.choice(members[task.project_id]),
+                body=self.faker.paragraph(),
+            )
+            for task in tasks
+            for _ in range(self.random.randint(0, options["notes"] * 2))
+        ]
+        Note.objects.bulk_create(notes, batch_size=self.batch_size)
+
+        # bulk_create does not send the signals updating the search index and
+        # the project stats
+        search.update_index()
+        stats.reconcile()
+
+        return {
+            "users": len(users),
+            "projects": len(projects),
+            "memberships": len(memberships),
+            "tasks": len(tasks),
+            "tags": len(tags),
+            "tagged items": len(tagged_items),
+            "notes": len(notes),
+        }
+
+    def _seed_memberships(self, users, projects, options):
+        """Memberships and the active members by project id"""
+
+        today = timezone.localdate()
+        memberships = []
+        members = {project.pk: [] for project in projects}
+        for user in users:
+            for project in self.random.sample(projects, options["memberships"]):
+                expired = self.random.random() < options["expired"]
+                memberships.append(
+                    ProjectMembership(
+                        user=user,
+                        project=project,
+                        expires_at=today - timedelta(days=self.random.randint(1, 90))
+                        if expired
+                        else None,
+                    )
+                )
+                if not expired:
+                    members[project.pk].append(user)
+        bulk_create(ProjectMembership, memberships, self.batch_size)
+        return memberships, members
+
+    def _seed_tasks(self, projects, members, options):
+        """Tasks of the projects, created by their members"""
+
+        today = timezone.localdate()
+        statuses = [status for status, _ in Task.STATUS_CHOICES]
+        priorities = [priority for priority, _ in Task.PRIORITY_CHOICES]
+        tasks = []
+        for _ in range(options["tasks"]):
+            project = self.random.choice(projects)
+            status = self.random.choice(statuses)
+            tasks.append(
+                Task(
+                    project=project,
+                    created_by=self.random.choice(members[project.pk]),
+                    assignee=self.random.choice(members[project.pk] + [None]),
+                    title=self.faker.sentence(nb_words=6).rstrip("."),
+                    description=self.faker.paragraph(),
+                    status=status,
+                    # bulk_create does not call save(), which syncs this
+                    status_order=Task.STATUS_ORDER[status],
+                    priority=self.random.choice(priorities),
+                    due_date=today + timedelta(days=self.random.randint(-30, 90))
+                    if self.random.random() < 0.7
+                    else None,
+                    is_archived=self.random.random() < 0.05,
+                )
+            )
+        return bulk_create(Task, tasks, self.batch_size)
+
+    def _seed_tags(self, tasks, options):
+        """Tags and the tagged items of the tasks"""
+
+        prefix = options["prefix"]
+        tags = bulk_create(
+            Tag,
+            (
+                Tag(name=f"{prefix}-{word}-{i}", slug=f"{prefix}-{word}-{i}")
+                for i, word in enumerate(self.faker.words(options["tags"]))
+            ),
+            self.batch_size,
+        )
+        content_type = ContentType.objects.get_for_model(Task)
+        tagged_items = [
+            TaggedItem(tag=tag, content_type=content_type, object_id=task.pk)
+            for task in tasks
+            for tag in self.random.sample(
+                tags, self.random.randint(0, min(options["tags_per_task"], len(tags)))
+            )
+        ]
+        TaggedItem.objects.bulk_create(tagged_items, batch_size=self.batch_size)
+        return tags, tagged_items
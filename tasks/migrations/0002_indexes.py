@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-17 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="projectmembership",
+            index=models.Index(
+                fields=["user", "project", "expires_at"],
+                name="membership_visibility_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["project", "is_archived", "status", "due_date", "-priority"],
+                name="task_project_listing_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(is_archived=False),
+                fields=["status", "due_date", "-priority", "id"],
+                name="task_unarchived_listing_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.1.14 on 2026-10-17 19:59
+
+from django.db import migrations, models
+
+STATUS_ORDER = {
+    "done": 1,
+    "open": 2,
+    "in_progress": 3,
+}
+
+
+def populate_status_order(apps, schema_editor):
+    Task = apps.get_model("tasks", "Task")
+    for status, status_order in STATUS_ORDER.items():
+        Task.objects.filter(status=status).update(status_order=status_order)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0002_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(model_name="task", name="task_project_listing_idx",),
+        migrations.RemoveIndex(model_name="task", name="task_unarchived_listing_idx",),
+        migrations.AddField(
+            model_name="task",
+            name="status_order",
+            field=models.SmallIntegerField(default=2, editable=False),
+        ),
+        migrations.RunPython(populate_status_order, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(is_archived=False),
+                fields=["project", "-status_order", "due_date", "-priority", "id"],
+                name="task_project_listing_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(is_archived=False),
+                fields=["-status_order", "due_date", "-priority", "id"],
+                name="task_unarchived_listing_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(is_archived=True),
+                fields=["-status_order", "due_date", "-priority", "id"],
+                name="task_archived_listing_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-17 20:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0003_task_status_order"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(fields=["created_at"], name="task_created_at_idx"),
+        ),
+    ]
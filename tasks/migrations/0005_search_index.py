@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# Frozen copies of the statements in tasks/search.py at the time of writing
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE tasks_search USING fts5(
+        title, body, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO tasks_search(rowid, title, body)
+    SELECT
+        task.id,
+        task.title,
+        task.description || ' ' || COALESCE(
+            (SELECT group_concat(note.body, ' ')
+             FROM tasks_note note WHERE note.task_id = task.id),
+            ''
+        )
+    FROM tasks_task task
+    """,
+]
+
+POSTGRESQL_CREATE = [
+    """
+    CREATE TABLE tasks_search (
+        task_id integer PRIMARY KEY
+            REFERENCES tasks_task (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX tasks_search_document_idx ON tasks_search USING GIN (document)",
+    """
+    INSERT INTO tasks_search(task_id, document)
+    SELECT
+        task.id,
+        setweight(to_tsvector('simple', task.title), 'A')
+        || setweight(to_tsvector('simple',
+            task.description || ' ' || COALESCE(
+                (SELECT string_agg(note.body, ' ')
+                 FROM tasks_note note WHERE note.task_id = task.id),
+                ''
+            )
+        ), 'B')
+    FROM tasks_task task
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {"sqlite": SQLITE_CREATE, "postgresql": POSTGRESQL_CREATE}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE tasks_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0004_task_created_at_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
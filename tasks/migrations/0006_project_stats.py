@@ -0,0 +1,107 @@
+# Generated by Django 3.1.14 on 2026-10-17 20:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q
+
+
+def count_tasks(apps, schema_editor):
+    """Count the existing tasks, a frozen copy of stats.reconcile()"""
+
+    Project = apps.get_model("tasks", "Project")
+    ProjectStats = apps.get_model("tasks", "ProjectStats")
+    ProjectDueCount = apps.get_model("tasks", "ProjectDueCount")
+    Task = apps.get_model("tasks", "Task")
+    db_alias = schema_editor.connection.alias
+
+    counts = {
+        row.pop("project"): row
+        for row in Task.objects.using(db_alias)
+        .values("project")
+        .annotate(
+            open_count=Count("id", filter=Q(is_archived=False, status="open")),
+            in_progress_count=Count(
+                "id", filter=Q(is_archived=False, status="in_progress")
+            ),
+            done_count=Count("id", filter=Q(is_archived=False, status="done")),
+            archived_count=Count("id", filter=Q(is_archived=True)),
+        )
+    }
+    ProjectStats.objects.using(db_alias).bulk_create(
+        ProjectStats(project_id=project_id, **counts.get(project_id, {}))
+        for project_id in Project.objects.using(db_alias).values_list("id", flat=True)
+    )
+
+    ProjectDueCount.objects.using(db_alias).bulk_create(
+        ProjectDueCount(project_id=project_id, due_date=due_date, count=count)
+        for project_id, due_date, count in Task.objects.using(db_alias)
+        .filter(is_archived=False, due_date__isnull=False)
+        .exclude(status="done")
+        .values("project", "due_date")
+        .annotate(count=Count("id"))
+        .values_list("project", "due_date", "count")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0005_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProjectStats",
+            fields=[
+                (
+                    "project",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="tasks.project",
+                    ),
+                ),
+                ("open_count", models.IntegerField(default=0)),
+                ("in_progress_count", models.IntegerField(default=0)),
+                ("done_count", models.IntegerField(default=0)),
+                ("archived_count", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "project stats",
+                "verbose_name_plural": "project stats",
+            },
+        ),
+        migrations.CreateModel(
+            name="ProjectDueCount",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("due_date", models.DateField()),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="due_counts",
+                        to="tasks.project",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="projectduecount",
+            constraint=models.UniqueConstraint(
+                fields=("project", "due_date"), name="project_due_count_unique"
+            ),
+        ),
+        migrations.RunPython(count_tasks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def set_updated_at(apps, schema_editor):
+    """Existing tasks and notes were last known to change when created"""
+
+    db_alias = schema_editor.connection.alias
+    for model_name in ("Task", "Note"):
+        model = apps.get_model("tasks", model_name)
+        model.objects.using(db_alias).update(updated_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0006_project_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="note",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="updated at",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="updated at",
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_updated_at, migrations.RunPython.noop),
+    ]
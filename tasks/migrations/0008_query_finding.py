@@ -0,0 +1,49 @@
+# Generated by Django 3.1.14 on 2026-10-17 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0007_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueryFinding",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("slow", "slow"), ("duplicate", "duplicate")],
+                        max_length=10,
+                    ),
+                ),
+                ("view", models.CharField(max_length=200)),
+                ("location", models.CharField(max_length=300)),
+                ("sql_hash", models.CharField(max_length=32)),
+                ("sql", models.TextField()),
+                ("requests", models.IntegerField(default=0)),
+                ("queries", models.IntegerField(default=0)),
+                ("duration", models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="queryfinding",
+            constraint=models.UniqueConstraint(
+                fields=("day", "kind", "view", "location", "sql_hash"),
+                name="query_finding_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,14 @@
+# Generated by Django 3.1.14 on 2026-10-17 21:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0008_query_finding"),
+    ]
+
+    operations = [
+        migrations.RemoveField(model_name="task", name="updated_at",),
+    ]
@@ -1,14 +1,40 @@
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
+from typing import NamedTuple, Optional
 
-from django.db import models
-from django.db.models import Q
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
 from django.utils.translation import gettext
 from django.utils.translation import gettext_lazy as _
 from ool import VersionedMixin, VersionField
 from taggit.managers import TaggableManager
+from taggit.models import TaggedItem
 
 from accounts.models import User
 
+from . import search
+
+
+def visible_to_user(user, project_ref="pk"):
+    """
+    Filter for objects belonging to projects visible to the user
+
+    project_ref is the path to the project from the filtered model. The
+    membership is checked with an EXISTS subquery rather than a join so that
+    multiple memberships never duplicate rows. Returns None when there is
+    nothing to filter.
+    """
+
+    if user.is_superuser:
+        return None
+    else:
+        return Exists(
+            ProjectMembership.objects.active().filter(
+                user=user, project=OuterRef(project_ref)
+            )
+        )
+
 
 class ProjectQuerySet(models.QuerySet):
     """Queries for the Project model"""
@@ -20,17 +46,8 @@ class ProjectQuerySet(models.QuerySet):
         # is no way to show them. Later we might add a "Project archives" section
         query = self.exclude(is_archived=True)
 
-        # FIXME: de-duplicate this filter
-        if user.is_superuser:
-            return query
-        else:
-            return query.filter(
-                Q(membership__user=user)
-                & (
-                    Q(membership__expires_at__isnull=True)
-                    | Q(membership__expires_at__gte=datetime.now())
-                )
-            )
+        visible = visible_to_user(user)
+        return query if visible is None else query.filter(visible)
 
 
 ProjectManager = models.Manager.from_queryset(ProjectQuerySet)
@@ -55,9 +72,25 @@ class Project(models.Model):
         return self.title
 
 
+class ProjectMembershipQuerySet(models.QuerySet):
+    """Queries for the ProjectMembership model"""
+
+    def active(self):
+        """Filter for memberships that have not expired yet"""
+
+        return self.filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gte=timezone.localdate())
+        )
+
+
+ProjectMembershipManager = models.Manager.from_queryset(ProjectMembershipQuerySet)
+
+
 class ProjectMembership(models.Model):
     """Represents users participating on a project"""
 
+    objects = ProjectMembershipManager()
+
     user = models.ForeignKey(User, related_name="membership", on_delete=models.CASCADE)
     project = models.ForeignKey(
         Project, related_name="membership", on_delete=models.CASCADE
@@ -67,6 +100,13 @@ class ProjectMembership(models.Model):
     class Meta:
         verbose_name = _("project membership")
         verbose_name_plural = _("project memberships")
+        indexes = [
+            # Membership check of the visibility filters
+            models.Index(
+                fields=["user", "project", "expires_at"],
+                name="membership_visibility_idx",
+            ),
+        ]
 
     def __str__(self):
         if self.expires_at:
@@ -84,55 +124,70 @@ class ProjectMembership(models.Model):
 class TaskQuerySet(models.QuerySet):
     """Queries for the Task model"""
 
-    # TODO: use Django's Case/When:
-    #  https://docs.djangoproject.com/en/3.1/ref/models/conditional-expressions/#case
-    CASE_SQL = """
-        (case
-            when status='done' then 1
-            when status='open' then 2
-            when status='in_progress' then 3
-        end)
-    """
-
     def all_visible(self, is_archived=False):
         """
         Default filtering and sorting of tasks
 
-        Filters out archived tasks and tasks of archived projects
+        Filters out archived tasks and tasks of archived projects. The id is
+        the last sort key to make the order stable for pagination.
         """
 
         query = (
-            self.select_related("project")
+            self.select_related("project", "assignee")
             .prefetch_related("tags")
-            .extra(select={"status_order": self.CASE_SQL})
             .order_by(
-                "-status_order", models.F("due_date").asc(nulls_last=True), "-priority"
+                "-status_order",
+                models.F("due_date").asc(nulls_last=True),
+                "-priority",
+                "id",
             )
             # Fow now, tasks of archived projects are always hidden and there
             # is no way to show them. Later we might add a "Project archives" section
             .exclude(project__is_archived=True)
         )
 
-        if is_archived:
-            query = query.filter(is_archived=True)
-        else:
-            query = query.exclude(is_archived=True)
+        # Filtering rather than excluding lets the database use the
+        # partial indexes on unarchived tasks
+        query = query.filter(is_archived=bool(is_archived))
 
         return query
 
+    def search(self, text: str):
+        """
+        Filter by a full-text search and order by relevance
+
+        Must be applied after all_visible to override its order.
+        """
+
+        return search.search(self, text)
+
+    def with_details(self):
+        """Fetch everything shown on the task detail page along with the tasks"""
+
+        return self.select_related(
+            "project", "assignee", "created_by"
+        ).prefetch_related("tags")
+
     def filtered_by(
         self,
         project=None,
         due_date_before=None,
         due_date_after=None,
+        created_before: date = None,
+        created_after: date = None,
         status: str = None,
         assignee=None,
         tags=None,
+        tags_match: str = "all",
     ):
-        """Filter by user provided field values"""
+        """
+        Filter by user provided field values
+
+        Tasks are matched if they have all the tags or, if tags_match is "any",
+        at least one of them. The creation date range is inclusive and is
+        interpreted in the current time zone.
+        """
 
-        # TODO: Optimize these filters into one:
-        # https://djangotricks.blogspot.com/2018/05/queryset-filters-on-many-to-many-relations.html
         query = self
 
         if project is not None:
@@ -144,6 +199,16 @@ class TaskQuerySet(models.QuerySet):
         if due_date_before is not None:
             query = query.filter(due_date__lte=due_date_before)
 
+        # Compare with the boundaries of the days rather than the date of
+        # created_at so that the created_at index can be used
+        if created_after is not None:
+            query = query.filter(created_at__gte=_start_of_day(created_after))
+
+        if created_before is not None:
+            query = query.filter(
+                created_at__lt=_start_of_day(created_before + timedelta(days=1))
+            )
+
         if status is not None:
             if status.startswith("!"):
                 query = query.exclude(status=status[1:])
@@ -154,25 +219,35 @@ class TaskQuerySet(models.QuerySet):
             query = query.filter(assignee=assignee)
 
         if tags is not None and len(tags) > 0:
-            for tag in tags:
-                query = query.filter(tags__name=tag)
+            tagged = TaggedItem.objects.filter(
+                content_type=ContentType.objects.get_for_model(self.model),
+                tag__name__in=tags,
+            ).values("object_id")
+
+            if tags_match != "any":
+                # A task can have a tag only once, therefore having as many
+                # matching tags as requested means having all of them
+                tagged = (
+                    tagged.annotate(tag_count=Count("tag"))
+                    .filter(tag_count=len(set(tags)))
+                    .values("object_id")
+                )
+
+            query = query.filter(id__in=tagged)
 
         return query
 
     def visible_to_user(self, user):
         """Filter for tasks visible to the user"""
 
-        # FIXME: de-duplicate this filter
-        if user.is_superuser:
-            return self
-        else:
-            return self.filter(
-                Q(project__membership__user=user)
-                & (
-                    Q(project__membership__expires_at__isnull=True)
-                    | Q(project__membership__expires_at__gte=datetime.now())
-                )
-            )
+        visible = visible_to_user(user, "project")
+        return self if visible is None else self.filter(visible)
+
+
+def _start_of_day(day: date) -> datetime:
+    """The beginning of the day in the current time zone"""
+
+    return timezone.make_aware(datetime.combine(day, time.min))
 
 
 TaskManager = models.Manager.from_queryset(TaskQuerySet)
@@ -187,6 +262,16 @@ class Task(VersionedMixin, models.Model):
         ("done", _("done")),
     ]
 
+    STATUS_ORDER = {
+        "done": 1,
+        "open": 2,
+        "in_progress": 3,
+    }
+    """Rank of the statuses, tasks are sorted by this descending"""
+
+    COUNTED_FIELDS = {"project_id", "status", "is_archived", "due_date"}
+    """Fields determining how a task is counted in the project stats"""
+
     PRIORITY_CHOICES = [
         (-2, _("lowest")),
         (-1, _("low")),
@@ -216,6 +301,10 @@ class Task(VersionedMixin, models.Model):
         _("status"), max_length=20, default="open", choices=STATUS_CHOICES
     )
 
+    # Stored rather than computed when querying so that the task list can be
+    # sorted using an index. Kept in sync with status when saving.
+    status_order = models.SmallIntegerField(default=2, editable=False)
+
     priority = models.SmallIntegerField(
         _("priority"), default=0, choices=PRIORITY_CHOICES
     )
@@ -252,10 +341,143 @@ class Task(VersionedMixin, models.Model):
     class Meta:
         verbose_name = _("task")
         verbose_name_plural = _("tasks")
+        indexes = [
+            # Task lists in the order of all_visible, filtered by project or
+            # not. Archived and unarchived tasks are never listed together.
+            models.Index(
+                fields=["project", "-status_order", "due_date", "-priority", "id"],
+                name="task_project_listing_idx",
+                condition=Q(is_archived=False),
+            ),
+            models.Index(
+                fields=["-status_order", "due_date", "-priority", "id"],
+                name="task_unarchived_listing_idx",
+                condition=Q(is_archived=False),
+            ),
+            models.Index(
+                fields=["-status_order", "due_date", "-priority", "id"],
+                name="task_archived_listing_idx",
+                condition=Q(is_archived=True),
+            ),
+            # Creation date range filters
+            models.Index(fields=["created_at"], name="task_created_at_idx"),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Counted state as saved, kept up to date by the signal handlers
+        self._counted_state: Optional[CountedState] = None
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        task = super().from_db(db, field_names, values)
+        # A Task, which pylint does not infer from Model.from_db()
+        # pylint: disable=protected-access,no-member
+        task._counted_state = task.counted_state()
+        return task
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._counted_state = self.counted_state()
+
+    def counted_state(self) -> Optional["CountedState"]:
+        """
+        The fields counted in the project stats, see stats.py
+
+        None if some of them are deferred.
+        """
+
+        if self.COUNTED_FIELDS & self.get_deferred_fields():
+            return None
+        return CountedState(
+            self.project_id, self.status, self.is_archived, self.due_date
+        )
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # pylint: disable=arguments-differ
+        self.status_order = self.STATUS_ORDER[self.status]
+        if update_fields is not None and "status" in update_fields:
+            update_fields = set(update_fields) | {"status_order"}
+        # The project stats are updated by a post_save signal handler, in
+        # the same transaction as the task
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, update_fields=update_fields, **kwargs)
+
+
+class CountedState(NamedTuple):
+    """The state of a task as far as the project stats are concerned"""
+
+    project_id: int
+    status: str
+    is_archived: bool
+    due_date: Optional[date]
+
+    def with_changes(self, fields: dict) -> "CountedState":
+        """The state after changing the fields, fields not counted are ignored"""
+
+        # Members of typing.NamedTuple classes pylint does not know about
+        # pylint: disable=no-member
+        return self._replace(
+            **{name: value for name, value in fields.items() if name in self._fields}
+        )
+
+
+class ProjectStats(models.Model):
+    """
+    Number of tasks in a project by status
+
+    Archived tasks are only counted as archived regardless of their status.
+    Kept up to date incrementally when tasks change, see stats.py.
+    """
+
+    project = models.OneToOneField(
+        Project, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+
+    open_count = models.IntegerField(default=0)
+
+    in_progress_count = models.IntegerField(default=0)
+
+    done_count = models.IntegerField(default=0)
+
+    archived_count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = _("project stats")
+        verbose_name_plural = _("project stats")
+
+    def __str__(self):
+        return str(self.project)
+
+
+class ProjectDueCount(models.Model):
+    """
+    Number of unfinished tasks in a project due on a day
+
+    Unfinished means not done and not archived. Whether a task is overdue
+    changes with the date without the task changing, so the overdue counts
+    are summed from these when needed rather than kept as a counter.
+    """
+
+    project = models.ForeignKey(
+        Project, on_delete=models.CASCADE, related_name="due_counts"
+    )
+
+    due_date = models.DateField()
+
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index of summing the counts before a date
+            models.UniqueConstraint(
+                fields=["project", "due_date"], name="project_due_count_unique"
+            ),
+        ]
+
 
 class NoteQuerySet(models.QuerySet):
     """Queries for the Note model"""
@@ -263,17 +485,8 @@ class NoteQuerySet(models.QuerySet):
     def visible_to_user(self, user):
         """Filter for notes visible to the user"""
 
-        # FIXME: de-duplicate this filter
-        if user.is_superuser:
-            return self
-        else:
-            return self.filter(
-                Q(task__project__membership__user=user)
-                & (
-                    Q(task__project__membership__expires_at__isnull=True)
-                    | Q(task__project__membership__expires_at__gte=datetime.now())
-                )
-            )
+        visible = visible_to_user(user, "task__project")
+        return self if visible is None else self.filter(visible)
 
 
 NoteManager = models.Manager.from_queryset(NoteQuerySet)
@@ -290,6 +503,8 @@ class Note(models.Model):
 
     created_at = models.DateTimeField(_("created at"), auto_now_add=True)
 
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
     author = models.ForeignKey(
         User,
         on_delete=models.DO_NOTHING,
@@ -305,3 +520,46 @@ class Note(models.Model):
 
     def __str__(self):
         return f"Note by {self.author} on {self.created_at}"
+
+
+class QueryFinding(models.Model):
+    """
+    Slow or repeated queries found in one day, see query_inspection.py
+
+    Findings of the same query made at the same place by the same view are
+    counted together.
+    """
+
+    SLOW = "slow"
+    DUPLICATE = "duplicate"
+    KIND_CHOICES = [(SLOW, "slow"), (DUPLICATE, "duplicate")]
+
+    day = models.DateField()
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+
+    view = models.CharField(max_length=200)
+    """Name of the view that made the query"""
+
+    location = models.CharField(max_length=300)
+    """Source line or template line that made the query"""
+
+    sql_hash = models.CharField(max_length=32)
+
+    sql = models.TextField()
+
+    requests = models.IntegerField(default=0)
+    """Number of requests with the finding"""
+
+    queries = models.IntegerField(default=0)
+
+    duration = models.FloatField(default=0)
+    """Total seconds of the queries"""
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "kind", "view", "location", "sql_hash"],
+                name="query_finding_unique",
+            ),
+        ]
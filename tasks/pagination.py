@@ -0,0 +1,134 @@
+"""
+Keyset (a.k.a. cursor) pagination of the task list
+
+Instead of skipping rows with OFFSET, pages are selected by comparing the
+sort key of the tasks with the sort key of the last (or first) task on the
+previous page. This keeps the cost of a page independent of how deep it is.
+"""
+
+from datetime import date
+from typing import List, NamedTuple, Optional
+
+from django.db.models import Q
+
+
+class TaskCursor(NamedTuple):
+    """
+    A position in the task list
+
+    This is the sort key of a task in the order defined by
+    TaskQuerySet.all_visible, plus the id to make it unique.
+    """
+
+    status_order: int
+    due_date: Optional[date]
+    priority: int
+    id: int
+
+    @classmethod
+    def from_task(cls, task) -> "TaskCursor":
+        """The position of the task in the list"""
+
+        return cls(task.status_order, task.due_date, task.priority, task.id)
+
+    @classmethod
+    def parse(cls, value: str) -> Optional["TaskCursor"]:
+        """Parse a cursor from a query parameter, None if it is not valid"""
+
+        try:
+            status_order, due_date, priority, task_id = value.split(".")
+            return cls(
+                int(status_order),
+                date.fromisoformat(due_date) if due_date else None,
+                int(priority),
+                int(task_id),
+            )
+        except (AttributeError, ValueError):
+            return None
+
+    def __str__(self):
+        due_date = self.due_date.isoformat() if self.due_date else ""
+        return f"{self.status_order}.{due_date}.{self.priority}.{self.id}"
+
+    def following(self) -> Q:
+        """Filter for tasks after this position"""
+
+        after_priority = Q(priority__lt=self.priority) | Q(
+            priority=self.priority, id__gt=self.id
+        )
+
+        # Tasks without due date are at the end
+        if self.due_date is None:
+            after_due_date = Q(due_date__isnull=True) & after_priority
+        else:
+            after_due_date = (
+                Q(due_date__gt=self.due_date)
+                | Q(due_date__isnull=True)
+                | (Q(due_date=self.due_date) & after_priority)
+            )
+
+        return Q(status_order__lt=self.status_order) | (
+            Q(status_order=self.status_order) & after_due_date
+        )
+
+    def preceding(self) -> Q:
+        """Filter for tasks before this position"""
+
+        before_priority = Q(priority__gt=self.priority) | Q(
+            priority=self.priority, id__lt=self.id
+        )
+
+        # Tasks without due date are at the end
+        if self.due_date is None:
+            before_due_date = Q(due_date__isnull=False) | (
+                Q(due_date__isnull=True) & before_priority
+            )
+        else:
+            before_due_date = Q(due_date__lt=self.due_date) | (
+                Q(due_date=self.due_date) & before_priority
+            )
+
+        return Q(status_order__gt=self.status_order) | (
+            Q(status_order=self.status_order) & before_due_date
+        )
+
+
+class TaskPage(NamedTuple):
+    """One page of the task list"""
+
+    tasks: List
+    next_cursor: Optional[TaskCursor]
+    previous_cursor: Optional[TaskCursor]
+
+
+def paginate_tasks(
+    tasks, per_page: int, after: TaskCursor = None, before: TaskCursor = None
+) -> TaskPage:
+    """
+    Get the page of tasks after or before a cursor
+
+    The tasks argument must be ordered by TaskQuerySet.all_visible. Without
+    a cursor the first page is returned.
+    """
+
+    if before is not None:
+        # Walk backwards from the cursor then restore the original order
+        page = list(tasks.filter(before.preceding()).reverse()[: per_page + 1])
+        has_previous = len(page) > per_page
+        page = page[:per_page][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            tasks = tasks.filter(after.following())
+        page = list(tasks[: per_page + 1])
+        has_next = len(page) > per_page
+        page = page[:per_page]
+        has_previous = after is not None
+
+    return TaskPage(
+        tasks=page,
+        next_cursor=TaskCursor.from_task(page[-1]) if page and has_next else None,
+        previous_cursor=TaskCursor.from_task(page[0])
+        if page and has_previous
+        else None,
+    )
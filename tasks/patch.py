@@ -0,0 +1,68 @@
+"""
+Changing single fields of a task
+
+A lighter alternative to saving the whole task for inline edits of the task
+list: the changed fields are written with one conditional UPDATE checking
+the version, like VersionedMixin does when saving. The current state is read
+before updating, for the project stats and the visibility check. Being at
+the same version, it is the state the UPDATE replaces.
+"""
+
+from typing import Dict
+
+from django.db import transaction
+from django.db.models import F
+from ool import ConcurrentUpdate
+
+from . import events
+from .events import TaskEvent
+from .models import CountedState, Task
+from .stats import Delta
+
+PATCH_FIELDS = ("status", "priority", "due_date", "assignee")
+"""Fields that can be changed one by one"""
+
+
+def patch_task(user, task_id: int, version: int, changes: Dict) -> int:
+    """
+    Change fields of the task if it is still at the given version
+
+    Returns the new version. Raises Task.DoesNotExist if the task is not
+    visible to the user and ConcurrentUpdate if it was changed since the
+    version.
+    """
+
+    with transaction.atomic():
+        current = (
+            Task.objects.visible_to_user(user)
+            .filter(pk=task_id)
+            .values_list("version", "project_id", "status", "is_archived", "due_date")
+            .first()
+        )
+        if current is None:
+            raise Task.DoesNotExist
+        current_version, *state = current
+        if current_version != version:
+            raise ConcurrentUpdate
+
+        # update() does not call save(), which syncs status_order
+        fields = dict(changes)
+        if "status" in fields:
+            fields["status_order"] = Task.STATUS_ORDER[fields["status"]]
+        updated = Task.objects.filter(pk=task_id, version=version).update(
+            version=F("version") + 1, **fields
+        )
+        if not updated:
+            raise ConcurrentUpdate
+
+        # update() does not send the signals updating the project stats and
+        # publishing the changes
+        old_state = CountedState(*state)
+        delta = Delta()
+        delta.change(old_state, old_state.with_changes(changes))
+        delta.apply()
+        events.publish(
+            [TaskEvent("updated", task_id, old_state.project_id, version + 1)]
+        )
+
+    return version + 1
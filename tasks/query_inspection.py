@@ -0,0 +1,201 @@
+"""
+Finding slow and repeated queries
+
+QueryInspectionMiddleware inspects the queries of a sample of the requests,
+set by the QUERY_INSPECTION_SAMPLE_RATE setting. It finds:
+
+- slow queries, taking at least SLOW_QUERY_MS milliseconds,
+- duplicate queries, the same SQL made at least DUPLICATE_QUERY_THRESHOLD
+  times in one request, the signature of N+1 queries.
+
+A finding is attributed to the view and to the place that made the query:
+the innermost line of the project's code, eg. a template filter, or the
+template tag being rendered, eg. a for loop iterating a query set. Walking
+the stack only happens for the queries found.
+
+The findings are counted per day in QueryFinding and reported by the
+query_report command.
+"""
+
+import hashlib
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+from typing import Dict, NamedTuple, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import QueryFinding
+
+logger = logging.getLogger(__name__)
+
+_CURSOR_FILE = os.path.join("django", "db", "backends", "utils.py")
+_TEMPLATE_FILE = os.path.join("django", "template", "base.py")
+_PROJECT_DIR = str(settings.BASE_DIR) + os.sep
+
+
+class Finding(NamedTuple):
+    """A query found in a request"""
+
+    kind: str
+    location: str
+    sql: str
+
+
+class QueryInspector:
+    """Database execute wrapper inspecting the queries of one request"""
+
+    def __init__(self):
+        self.slow_threshold = settings.SLOW_QUERY_MS / 1000
+        self.duplicate_threshold = settings.DUPLICATE_QUERY_THRESHOLD
+
+        self.counts: Counter = Counter()
+        """Number of queries by SQL"""
+
+        self.durations: Counter = Counter()
+        """Seconds spent in queries by SQL"""
+
+        self.duplicate_locations: Dict[str, str] = {}
+        """Location of the queries made too many times by SQL"""
+
+        self.slow_queries: Dict[Finding, Tuple[int, float]] = {}
+        """Number and seconds of the slow queries"""
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.counts[sql] += 1
+            self.durations[sql] += duration
+
+            if duration >= self.slow_threshold:
+                finding = Finding(QueryFinding.SLOW, find_location(), sql)
+                count, total = self.slow_queries.get(finding, (0, 0.0))
+                self.slow_queries[finding] = (count + 1, total + duration)
+
+            if self.counts[sql] == self.duplicate_threshold:
+                self.duplicate_locations[sql] = find_location()
+
+    def findings(self) -> Dict[Finding, Tuple[int, float]]:
+        """Number and seconds of the queries found"""
+
+        findings = dict(self.slow_queries)
+        for sql, location in self.duplicate_locations.items():
+            finding = Finding(QueryFinding.DUPLICATE, location, sql)
+            findings[finding] = (self.counts[sql], self.durations[sql])
+        return findings
+
+
+def find_location() -> str:
+    """The place that made the query being executed"""
+
+    frames = []
+    frame = sys._getframe(1)  # pylint: disable=protected-access
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+
+    # Execute wrappers run within the cursor, the query was made by the
+    # caller of the outermost cursor method
+    start = 1 + max(
+        (
+            index
+            for index, frame in enumerate(frames)
+            if frame.f_code.co_filename.endswith(_CURSOR_FILE)
+        ),
+        default=-1,
+    )
+
+    for frame in frames[start:]:
+        filename = frame.f_code.co_filename
+        if frame.f_code.co_name == "render_annotated" and filename.endswith(
+            _TEMPLATE_FILE
+        ):
+            node = frame.f_locals.get("self")
+            token = getattr(node, "token", None)
+            origin = getattr(node, "origin", None)
+            if token is not None and origin is not None:
+                name = origin.template_name or origin.name
+                return f"{name}:{token.lineno} {token.contents[:50]}"
+        elif filename.startswith(_PROJECT_DIR) and "site-packages" not in filename:
+            path = filename[len(_PROJECT_DIR) :]
+            return f"{path}:{frame.f_lineno} {frame.f_code.co_name}"
+
+    return "unknown"
+
+
+def record_findings(view: str, findings: Dict[Finding, Tuple[int, float]]):
+    """Count the findings of a request"""
+
+    day = timezone.localdate()
+    for finding, (queries, duration) in sorted(findings.items()):
+        sql_hash = hashlib.md5(finding.sql.encode()).hexdigest()
+        existing = QueryFinding.objects.filter(
+            day=day,
+            kind=finding.kind,
+            view=view,
+            location=finding.location,
+            sql_hash=sql_hash,
+        )
+        changes = dict(
+            requests=F("requests") + 1,
+            queries=F("queries") + queries,
+            duration=F("duration") + duration,
+        )
+        if existing.update(**changes):
+            continue
+
+        try:
+            with transaction.atomic():
+                QueryFinding.objects.create(
+                    day=day,
+                    kind=finding.kind,
+                    view=view,
+                    location=finding.location,
+                    sql_hash=sql_hash,
+                    sql=finding.sql,
+                    requests=1,
+                    queries=queries,
+                    duration=duration,
+                )
+        except IntegrityError:
+            # Created by a concurrent request in the meantime
+            existing.update(**changes)
+
+
+class QueryInspectionMiddleware:
+    """Inspects the queries of a sample of the requests"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.QUERY_INSPECTION_SAMPLE_RATE:
+            return self.get_response(request)
+
+        inspector = QueryInspector()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(inspector))
+            response = self.get_response(request)
+
+        findings = inspector.findings()
+        if findings:
+            resolver_match = getattr(request, "resolver_match", None)
+            view = resolver_match.view_name if resolver_match else request.path
+            try:
+                record_findings(view, findings)
+            except Exception:  # pylint: disable=broad-except
+                # Inspecting is best effort, the response is ready
+                logger.exception("Recording query findings failed")
+
+        return response
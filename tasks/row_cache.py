@@ -0,0 +1,71 @@
+"""
+Cache of the rendered rows of the task list
+
+A row is cached under the id and version of the task, VersionField
+increments the version on every save and bulk changes increment it too. The
+active language and time zone are part of the key, so are the displayed
+names of the project and the assignee, which can change without the task
+being saved, and the creation time of the task. Renaming a tag does not
+change the key, such rows are stale until they expire.
+
+The rows of a page are read with one get_many and the missing ones written
+with one set_many. Hits and misses are counted per process in counters.
+"""
+
+import logging
+from collections import Counter
+from hashlib import md5
+from typing import List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone, translation
+from django.utils.safestring import SafeString, mark_safe
+
+from minitask.timing import count_cache
+
+from .models import Task
+from .templatetags.tasks_extras import user_str
+
+logger = logging.getLogger(__name__)
+
+counters = Counter()
+"""Number of "hits" and "misses" since the process started"""
+
+
+def row_key(task: Task) -> str:
+    """Cache key of the rendered row of a task"""
+
+    # The creation time tells apart a new task getting the id of a deleted one
+    digest = md5(
+        f"{task.created_at.isoformat()}\0{task.project}\0"
+        f"{user_str(task.assignee) or ''}".encode()
+    )
+    return (
+        f"task-row:{task.id}:{task.version}:{translation.get_language()}:"
+        f"{timezone.get_current_timezone_name()}:{digest.hexdigest()}"
+    )
+
+
+def render_rows(tasks: List[Task]) -> List[SafeString]:
+    """The rendered rows of the task list, from the cache where possible"""
+
+    timeout = settings.TASK_ROW_CACHE_TIMEOUT
+    keys = [row_key(task) for task in tasks]
+    rows = cache.get_many(keys) if timeout else {}
+
+    missing = {}
+    for task, key in zip(tasks, keys):
+        if key not in rows:
+            missing[key] = rows[key] = render_to_string("task_row.html", {"task": task})
+    if missing and timeout:
+        cache.set_many(missing, timeout)
+
+    hits = len(tasks) - len(missing)
+    counters.update(hits=hits, misses=len(missing))
+    count_cache(hits=hits, misses=len(missing))
+    logger.debug("Task rows: %d hits, %d misses", hits, len(missing))
+
+    # Rendered by a template, autoescaped already
+    return [mark_safe(rows[key]) for key in keys]
@@ -0,0 +1,162 @@
+"""
+Full-text search of tasks
+
+Task titles, descriptions and note bodies are indexed in the tasks_search
+table, which is created by a migration depending on the database:
+
+- SQLite: an FTS5 virtual table, the rowid is the task id
+- PostgreSQL: a tsvector column with a GIN index
+
+The index is updated with SQL statements that read the tasks and notes, so a
+whole batch of tasks can be reindexed at once (see signals.py for keeping it
+up to date on save). Other databases have no index, searching falls back to
+substring matching there.
+
+Searches match tasks having all the words, each word is a prefix match.
+"""
+
+import re
+from typing import Iterable, List, Optional
+
+from django.apps import apps
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+WORD = re.compile(r"\w+")
+
+TITLE_WEIGHT = 10.0
+"""How much more a match in the title counts than in the body"""
+
+# Language agnostic configuration, no stemming or stop words
+POSTGRESQL_CONFIG = "simple"
+
+_SQLITE_DELETE = "DELETE FROM tasks_search WHERE rowid IN ({ids})"
+
+_SQLITE_INSERT = """
+    INSERT INTO tasks_search(rowid, title, body)
+    SELECT
+        task.id,
+        task.title,
+        task.description || ' ' || COALESCE(
+            (SELECT group_concat(note.body, ' ')
+             FROM tasks_note note WHERE note.task_id = task.id),
+            ''
+        )
+    FROM tasks_task task
+    {where}
+"""
+
+_POSTGRESQL_DELETE = "DELETE FROM tasks_search WHERE task_id IN ({ids})"
+
+_POSTGRESQL_INSERT = f"""
+    INSERT INTO tasks_search(task_id, document)
+    SELECT
+        task.id,
+        setweight(to_tsvector('{POSTGRESQL_CONFIG}', task.title), 'A')
+        || setweight(to_tsvector('{POSTGRESQL_CONFIG}',
+            task.description || ' ' || COALESCE(
+                (SELECT string_agg(note.body, ' ')
+                 FROM tasks_note note WHERE note.task_id = task.id),
+                ''
+            )
+        ), 'B')
+    FROM tasks_task task
+    {{where}}
+"""
+
+
+def words(text: str) -> List[str]:
+    """The words of a search text"""
+
+    return WORD.findall(text or "")
+
+
+def update_index(task_ids: Optional[Iterable[int]] = None, using="default"):
+    """
+    Reindex the tasks with the given ids, or all tasks if task_ids is None
+
+    Deleted tasks are removed from the index.
+    """
+
+    connection = connections[using]
+    if connection.vendor == "sqlite":
+        delete, insert = _SQLITE_DELETE, _SQLITE_INSERT
+    elif connection.vendor == "postgresql":
+        delete, insert = _POSTGRESQL_DELETE, _POSTGRESQL_INSERT
+    else:
+        return
+
+    with connection.cursor() as cursor:
+        if task_ids is None:
+            cursor.execute("DELETE FROM tasks_search")
+            cursor.execute(insert.format(where=""))
+        else:
+            task_ids = [int(task_id) for task_id in set(task_ids)]
+            if not task_ids:
+                return
+            placeholders = ", ".join(["%s"] * len(task_ids))
+            cursor.execute(delete.format(ids=placeholders), task_ids)
+            cursor.execute(
+                insert.format(where=f"WHERE task.id IN ({placeholders})"), task_ids
+            )
+
+
+def search(tasks, text: str):
+    """
+    Filter the task queryset by the search text and order by relevance
+
+    The relevance is annotated as search_rank, higher is better.
+    """
+
+    search_words = words(text)
+    if not search_words:
+        return tasks
+
+    vendor = connections[tasks.db].vendor
+    if vendor == "sqlite":
+        match = " ".join(f'"{word}"*' for word in search_words)
+        matching = RawSQL(
+            "SELECT rowid FROM tasks_search WHERE tasks_search MATCH %s", (match,)
+        )
+        # bm25() is lower for better matches
+        rank = RawSQL(
+            f"SELECT -bm25(tasks_search, {TITLE_WEIGHT}, 1.0) FROM tasks_search "
+            "WHERE tasks_search MATCH %s AND rowid = tasks_task.id",
+            (match,),
+            output_field=FloatField(),
+        )
+    elif vendor == "postgresql":
+        match = " & ".join(f"{word}:*" for word in search_words)
+        matching = RawSQL(
+            "SELECT task_id FROM tasks_search "
+            f"WHERE document @@ to_tsquery('{POSTGRESQL_CONFIG}', %s)",
+            (match,),
+        )
+        rank = RawSQL(
+            f"SELECT ts_rank('{{0.1, 0.2, {1 / TITLE_WEIGHT}, 1.0}}', document, "
+            f"to_tsquery('{POSTGRESQL_CONFIG}', %s)) "
+            "FROM tasks_search WHERE task_id = tasks_task.id",
+            (match,),
+            output_field=FloatField(),
+        )
+    else:
+        for word in search_words:
+            tasks = tasks.filter(
+                Q(title__icontains=word)
+                | Q(description__icontains=word)
+                | Q(id__in=_notes_containing(word))
+            )
+        return tasks.annotate(search_rank=Value(0.0, FloatField())).order_by("id")
+
+    return (
+        tasks.filter(id__in=matching)
+        .annotate(search_rank=rank)
+        .order_by("-search_rank", "id")
+    )
+
+
+def _notes_containing(word):
+    # Not imported, the models import this module
+    note_model = apps.get_model("tasks", "Note")
+    return note_model.objects.filter(body__icontains=word).values("task_id")
@@ -0,0 +1,101 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from accounts.models import User
+
+from . import events, search, stats
+from .choices import invalidate_choices
+from .events import TaskEvent
+from .models import Note, Project, ProjectMembership, ProjectStats, Task
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+@receiver(post_save, sender=ProjectMembership)
+@receiver(post_delete, sender=ProjectMembership)
+# Project.members.add() and friends don't send post_save
+@receiver(m2m_changed, sender=ProjectMembership)
+def on_choices_changed(update_fields=None, **_kwargs):
+    """Users, projects or memberships changed, invalidate the dropdown choices"""
+
+    # Logging in saves the last login only, which is not shown in choices
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    invalidate_choices()
+
+
+@receiver(post_save, sender=Project)
+def on_project_saved(instance, created, using, **_kwargs):
+    """Start counting the tasks of new projects"""
+
+    if created:
+        ProjectStats.objects.using(using).get_or_create(project=instance)
+
+
+@receiver(pre_save, sender=Task)
+def on_task_saving(instance, using, **_kwargs):
+    """Find out the state of a task saved without loading it fully"""
+
+    # pylint: disable=protected-access
+    if instance.pk is not None and getattr(instance, "_counted_state", None) is None:
+        instance._counted_state = stats.saved_state(instance.pk, using=using)
+
+
+@receiver(post_save, sender=Task)
+def on_task_saved(instance, created, using, **_kwargs):
+    """Count the change of the task in the project stats and publish it"""
+
+    # pylint: disable=protected-access
+    old_state = None if created else getattr(instance, "_counted_state", None)
+    new_state = instance.counted_state() or stats.saved_state(instance.pk, using)
+
+    delta = stats.Delta()
+    delta.change(old_state, new_state)
+    delta.apply(using)
+    instance._counted_state = new_state
+
+    if created:
+        event_type = "created"
+    elif new_state.is_archived and not (old_state and old_state.is_archived):
+        event_type = "archived"
+    else:
+        event_type = "updated"
+    events.publish(
+        [TaskEvent(event_type, instance.pk, new_state.project_id, instance.version)],
+        using,
+    )
+
+
+@receiver(post_delete, sender=Task)
+def on_task_deleted(instance, using, **_kwargs):
+    """Uncount the task in the project stats and publish the deletion"""
+
+    # pylint: disable=protected-access
+    state = getattr(instance, "_counted_state", None) or instance.counted_state()
+    delta = stats.Delta()
+    delta.add(state, -1)
+    delta.apply(using)
+
+    if state is not None:
+        events.publish(
+            [TaskEvent("deleted", instance.pk, state.project_id, instance.version)],
+            using,
+        )
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def on_task_changed(instance, using, **_kwargs):
+    """Reindex the task for full-text search"""
+
+    search.update_index([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Note)
+@receiver(post_delete, sender=Note)
+def on_note_changed(instance, using, **_kwargs):
+    """Reindex the task of the note for full-text search"""
+
+    search.update_index([instance.task_id], using=using)
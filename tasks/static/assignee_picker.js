@@ -0,0 +1,81 @@
+/*
+ * Assignee dropdowns loading their options on demand
+ *
+ * Selects marked with data-assignee-picker are rendered with the selected
+ * option only. The rest of the options are fetched from the URL in the
+ * attribute when the select is first used, and re-fetched when searching
+ * in the search input added in front of the select.
+ */
+(function () {
+  "use strict";
+
+  const SEARCH_DELAY = 250;
+
+  function setUp(select) {
+    const search = document.createElement("input");
+    search.type = "search";
+    search.className = "form-control form-control-sm mb-1";
+    search.placeholder = select.dataset.searchPlaceholder;
+    search.setAttribute("aria-label", select.dataset.searchPlaceholder);
+    select.parentNode.insertBefore(search, select);
+
+    const projectField = select.form
+      ? select.form.elements[select.dataset.projectField]
+      : null;
+
+    let loadedQuery = null;
+    let searchTimeout = null;
+
+    function load(query) {
+      if (query === loadedQuery) {
+        return;
+      }
+      loadedQuery = query;
+
+      const params = new URLSearchParams({ q: query });
+      if (projectField && projectField.value) {
+        params.set("project", projectField.value);
+      }
+
+      fetch(select.dataset.assigneePicker + "?" + params, {
+        credentials: "same-origin",
+        headers: { Accept: "application/json" },
+      })
+        .then((response) => (response.ok ? response.json() : { results: [] }))
+        .then((data) => {
+          if (query === loadedQuery) {
+            replaceOptions(data.results);
+          }
+        });
+    }
+
+    function replaceOptions(users) {
+      // Keep the empty and the selected option, replace the rest
+      const selected = select.value;
+      Array.from(select.options)
+        .filter((option) => option.value && option.value !== selected)
+        .forEach((option) => option.remove());
+      users
+        .filter((user) => String(user.id) !== selected)
+        .forEach((user) => select.add(new Option(user.text, user.id)));
+    }
+
+    select.addEventListener("focus", () => load(search.value.trim()));
+    select.addEventListener("mousedown", () => load(search.value.trim()));
+
+    search.addEventListener("input", () => {
+      clearTimeout(searchTimeout);
+      searchTimeout = setTimeout(() => load(search.value.trim()), SEARCH_DELAY);
+    });
+
+    if (projectField) {
+      projectField.addEventListener("change", () => {
+        loadedQuery = null;
+      });
+    }
+  }
+
+  document
+    .querySelectorAll("select[data-assignee-picker]")
+    .forEach((select) => setUp(select));
+})();
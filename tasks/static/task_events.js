@@ -0,0 +1,74 @@
+/*
+ * Live updates of the task list
+ *
+ * The table marked with data-task-events subscribes to the server-sent
+ * events at the URL in the attribute. Rows of changed tasks are fetched
+ * again and replaced in place, or removed if the task is not in the filtered
+ * list any more. New tasks and lost events show a notice offering a reload,
+ * as the position of a new row can not be known.
+ */
+(function () {
+  "use strict";
+
+  function setUp(table) {
+    const notice = document.querySelector("[data-task-events-notice]");
+    const events = new EventSource(table.dataset.taskEvents);
+
+    function showNotice() {
+      notice.classList.remove("d-none");
+    }
+
+    function rowUrl(taskId) {
+      return (
+        table.dataset.taskRowUrl.replace("/0/", "/" + taskId + "/") +
+        table.dataset.filterQuery
+      );
+    }
+
+    function updateRow(row, taskId) {
+      fetch(rowUrl(taskId), { credentials: "same-origin" })
+        .then((response) => {
+          if (!response.ok || response.redirected) {
+            // Signed out or failed, the page is stale
+            showNotice();
+            return;
+          }
+          if (response.status === 204) {
+            row.remove();
+            return;
+          }
+          return response.text().then((html) => {
+            const template = document.createElement("template");
+            template.innerHTML = html.trim();
+            const newRow = template.content.firstElementChild;
+            // Events can arrive out of order, keep the newest version
+            if (Number(newRow.dataset.version) >= Number(row.dataset.version)) {
+              row.replaceWith(newRow);
+            }
+          });
+        })
+        .catch(showNotice);
+    }
+
+    events.addEventListener("task", (message) => {
+      const event = JSON.parse(message.data);
+      const row = table.querySelector(
+        'tr[data-task-id="' + event.task_id + '"]'
+      );
+
+      if (event.type === "created") {
+        showNotice();
+      } else if (row && event.type === "deleted") {
+        row.remove();
+      } else if (row && event.version > Number(row.dataset.version)) {
+        updateRow(row, event.task_id);
+      }
+    });
+
+    events.addEventListener("reload", showNotice);
+  }
+
+  if (window.EventSource) {
+    document.querySelectorAll("[data-task-events]").forEach(setUp);
+  }
+})();
@@ -0,0 +1,291 @@
+"""
+Task counts of projects
+
+ProjectStats holds the number of tasks of each project by status and
+ProjectDueCount the number of unfinished tasks by due date, which the overdue
+counts are summed from. Rather than counting the tasks of all projects on
+every page, the counts are changed incrementally with UPDATE ... SET count =
+count + n statements whenever tasks change:
+
+- Saving and deleting tasks through the models is handled by signals.py,
+  comparing the state the task was loaded in (see Task.from_db) to the saved
+  one.
+- Bulk changes and imports bypass the signals and apply a Delta themselves.
+
+reconcile() recounts everything from the tasks and fixes the counts that
+drifted, eg. after changing tasks with raw SQL.
+"""
+
+from collections import Counter
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+from django.utils.translation import gettext
+
+from .models import CountedState, Project, ProjectDueCount, ProjectStats, Task
+
+COUNTERS = [f"{status}_count" for status, _ in Task.STATUS_CHOICES] + ["archived_count"]
+"""Fields of ProjectStats"""
+
+
+class ProjectCounts(NamedTuple):
+    """Task counts of a project"""
+
+    open: int
+    in_progress: int
+    done: int
+    archived: int
+    overdue: int
+
+    @property
+    def unfinished(self) -> int:
+        """Number of unarchived tasks not done yet"""
+
+        return self.open + self.in_progress
+
+
+class Drift(NamedTuple):
+    """A stored count that differs from the actual one"""
+
+    project_id: int
+    counter: str
+    """Field of ProjectStats or "due YYYY-MM-DD" for a ProjectDueCount"""
+
+    stored: int
+    actual: int
+
+
+class Delta:
+    """Changes of the counts collected to be applied at once"""
+
+    def __init__(self):
+        self.counters: Dict[int, Counter] = {}
+        """Changes of the ProjectStats fields by project id"""
+
+        self.due_counts: Counter = Counter()
+        """Changes of the ProjectDueCounts by project id and due date"""
+
+    def add(self, state: Optional[CountedState], sign: int = 1):
+        """Count a task in the given state, or uncount it with sign=-1"""
+
+        if state is None:
+            return
+
+        counter = "archived_count" if state.is_archived else f"{state.status}_count"
+        self.counters.setdefault(state.project_id, Counter())[counter] += sign
+
+        if _is_unfinished(state) and state.due_date is not None:
+            self.due_counts[(state.project_id, state.due_date)] += sign
+
+    def change(self, old: Optional[CountedState], new: Optional[CountedState]):
+        """Count a task changing from the old state to the new"""
+
+        if old != new:
+            self.add(old, -1)
+            self.add(new)
+
+    def apply(self, using="default"):
+        """Update the counts, must be called in the transaction of the change"""
+
+        # Always in the same order to avoid deadlocks between transactions
+        for project_id, counters in sorted(self.counters.items()):
+            changes = {
+                counter: F(counter) + value
+                for counter, value in counters.items()
+                if value != 0
+            }
+            if changes:
+                ProjectStats.objects.using(using).filter(project_id=project_id).update(
+                    **changes
+                )
+
+        for (project_id, due_date), value in sorted(self.due_counts.items()):
+            if value != 0:
+                _add_due_count(project_id, due_date, value, using)
+
+
+def _is_unfinished(state: CountedState) -> bool:
+    return not state.is_archived and state.status != "done"
+
+
+def _add_due_count(project_id: int, due_date: date, value: int, using: str):
+    due_counts = ProjectDueCount.objects.using(using).filter(
+        project_id=project_id, due_date=due_date
+    )
+    if due_counts.update(count=F("count") + value) or value < 0:
+        return
+
+    try:
+        with transaction.atomic(using=using):
+            ProjectDueCount.objects.using(using).create(
+                project_id=project_id, due_date=due_date, count=value
+            )
+    except IntegrityError:
+        # Created by a concurrent transaction in the meantime
+        due_counts.update(count=F("count") + value)
+
+
+def saved_state(task_id: int, using="default") -> Optional[CountedState]:
+    """The counted state of a task in the database, None if it does not exist"""
+
+    values = (
+        Task.objects.using(using)
+        .filter(pk=task_id)
+        .values_list("project_id", "status", "is_archived", "due_date")
+        .first()
+    )
+    return CountedState(*values) if values else None
+
+
+def project_counts(
+    project_ids: Iterable[int], today: date = None
+) -> Dict[int, ProjectCounts]:
+    """Task counts of the projects by id, overdue meaning due before today"""
+
+    overdue = (
+        ProjectDueCount.objects.filter(
+            project=OuterRef("project"), due_date__lt=today or timezone.localdate()
+        )
+        .values("project")
+        .annotate(overdue=Sum("count"))
+        .values("overdue")
+    )
+    rows = (
+        ProjectStats.objects.filter(project_id__in=project_ids)
+        .annotate(overdue=Subquery(overdue))
+        .values_list("project_id", *COUNTERS, "overdue")
+    )
+    return {
+        project_id: ProjectCounts(*counts, overdue or 0)
+        for project_id, *counts, overdue in rows
+    }
+
+
+def with_task_counts(project_choices: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Project dropdown choices labelled with the unfinished and overdue counts"""
+
+    counts = project_counts(project_id for project_id, _ in project_choices)
+    choices = []
+    for project_id, title in project_choices:
+        project_count = counts.get(project_id)
+        if project_count is None:
+            label = title
+        elif project_count.overdue:
+            label = gettext("%(title)s (%(unfinished)d, %(overdue)d overdue)") % {
+                "title": title,
+                "unfinished": project_count.unfinished,
+                "overdue": project_count.overdue,
+            }
+        else:
+            label = gettext("%(title)s (%(unfinished)d)") % {
+                "title": title,
+                "unfinished": project_count.unfinished,
+            }
+        choices.append((project_id, label))
+    return choices
+
+
+def reconcile(fix: bool = True, using="default") -> List[Drift]:
+    """
+    Recount the tasks of all projects and return the counts that drifted
+
+    The drifted counts are fixed unless fix is False.
+    """
+
+    with transaction.atomic(using=using):
+        stats = ProjectStats.objects.using(using)
+        if fix:
+            # Incremental updates of concurrent transactions wait for the
+            # fixed counts rather than being overwritten
+            stats = stats.select_for_update()
+        stored_stats = {
+            project_stats.project_id: project_stats for project_stats in stats
+        }
+
+        drifts = _reconcile_stats(stored_stats, fix, using)
+        drifts += _reconcile_due_counts(fix, using)
+
+    return sorted(drifts)
+
+
+def _reconcile_stats(stored_stats: Dict[int, ProjectStats], fix: bool, using: str):
+    actual_counts = {
+        row.pop("project"): row
+        for row in Task.objects.using(using)
+        .values("project")
+        .annotate(
+            archived_count=Count("id", filter=Q(is_archived=True)),
+            **{
+                f"{status}_count": Count(
+                    "id", filter=Q(is_archived=False, status=status)
+                )
+                for status, _ in Task.STATUS_CHOICES
+            },
+        )
+    }
+
+    drifts = []
+    for project_id in Project.objects.using(using).values_list("id", flat=True):
+        project_stats = stored_stats.get(project_id) or ProjectStats(
+            project_id=project_id
+        )
+        actual = actual_counts.get(project_id, {})
+        changed = project_id not in stored_stats
+        for counter in COUNTERS:
+            stored_count = getattr(project_stats, counter)
+            actual_count = actual.get(counter, 0)
+            if stored_count != actual_count:
+                drifts.append(Drift(project_id, counter, stored_count, actual_count))
+                setattr(project_stats, counter, actual_count)
+                changed = True
+        if fix and changed:
+            project_stats.save(using=using)
+
+    return drifts
+
+
+def _reconcile_due_counts(fix: bool, using: str):
+    stored_counts = dict(
+        ((project_id, due_date), (count_id, count))
+        for count_id, project_id, due_date, count in ProjectDueCount.objects.using(
+            using
+        ).values_list("pk", "project_id", "due_date", "count")
+    )
+    actual_counts = dict(
+        ((project_id, due_date), count)
+        for project_id, due_date, count in Task.objects.using(using)
+        .filter(is_archived=False, due_date__isnull=False)
+        .exclude(status="done")
+        .values("project", "due_date")
+        .annotate(count=Count("id"))
+        .values_list("project", "due_date", "count")
+    )
+
+    drifts = []
+    for key in sorted(stored_counts.keys() | actual_counts.keys()):
+        project_id, due_date = key
+        count_id, stored_count = stored_counts.get(key, (None, 0))
+        actual_count = actual_counts.get(key, 0)
+        if stored_count != actual_count:
+            drifts.append(
+                Drift(project_id, f"due {due_date}", stored_count, actual_count)
+            )
+        if not fix:
+            continue
+
+        if actual_count == 0 and count_id is not None:
+            # Counts dropping to zero are not deleted incrementally
+            ProjectDueCount.objects.using(using).filter(pk=count_id).delete()
+        elif stored_count != actual_count and count_id is not None:
+            ProjectDueCount.objects.using(using).filter(pk=count_id).update(
+                count=actual_count
+            )
+        elif stored_count != actual_count:
+            ProjectDueCount.objects.using(using).create(
+                project_id=project_id, due_date=due_date, count=actual_count
+            )
+
+    return drifts
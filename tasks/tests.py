@@ -1,12 +1,55 @@
+import asyncio
+import csv
+import json
+import math
+import os
+import shutil
+import socket
+import tempfile
+import warnings
+from contextlib import nullcontext
 from datetime import date, datetime, timedelta
+from io import StringIO
+from typing import NamedTuple
+from unittest import mock
 
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
 from django.contrib.auth.models import Permission
-from django.test import Client, TestCase, TransactionTestCase
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.sessions.backends.cache import SessionStore as CacheSessionStore
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.core.signals import request_finished
+from django.db import connection, router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import Context as TemplateContext
+from django.template import Template
+from django.test import (
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone, translation
+from taggit.models import Tag
 
 from accounts.models import User
+from minitask import asgi, metrics, routers
+from minitask.db.postgresql import base as postgresql_base
 
+from . import events, export, imports, query_inspection, row_cache, stats
+from .bulk import bulk_change
+from .choices import choices_for_user
 from .forms.task_filter_form import TaskFilterForm
-from .models import Note, Project, Task
+from .models import Note, Project, ProjectMembership, QueryFinding, Task
+from .pagination import TaskCursor, paginate_tasks
 
 
 class FormTests(TestCase):
@@ -94,6 +137,22 @@ class ModelTests(TestCase):
         tasks = Task.objects.all_visible().all()
         self.assertEqual(list(tasks), [in_progress_task, open_task, done_task])
 
+    def test_task_status_order(self):
+        """The stored status order follows status changes"""
+
+        user = User.objects.create_user("testuser", password="test")
+
+        project = Project(title="Test Project")
+        project.save()
+        task = Task(project=project, created_by=user, status="done", title="task")
+        task.save()
+        self.assertEqual(task.status_order, Task.STATUS_ORDER["done"])
+
+        task.status = "in_progress"
+        task.save(update_fields=["status"])
+        task.refresh_from_db()
+        self.assertEqual(task.status_order, Task.STATUS_ORDER["in_progress"])
+
     def test_task_sort_by_due_date(self):
         """Tasks are sorted by due date ascending, nulls last"""
 
@@ -194,6 +253,163 @@ class ModelTests(TestCase):
         tasks = Task.objects.all_visible().visible_to_user(user).all()
         self.assertEqual(list(tasks), [])
 
+    def test_tasks_multiple_memberships(self):
+        """Multiple memberships of the same project do not duplicate tasks"""
+
+        user = User.objects.create_user("testuser", password="test")
+
+        project = Project(title="Test Project")
+        project.save()
+
+        tomorrow = datetime.now() + timedelta(days=1)
+        ProjectMembership(user=user, project=project).save()
+        ProjectMembership(user=user, project=project, expires_at=tomorrow).save()
+
+        task = Task(project=project, created_by=user, title="Test Task")
+        task.save()
+        task.tags.add("foo", "bar")
+
+        tasks = (
+            Task.objects.visible_to_user(user)
+            .filtered_by(tags=["foo", "bar"])
+            .all_visible()
+        )
+        self.assertEqual(list(tasks), [task])
+        self.assertEqual(list(Project.objects.visible_to_user(user)), [project])
+
+        note = Note(task=task, author=user, body="Test note")
+        note.save()
+        self.assertEqual(list(Note.objects.visible_to_user(user)), [note])
+
+    def test_notes_expired_membership(self):
+        """Members don't see notes on projects where their membership has expired"""
+
+        user = User.objects.create_user("testuser", password="test")
+
+        project = Project(title="Test Project")
+        project.save()
+
+        yesterday = datetime.now() - timedelta(days=1)
+        project.members.add(user, through_defaults={"expires_at": yesterday})
+
+        task = Task(project=project, created_by=user, title="Test Task")
+        task.save()
+        Note(task=task, author=user, body="Test note").save()
+
+        self.assertEqual(list(Note.objects.visible_to_user(user)), [])
+
+    def test_tasks_filter_by_tags(self):
+        """Tasks can be filtered by all or any of the tags"""
+
+        user = User.objects.create_user("testuser", password="test")
+
+        project = Project(title="Test Project")
+        project.save()
+        task_foo = Task(project=project, created_by=user, title="foo")
+        task_foo.save()
+        task_foo.tags.add("foo")
+        task_foo_bar = Task(project=project, created_by=user, title="foo bar")
+        task_foo_bar.save()
+        task_foo_bar.tags.add("foo", "bar")
+        task_qux = Task(project=project, created_by=user, title="qux")
+        task_qux.save()
+        task_qux.tags.add("qux")
+
+        tasks = Task.objects.all_visible().order_by("id")
+        self.assertEqual(
+            list(tasks.filtered_by(tags=["foo", "bar"])), [task_foo_bar],
+        )
+        self.assertEqual(
+            list(tasks.filtered_by(tags=["foo", "qux"], tags_match="any")),
+            [task_foo, task_foo_bar, task_qux],
+        )
+
+    def test_tasks_filter_by_tags_no_joins(self):
+        """Filtering by more tags does not add more joins"""
+
+        one_tag = Task.objects.all_visible().filtered_by(tags=["foo"])
+        three_tags = Task.objects.all_visible().filtered_by(tags=["foo", "bar", "qux"])
+        self.assertEqual(
+            str(one_tag.query).count("JOIN"), str(three_tags.query).count("JOIN")
+        )
+
+    def test_tasks_filter_by_created_at(self):
+        """Creation date ranges are inclusive days in the current time zone"""
+
+        user = User.objects.create_user("testuser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+        for title, created_at in [
+            ("Before", "2020-01-14T22:30:00+00:00"),
+            ("First day", "2020-01-14T23:30:00+00:00"),
+            ("Last day", "2020-01-20T22:30:00+00:00"),
+            ("After", "2020-01-20T23:30:00+00:00"),
+        ]:
+            task = Task.objects.create(project=project, created_by=user, title=title)
+            # created_at is set automatically on insert
+            Task.objects.filter(pk=task.pk).update(
+                created_at=datetime.fromisoformat(created_at)
+            )
+
+        with timezone.override("Europe/Budapest"):
+            tasks = Task.objects.filtered_by(
+                created_after=date(2020, 1, 15), created_before=date(2020, 1, 20)
+            )
+            self.assertEqual({task.title for task in tasks}, {"First day", "Last day"})
+
+    def test_tasks_search(self):
+        """Tasks are found by title, description and notes, best matches first"""
+
+        user = User.objects.create_user("testuser", password="test")
+        other_user = User.objects.create_user("otheruser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+        other_project = Project(title="Other Project")
+        other_project.save()
+
+        in_description = Task.objects.create(
+            project=project,
+            created_by=user,
+            title="First",
+            description="Fix the árvíztűrő tükörfúrógép",
+        )
+        in_title = Task.objects.create(
+            project=project, created_by=user, title="Tükörfúrógép repair"
+        )
+        in_note = Task.objects.create(project=project, created_by=user, title="Third")
+        note = Note.objects.create(
+            task=in_note, author=user, body="The tükörfúrógép is broken"
+        )
+        Task.objects.create(
+            project=other_project, created_by=other_user, title="Tükörfúrógép"
+        )
+        Task.objects.create(project=project, created_by=user, title="Unrelated")
+
+        def search(text):
+            return list(
+                Task.objects.visible_to_user(user)
+                .filtered_by(project=project)
+                .all_visible()
+                .search(text)
+            )
+
+        # Accents and case are ignored, words are matched by prefix
+        found = search("TUKORFURO")
+        self.assertEqual(len(found), 3)
+        self.assertEqual(found[0], in_title)
+        self.assertEqual(set(found), {in_title, in_description, in_note})
+
+        # All words must match
+        self.assertEqual(search("fix tükör"), [in_description])
+        self.assertEqual(search("!!!"), search(""))
+
+        # The index is updated when saving and deleting
+        in_title.title = "Something else"
+        in_title.save()
+        note.delete()
+        self.assertEqual(search("tükörfúrógép"), [in_description])
+
     def test_tasks_superusers_see_all(self):
         """Superusers see all tasks"""
 
@@ -209,6 +425,649 @@ class ModelTests(TestCase):
         self.assertEqual(list(tasks), [task])
 
 
+class PaginationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("testuser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+
+        # Every combination of the sort keys, including ties and null due dates
+        for status in ["open", "done", "in_progress"]:
+            for due_date in [None, "2020-01-01", "2020-01-02"]:
+                for priority in [0, 1, 1]:
+                    Task(
+                        project=project,
+                        created_by=user,
+                        title=f"{status} {due_date} {priority}",
+                        status=status,
+                        due_date=due_date,
+                        priority=priority,
+                    ).save()
+
+    def test_cursor_str_parse(self):
+        """Cursors survive a round-trip through query parameters"""
+
+        for cursor in [
+            TaskCursor(3, date(2020, 1, 2), -1, 12),
+            TaskCursor(1, None, 2, 1),
+        ]:
+            self.assertEqual(TaskCursor.parse(str(cursor)), cursor)
+
+    def test_cursor_parse_invalid(self):
+        """Invalid cursors are ignored"""
+
+        for value in [None, "", "1.2.3", "a.2020-01-01.0.1", "1.not-a-date.0.1"]:
+            self.assertIsNone(TaskCursor.parse(value))
+
+    def test_paginate_forward(self):
+        """Walking all pages forward yields all tasks in order"""
+
+        tasks = Task.objects.all_visible()
+        expected = list(tasks)
+
+        seen = []
+        page = paginate_tasks(tasks, per_page=4)
+        self.assertIsNone(page.previous_cursor)
+        seen += page.tasks
+        while page.next_cursor:
+            page = paginate_tasks(tasks, per_page=4, after=page.next_cursor)
+            self.assertIsNotNone(page.previous_cursor)
+            seen += page.tasks
+
+        self.assertEqual(seen, expected)
+
+    def test_paginate_backward(self):
+        """Walking all pages backward from the end yields all tasks in order"""
+
+        tasks = Task.objects.all_visible()
+        expected = list(tasks)
+
+        # A position right after the last task
+        last = TaskCursor.from_task(expected[-1])
+        after_last = last._replace(id=last.id + 1)
+        page = paginate_tasks(tasks, per_page=4, before=after_last)
+        seen = page.tasks
+        while page.previous_cursor:
+            page = paginate_tasks(tasks, per_page=4, before=page.previous_cursor)
+            seen = page.tasks + seen
+
+        self.assertEqual(seen, expected)
+
+
+class ChoicesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_choices_cached(self):
+        """Cached choices are returned without querying the database"""
+
+        user = User.objects.create_user("testuser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+
+        choices = choices_for_user(user)
+        self.assertEqual(choices.projects, [(project.id, "Test Project")])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(choices_for_user(user), choices)
+
+    def test_choices_kept_on_login(self):
+        """Logging in does not invalidate the choices"""
+
+        user = User.objects.create_user("testuser", password="test")
+        choices = choices_for_user(user)
+
+        self.assertTrue(self.client.login(username="testuser", password="test"))
+        with self.assertNumQueries(0):
+            self.assertEqual(choices_for_user(user), choices)
+
+    def test_choices_invalidated(self):
+        """Changing users, projects or memberships invalidates the choices"""
+
+        user = User.objects.create_user("testuser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+        choices_for_user(user)
+
+        project.members.add(user)
+        self.assertEqual(
+            choices_for_user(user).projects, [(project.id, "Test Project")]
+        )
+
+        project.title = "Renamed Project"
+        project.save()
+        self.assertEqual(
+            choices_for_user(user).projects, [(project.id, "Renamed Project")]
+        )
+
+        ProjectMembership.objects.filter(user=user).delete()
+        self.assertEqual(choices_for_user(user).projects, [])
+
+        user.is_superuser = True
+        user.save()
+        self.assertEqual(
+            choices_for_user(user).projects, [(project.id, "Renamed Project")]
+        )
+
+
+class CommandTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_explain_queries(self):
+        """Query plans of the task list queries are printed"""
+
+        user = User.objects.create_user("testuser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+        Task(project=project, created_by=user, title="Test Task").save()
+
+        out = StringIO()
+        call_command("explain_queries", user="testuser", stdout=out)
+        self.assertIn("Task list filtered by project", out.getvalue())
+        self.assertIn("task_project_listing_idx", out.getvalue())
+
+    def test_reconcile_project_stats(self):
+        """Drifted project stats are reported"""
+
+        user = User.objects.create_user("testuser", password="test")
+        project = Project.objects.create(title="Test Project")
+        Task.objects.create(project=project, created_by=user, title="Test Task")
+        Task.objects.update(status="done")
+
+        out = StringIO()
+        call_command("reconcile_project_stats", dry_run=True, stdout=out)
+        self.assertIn(
+            f"Project {project.id} done_count: stored 0, actual 1", out.getvalue()
+        )
+        self.assertIn("2 drifted counts", out.getvalue())
+
+        call_command("reconcile_project_stats", stdout=StringIO())
+        out = StringIO()
+        call_command("reconcile_project_stats", stdout=out)
+        self.assertEqual(out.getvalue(), "No drift\n")
+
+    def test_seed_dataset_and_benchmark(self):
+        """A dataset is generated and the pages are measured on it"""
+
+        call_command(
+            "seed_dataset",
+            users=5,
+            projects=3,
+            memberships=2,
+            tasks=20,
+            tags=5,
+            stdout=StringIO(),
+        )
+        self.assertEqual(User.objects.filter(username__startswith="seed-").count(), 5)
+        self.assertEqual(ProjectMembership.objects.count(), 10)
+        self.assertEqual(Task.objects.count(), 20)
+        for task in Task.objects.all():
+            self.assertEqual(task.status_order, Task.STATUS_ORDER[task.status])
+        self.assertEqual(stats.reconcile(fix=False), [])
+
+        output = os.path.join(self.tmpdir, "benchmark.json")
+        call_command(
+            "benchmark", requests=2, warmup=0, output=output, stdout=StringIO()
+        )
+        with open(output) as file:
+            report = json.load(file)
+        self.assertEqual(report["dataset"]["tasks"], 20)
+        index = report["results"][0]
+        self.assertEqual(index["name"], "index")
+        self.assertEqual(index["requests"], 2)
+        self.assertEqual(index["errors"], 0)
+        # The connection of the test is not closed between requests
+        self.assertEqual(index["connections"], 0)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="test")
+        self.assignee = User.objects.create_user("assignee", password="test")
+        self.project = Project.objects.create(title="Test Project")
+        self.project.members.add(self.user)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def write_csv(self, rows):
+        path = os.path.join(self.tmpdir, "tasks.csv")
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(
+                file, ["project", "title", "status", "assignee", "tags", "due_date"]
+            )
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def test_import_csv(self):
+        """Tasks are imported from CSV, resolving projects, assignees and tags"""
+
+        path = self.write_csv(
+            [
+                {
+                    "project": "Test Project",
+                    "title": "Task 1",
+                    "assignee": "assignee",
+                    "tags": "foo, bar",
+                    "due_date": "2020-01-15",
+                },
+                {
+                    "project": self.project.id,
+                    "title": "Task 2",
+                    "status": "done",
+                    "tags": "foo",
+                },
+            ]
+        )
+
+        out = StringIO()
+        call_command("import_tasks", path, user="testuser", batch_size=1, stdout=out)
+        self.assertIn("Imported 2 tasks", out.getvalue())
+
+        task1 = Task.objects.get(title="Task 1")
+        self.assertEqual(task1.project, self.project)
+        self.assertEqual(task1.assignee, self.assignee)
+        self.assertEqual(task1.created_by, self.user)
+        self.assertEqual(task1.due_date, date(2020, 1, 15))
+        self.assertEqual(set(task1.tags.names()), {"foo", "bar"})
+        task2 = Task.objects.get(title="Task 2")
+        self.assertEqual(task2.status_order, Task.STATUS_ORDER["done"])
+        self.assertEqual(list(task2.tags.names()), ["foo"])
+        self.assertEqual(
+            list(Task.objects.all_visible().search("task")), [task1, task2]
+        )
+
+    def test_import_concurrent_tags(self):
+        """Tags created by a concurrent import after the lookup are reused"""
+
+        path = self.write_csv(
+            [{"project": "Test Project", "title": "Task 1", "tags": "foo"}]
+        )
+        tag = Tag.objects.create(name="foo")
+
+        # Not found by the lookup, like if created in the meantime
+        with mock.patch.object(Tag.objects, "filter", return_value=Tag.objects.none()):
+            call_command("import_tasks", path, user="testuser", stdout=StringIO())
+
+        self.assertEqual(list(Task.objects.get().tags.all()), [tag])
+
+    def test_import_resume(self):
+        """Failed imports stop at the invalid batch and can be resumed"""
+
+        rows = [
+            {"project": "Test Project", "title": "Task 1"},
+            {"project": "Test Project", "title": "Task 2"},
+            {"project": "Other Project", "title": "Task 3"},
+            {"project": "Test Project", "title": "Task 4", "assignee": "nobody"},
+            {"project": "Test Project", "title": ""},
+        ]
+        path = self.write_csv(rows)
+
+        err = StringIO()
+        with self.assertRaisesMessage(CommandError, "resume with --skip 2"):
+            call_command(
+                "import_tasks",
+                path,
+                user="testuser",
+                batch_size=2,
+                stdout=StringIO(),
+                stderr=err,
+            )
+        self.assertEqual(
+            list(Task.objects.values_list("title", flat=True)), ["Task 1", "Task 2"]
+        )
+        self.assertIn("Row 3, project:", err.getvalue())
+        self.assertIn("Row 4, assignee:", err.getvalue())
+
+        rows[2]["project"] = "Test Project"
+        rows[3]["assignee"] = ""
+        rows[4]["title"] = "Task 5"
+        path = self.write_csv(rows)
+        call_command(
+            "import_tasks",
+            path,
+            user="testuser",
+            batch_size=2,
+            skip=2,
+            stdout=StringIO(),
+        )
+        self.assertEqual(
+            list(Task.objects.order_by("id").values_list("title", flat=True)),
+            ["Task 1", "Task 2", "Task 3", "Task 4", "Task 5"],
+        )
+
+    def test_import_view(self):
+        """Exported JSON can be uploaded to import the tasks again"""
+
+        self.user.user_permissions.add(Permission.objects.get(codename="add_task"))
+        task = Task.objects.create(
+            project=self.project,
+            created_by=self.user,
+            assignee=self.assignee,
+            title="Exported Task",
+        )
+        task.tags.add("foo")
+
+        self.client.login(username="testuser", password="test")
+        response = self.client.get("/tasks/export.json")
+        exported = b"".join(response.streaming_content)
+
+        response = self.client.get("/tasks/import")
+        self.assertEqual(response.status_code, 200)
+
+        upload = SimpleUploadedFile("tasks.json", exported)
+        response = self.client.post("/tasks/import", {"file": upload})
+        self.assertContains(response, "Imported 1 tasks")
+
+        imported = Task.objects.exclude(pk=task.pk).get()
+        self.assertEqual(imported.title, "Exported Task")
+        self.assertEqual(imported.assignee, self.assignee)
+        self.assertEqual(list(imported.tags.names()), ["foo"])
+
+        upload = SimpleUploadedFile("tasks.csv", b"project,title\nNope,Task\n")
+        response = self.client.post("/tasks/import", {"file": upload})
+        self.assertEqual(response.status_code, 400)
+        self.assertContains(response, "Row 1, project:", status_code=400)
+        self.assertContains(response, 'name="skip" value="0"', status_code=400)
+
+    def test_import_invalid_json(self):
+        """JSON other than a list of tasks is reported as unreadable"""
+
+        self.user.user_permissions.add(Permission.objects.get(codename="add_task"))
+        self.client.login(username="testuser", password="test")
+
+        for content in (
+            b"[1, 2]",
+            b'{"a": 1}',
+            b'"x"',
+            b'[{"project": "Test Project", "title": "Task", "tags": [1]}]',
+        ):
+            with self.subTest(content=content):
+                upload = SimpleUploadedFile("tasks.json", content)
+                response = self.client.post("/tasks/import", {"file": upload})
+                self.assertContains(
+                    response, "The file could not be read", status_code=400
+                )
+        self.assertFalse(Task.objects.exists())
+
+    def test_import_permission(self):
+        """Importing requires the permission to add tasks"""
+
+        self.client.login(username="testuser", password="test")
+        response = self.client.get("/tasks/import")
+        self.assertEqual(response.status_code, 302)
+
+
+class ProjectStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="test")
+        self.project = Project.objects.create(title="Test Project")
+        self.today = timezone.localdate()
+
+    def counts(self):
+        return stats.project_counts([self.project.id])[self.project.id]
+
+    def test_task_changes(self):
+        """Saving, archiving and deleting tasks updates the counts"""
+
+        overdue = Task.objects.create(
+            project=self.project,
+            created_by=self.user,
+            title="Overdue",
+            due_date=self.today - timedelta(days=1),
+        )
+        task = Task.objects.create(
+            project=self.project,
+            created_by=self.user,
+            title="Task",
+            status="in_progress",
+            due_date=self.today,
+        )
+        self.assertEqual(self.counts(), (1, 1, 0, 0, 1))
+
+        overdue = Task.objects.get(pk=overdue.pk)
+        overdue.status = "done"
+        overdue.save()
+        self.assertEqual(self.counts(), (0, 1, 1, 0, 0))
+
+        task = Task.objects.only("id", "version", "status").get(pk=task.pk)
+        task.status = "open"
+        task.save(update_fields=["status"])
+        self.assertEqual(self.counts(), (1, 0, 1, 0, 0))
+
+        task = Task.objects.get(pk=task.pk)
+        task.is_archived = True
+        task.due_date = self.today - timedelta(days=2)
+        task.save()
+        self.assertEqual(self.counts(), (0, 0, 1, 1, 0))
+
+        Task.objects.get(pk=overdue.pk).delete()
+        self.assertEqual(self.counts(), (0, 0, 0, 1, 0))
+        self.assertEqual(stats.reconcile(fix=False), [])
+
+    def test_bulk_change_and_import(self):
+        """Bulk changes and imports bypassing save() update the counts"""
+
+        self.project.members.add(self.user)
+        imports.import_tasks(
+            [
+                {"project": "Test Project", "title": "Task 1"},
+                {
+                    "project": "Test Project",
+                    "title": "Task 2",
+                    "due_date": str(self.today - timedelta(days=1)),
+                },
+            ],
+            self.user,
+        )
+        self.assertEqual(self.counts(), (2, 0, 0, 0, 1))
+
+        versions = dict(Task.objects.values_list("id", "version"))
+        bulk_change(self.user, versions, "status", "done")
+        self.assertEqual(self.counts(), (0, 0, 2, 0, 0))
+
+        versions = dict(Task.objects.values_list("id", "version"))
+        bulk_change(self.user, versions, "archive")
+        self.assertEqual(self.counts(), (0, 0, 0, 2, 0))
+        self.assertEqual(stats.reconcile(fix=False), [])
+
+    def test_reconcile(self):
+        """Counts changed behind the back of the models are reported and fixed"""
+
+        Task.objects.create(
+            project=self.project,
+            created_by=self.user,
+            title="Task",
+            due_date=self.today - timedelta(days=1),
+        )
+        Task.objects.update(status="in_progress", due_date=self.today)
+
+        drifts = stats.reconcile()
+        self.assertEqual(
+            drifts,
+            [
+                stats.Drift(
+                    self.project.id, f"due {self.today - timedelta(days=1)}", 1, 0
+                ),
+                stats.Drift(self.project.id, f"due {self.today}", 0, 1),
+                stats.Drift(self.project.id, "in_progress_count", 0, 1),
+                stats.Drift(self.project.id, "open_count", 1, 0),
+            ],
+        )
+        self.assertEqual(self.counts(), (0, 1, 0, 0, 0))
+        self.assertEqual(stats.reconcile(), [])
+
+    def test_with_task_counts(self):
+        """The project choices are labelled with the unfinished and overdue counts"""
+
+        Task.objects.create(
+            project=self.project,
+            created_by=self.user,
+            title="Task",
+            due_date=self.today - timedelta(days=1),
+        )
+        Task.objects.create(
+            project=self.project, created_by=self.user, title="Task", status="done"
+        )
+        self.assertEqual(
+            stats.with_task_counts([(self.project.id, "Test Project")]),
+            [(self.project.id, "Test Project (1, 1 overdue)")],
+        )
+
+
+class RowCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("testuser", password="test")
+        self.project = Project.objects.create(title="Test Project")
+        for i in range(3):
+            Task.objects.create(
+                project=self.project, created_by=self.user, title=f"Task {i}"
+            )
+
+    @staticmethod
+    def render():
+        before = row_cache.counters.copy()
+        rows = row_cache.render_rows(list(Task.objects.all_visible()))
+        counters = row_cache.counters - before
+        return rows, counters["hits"], counters["misses"]
+
+    def test_changed_rows_rerendered(self):
+        """Only the rows of changed tasks are rendered again"""
+
+        rows, hits, misses = self.render()
+        self.assertEqual((hits, misses), (0, 3))
+        self.assertIn("Task 0", rows[0])
+
+        rows, hits, misses = self.render()
+        self.assertEqual((hits, misses), (3, 0))
+
+        task = Task.objects.get(title="Task 0")
+        task.title = "Changed Task"
+        task.save()
+        rows, hits, misses = self.render()
+        self.assertEqual((hits, misses), (2, 1))
+        self.assertIn("Changed Task", "".join(rows))
+
+        self.project.title = "Renamed Project"
+        self.project.save()
+        rows, hits, misses = self.render()
+        self.assertEqual((hits, misses), (0, 3))
+        self.assertIn("Renamed Project", rows[0])
+
+    def test_language(self):
+        """Rows are cached per language"""
+
+        self.render()
+        with translation.override("hu"):
+            rows, hits, misses = self.render()
+        self.assertEqual((hits, misses), (0, 3))
+        self.assertIn("NYITOTT", rows[0])
+
+
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user("testuser", password="test")
+        project = Project.objects.create(title="Test Project")
+        project.members.add(user)
+        Task.objects.create(project=project, created_by=user, title="Test Task")
+        self.client.login(username="testuser", password="test")
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+    def test_sampled(self):
+        """Sampled requests are timed"""
+
+        with self.assertLogs("minitask.timing"):
+            self.client.get("/")
+        with self.assertLogs("minitask.timing") as logs:
+            response = self.client.get("/")
+
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", '
+            r'template;dur=[\d.]+, cache;desc="2 hits, 0 misses"$',
+        )
+        self.assertEqual(len(logs.records), 1)
+        timing = logs.records[0].timing
+        self.assertEqual(timing["view"], "index")
+        self.assertEqual(timing["status"], 200)
+        self.assertGreater(timing["db_queries"], 0)
+        self.assertGreater(timing["template_ms"], 0)
+        self.assertEqual((timing["cache_hits"], timing["cache_misses"]), (2, 0))
+        self.assertIn("method=GET path=/ view=index status=200", logs.output[0])
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        """Requests not sampled are not timed"""
+
+        response = self.client.get("/")
+
+        self.assertNotIn("Server-Timing", response)
+
+
+class QueryInspectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("testuser", password="test")
+        self.project = Project.objects.create(title="Test Project")
+        self.project.members.add(self.user)
+        for i in range(3):
+            Task.objects.create(
+                project=self.project, created_by=self.user, title=f"Task {i}"
+            )
+
+    @override_settings(DUPLICATE_QUERY_THRESHOLD=3)
+    def test_duplicate_queries(self):
+        """Repeated queries are attributed to the code or template making them"""
+
+        tasks = list(Task.objects.all())
+        template = Template(
+            "{% for task in tasks %}{{ task.project.title }}{% endfor %}"
+        )
+        inspector = query_inspection.QueryInspector()
+        with connection.execute_wrapper(inspector):
+            for task in tasks:
+                Task.objects.get(pk=task.pk)
+            template.render(TemplateContext({"tasks": tasks}))
+
+        findings = inspector.findings()
+        locations = sorted(finding.location for finding in findings)
+        self.assertEqual(locations[0], "<unknown source>:1 task.project.title")
+        self.assertRegex(locations[1], r"^tasks/tests.py:\d+ test_duplicate_queries$")
+        self.assertEqual(sorted(queries for queries, _ in findings.values()), [3, 3])
+
+    @override_settings(QUERY_INSPECTION_SAMPLE_RATE=1, SLOW_QUERY_MS=0)
+    def test_report(self):
+        """Findings of the sampled requests are reported"""
+
+        client = Client()
+        client.login(username="testuser", password="test")
+        client.get("/")
+        client.get("/")
+
+        finding = QueryFinding.objects.filter(
+            view="index", location__startswith="tasks/pagination.py:"
+        ).first()
+        self.assertEqual(finding.kind, "slow")
+        self.assertEqual(finding.requests, 2)
+
+        out = StringIO()
+        call_command("query_report", kind="slow", stdout=out)
+        self.assertIn(f"slow index {finding.location}", out.getvalue())
+        self.assertIn("2 requests", out.getvalue())
+
+        finding.day -= timedelta(days=7)
+        finding.save()
+        out = StringIO()
+        call_command("query_report", prune=True, stdout=out)
+        self.assertIn("1 old findings deleted", out.getvalue())
+
+
 class ViewsTests(TransactionTestCase):
     def test_index_unauthenticated(self):
         """Index redirects to login when unauthenticated"""
@@ -259,12 +1118,90 @@ class ViewsTests(TransactionTestCase):
 
         response = client.get(f"/?project={project1.id}")
         self.assertInHTML(
-            f"<option value='{project1.id}' selected>Test Project 1</option>",
+            f"<option value='{project1.id}' selected>Test Project 1 (1)</option>",
             response.content.decode("utf-8"),
         )
         self.assertContains(response, "Test Task 1")
         self.assertNotContains(response, "Test Task 2")
 
+    def test_index_not_modified(self):
+        """Reloading an unchanged task list is answered with 304"""
+
+        user = User.objects.create_user("testuser", password="test", is_superuser=True)
+        project = Project.objects.create(title="Test Project")
+        task = Task.objects.create(project=project, created_by=user, title="Task 1")
+        other = Task.objects.create(project=project, created_by=user, title="Task 2")
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        response = client.get("/?status=open")
+        etag = response["ETag"]
+        response = client.get("/?status=open", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Other filters are other lists
+        response = client.get("/?status=done", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        task.title = "Changed"
+        task.save()
+        response = client.get("/?status=open", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Changed")
+        etag = response["ETag"]
+
+        other.delete()
+        response = client.get("/?status=open", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "Task 2")
+
+    @override_settings(TASKS_PER_PAGE=1)
+    def test_index_not_modified_other_page(self):
+        """Changes of tasks on other pages do not change the page"""
+
+        user = User.objects.create_user("testuser", password="test", is_superuser=True)
+        project = Project.objects.create(title="Test Project")
+        Task.objects.create(project=project, created_by=user, title="Task 1")
+        other = Task.objects.create(project=project, created_by=user, title="Task 2")
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        etag = client.get("/")["ETag"]
+        other.title = "Changed"
+        other.save()
+        response = client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_not_modified(self):
+        """Reloading an unchanged task is answered with 304"""
+
+        user = User.objects.create_user("testuser", password="test", is_superuser=True)
+        project = Project.objects.create(title="Test Project")
+        task = Task.objects.create(project=project, created_by=user, title="Task")
+        note = Note.objects.create(task=task, author=user, body="Note")
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        etag = client.get(f"/tasks/{task.id}")["ETag"]
+        response = client.get(f"/tasks/{task.id}", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        note.body = "Changed note"
+        note.save()
+        response = client.get(f"/tasks/{task.id}", HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Changed note")
+        etag = response["ETag"]
+
+        Note.objects.create(task=task, author=user, body="Another note")
+        response = client.get(f"/tasks/{task.id}", HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Another note")
+
+        response = client.get("/tasks/0", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
     def test_index_no_archived_tasks(self):
         """Archived tasks are not shown"""
 
@@ -403,6 +1340,297 @@ class ViewsTests(TransactionTestCase):
         self.assertNotContains(response, "Test Task 1")
         self.assertContains(response, "Test Task 2")
 
+        response = client.get("/?tags=foo,qux&tags_match=any")
+        self.assertContains(response, "Test Task 1")
+        self.assertContains(response, "Test Task 2")
+
+        response = client.get("/?tags=foo,qux&tags_match=all")
+        self.assertNotContains(response, "Test Task 1")
+        self.assertNotContains(response, "Test Task 2")
+
+    def test_index_filter_by_created_at(self):
+        """Tasks can be filtered by creation date, stepping the interval"""
+
+        user = User.objects.create_user("testuser", password="test", is_superuser=True)
+
+        project = Project(title="Test Project")
+        project.save()
+        for title, created_at in [
+            ("Test Task 1", "2020-01-15T12:00:00+00:00"),
+            ("Test Task 2", "2020-01-22T12:00:00+00:00"),
+        ]:
+            task = Task.objects.create(project=project, created_by=user, title=title)
+            Task.objects.filter(pk=task.pk).update(
+                created_at=datetime.fromisoformat(created_at)
+            )
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        response = client.get("/?created_after=2020-01-15&created_before=2020-01-21")
+        self.assertContains(response, "Test Task 1")
+        self.assertNotContains(response, "Test Task 2")
+        self.assertContains(response, 'name="next_created_at"')
+        self.assertNotContains(response, 'name="next_due_date"')
+
+        response = client.get(
+            "/?created_after=2020-01-15&created_before=2020-01-21&next_created_at="
+        )
+        self.assertNotContains(response, "Test Task 1")
+        self.assertContains(response, "Test Task 2")
+        self.assertContains(response, 'value="2020-01-22"')
+
+    def test_index_search(self):
+        """Tasks can be searched"""
+
+        user = User.objects.create_user("testuser", password="test", is_superuser=True)
+
+        project = Project(title="Test Project")
+        project.save()
+        Task.objects.create(project=project, created_by=user, title="Test Task 1")
+        task = Task.objects.create(project=project, created_by=user, title="Second")
+        Note.objects.create(task=task, author=user, body="Test Task 2 notes")
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        response = client.get("/?q=notes")
+        self.assertNotContains(response, "Test Task 1")
+        self.assertContains(response, "Second")
+        self.assertContains(response, 'value="notes"')
+
+    def test_export(self):
+        """Filtered tasks are exported as CSV and JSON"""
+
+        user = User.objects.create_user(
+            "testuser", password="test", first_name="Test", last_name="User"
+        )
+
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+        task = Task.objects.create(
+            project=project,
+            created_by=user,
+            assignee=user,
+            title="Test Task 1",
+            due_date=date(2020, 1, 15),
+        )
+        task.tags.add("foo", "bar")
+        Task.objects.create(project=project, created_by=user, title="Test Task 2")
+        Task.objects.create(
+            project=project, created_by=user, title="Done Task", status="done"
+        )
+        other_project = Project(title="Other Project")
+        other_project.save()
+        Task.objects.create(project=other_project, created_by=user, title="Hidden")
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        response = client.get("/tasks/export.csv?status=open")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="tasks.csv"'
+        )
+        rows = list(
+            csv.reader(
+                b"".join(response.streaming_content).decode("utf-8-sig").splitlines()
+            )
+        )
+        self.assertEqual(rows[0][:4], ["ID", "Project", "Title", "Status"])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(
+            rows[1][1:8],
+            [
+                "Test Project",
+                "Test Task 1",
+                "open",
+                "normal",
+                "Test User",
+                "bar, foo",
+                "2020-01-15",
+            ],
+        )
+
+        response = client.get("/tasks/export.json?tags=foo")
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["title"], "Test Task 1")
+        self.assertEqual(data[0]["tags"], ["bar", "foo"])
+        self.assertEqual(data[0]["assignee"], {"id": user.id, "name": "Test User"})
+
+        response = client.get("/tasks/export.json?tags=none")
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), [])
+
+        response = client.get("/tasks/export.xml")
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_edit(self):
+        """Many tasks are changed at once, reporting version conflicts"""
+
+        user = User.objects.create_user("testuser", password="test")
+        user.user_permissions.add(Permission.objects.get(codename="change_task"))
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+        task1 = Task.objects.create(project=project, created_by=user, title="Task 1")
+        task1.tags.add("foo")
+        task2 = Task.objects.create(project=project, created_by=user, title="Task 2")
+        changed = Task.objects.create(project=project, created_by=user, title="Task 3")
+        hidden = Task.objects.create(
+            project=Project.objects.create(title="Other Project"),
+            created_by=user,
+            title="Hidden",
+        )
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        stale_version = changed.version
+        changed.title = "Changed"
+        changed.save()
+
+        response = client.post(
+            "/tasks/bulk",
+            {
+                "tasks": [
+                    f"{task1.id}:{task1.version}",
+                    f"{task2.id}:{task2.version}",
+                    f"{changed.id}:{stale_version}",
+                    f"{hidden.id}:{hidden.version}",
+                ],
+                "action": "status",
+                "status": "in_progress",
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "updated": [task1.id, task2.id],
+                "conflicts": [changed.id],
+                "not_found": [hidden.id],
+            },
+        )
+        for task in (task1, task2):
+            updated = Task.objects.get(pk=task.pk)
+            self.assertEqual(updated.status, "in_progress")
+            self.assertEqual(updated.status_order, Task.STATUS_ORDER["in_progress"])
+            self.assertEqual(updated.version, task.version + 1)
+        self.assertEqual(Task.objects.get(pk=changed.pk).status, "open")
+
+        task1.refresh_from_db()
+        task2.refresh_from_db()
+        response = client.post(
+            "/tasks/bulk",
+            {
+                "tasks": [f"{task1.id}:{task1.version}", f"{task2.id}:{task2.version}"],
+                "action": "add_tags",
+                "tags": "foo, bar",
+            },
+        )
+        self.assertEqual(response.json()["updated"], [task1.id, task2.id])
+        self.assertEqual(set(task1.tags.names()), {"foo", "bar"})
+        self.assertEqual(set(task2.tags.names()), {"foo", "bar"})
+
+        task1.refresh_from_db()
+        response = client.post(
+            "/tasks/bulk",
+            {
+                "tasks": [f"{task1.id}:{task1.version}"],
+                "action": "remove_tags",
+                "tags": "foo",
+            },
+        )
+        self.assertEqual(set(task1.tags.names()), {"bar"})
+
+        task1.refresh_from_db()
+        response = client.post(
+            "/tasks/bulk",
+            {
+                "tasks": [f"{task1.id}:{task1.version}"],
+                "action": "assignee",
+                "assignee": user.id,
+            },
+        )
+        self.assertEqual(Task.objects.get(pk=task1.pk).assignee, user)
+
+    def test_bulk_edit_invalid(self):
+        """Bulk changes are validated and permission checked"""
+
+        user = User.objects.create_user("testuser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+        task = Task.objects.create(project=project, created_by=user, title="Task")
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        response = client.post(
+            "/tasks/bulk", {"tasks": ["foo"], "action": "status", "status": "done"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("tasks", response.json()["errors"])
+
+        response = client.post(
+            "/tasks/bulk", {"tasks": [f"{task.id}:{task.version}"], "action": "status"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("status", response.json()["errors"])
+
+        for action in ("archive", "assignee"):
+            response = client.post(
+                "/tasks/bulk",
+                {"tasks": [f"{task.id}:{task.version}"], "action": action},
+            )
+            self.assertEqual(response.status_code, 403)
+        self.assertFalse(Task.objects.get(pk=task.pk).is_archived)
+
+        response = client.get("/tasks/bulk")
+        self.assertEqual(response.status_code, 405)
+
+    @override_settings(TASKS_PER_PAGE=2)
+    def test_index_pagination(self):
+        """The task list is paginated, retaining the filters"""
+
+        user = User.objects.create_user("testuser", password="test", is_superuser=True)
+
+        project = Project(title="Test Project")
+        project.save()
+        for i in range(3):
+            Task(
+                project=project, created_by=user, title=f"Test Task {i}", priority=-i
+            ).save()
+        other_project = Project(title="Other Project")
+        other_project.save()
+        Task(project=other_project, created_by=user, title="Other Task").save()
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        response = client.get(f"/?project={project.id}")
+        self.assertContains(response, "Test Task 0")
+        self.assertContains(response, "Test Task 1")
+        self.assertNotContains(response, "Test Task 2")
+        self.assertNotContains(response, "Other Task")
+        next_page_query = response.context["next_page_query"]
+        self.assertIn(f"project={project.id}", next_page_query)
+        self.assertIsNone(response.context["previous_page_query"])
+
+        response = client.get("/" + next_page_query)
+        self.assertNotContains(response, "Test Task 0")
+        self.assertNotContains(response, "Test Task 1")
+        self.assertContains(response, "Test Task 2")
+        self.assertNotContains(response, "Other Task")
+        self.assertIsNone(response.context["next_page_query"])
+
+        response = client.get("/" + response.context["previous_page_query"])
+        self.assertContains(response, "Test Task 0")
+        self.assertContains(response, "Test Task 1")
+        self.assertNotContains(response, "Test Task 2")
+
     def test_index_filter_detail_sticky(self):
         """Filter is retained when returning from the details page"""
 
@@ -487,6 +1715,19 @@ class ViewsTests(TransactionTestCase):
                 response.content.decode("utf-8"),
             )
 
+    def test_new_assignee_not_rendered(self):
+        """Assignee options are not rendered, they are loaded on demand"""
+
+        User.objects.create_user("testuser", password="test")
+        User.objects.create_user("otheruser", password="test")
+
+        client = Client()
+        client.login(username="testuser", password="test")
+        response = client.get("/tasks/new")
+
+        self.assertContains(response, 'data-assignee-picker="/assignees"')
+        self.assertNotContains(response, "otheruser")
+
     def test_new_back_to_referer(self):
         """New task form links back to previous page"""
 
@@ -782,6 +2023,62 @@ class ViewsTests(TransactionTestCase):
         # Archive button
         self.assertContains(response, 'name="is_archived"')
 
+    def test_detail_notes_queries(self):
+        """The number of queries does not depend on the number of notes"""
+
+        user = User.objects.create_user("testuser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+        task = Task(project=project, created_by=user, assignee=user, title="Task")
+        task.save()
+        task.tags.add("foo", "bar")
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        def add_notes(count):
+            for i in range(count):
+                author = User.objects.create_user(f"author{Note.objects.count()}")
+                Note(task=task, author=author, body=f"Note {i}").save()
+
+        add_notes(1)
+        with CaptureQueriesContext(connection) as one_note:
+            client.get(f"/tasks/{task.id}")
+
+        add_notes(10)
+        with CaptureQueriesContext(connection) as many_notes:
+            response = client.get(f"/tasks/{task.id}")
+
+        self.assertContains(response, "author10")
+        self.assertEqual(len(one_note), len(many_notes))
+
+    @override_settings(NOTES_PER_PAGE=2)
+    def test_detail_latest_notes(self):
+        """Only the latest notes are shown unless more are requested"""
+
+        user = User.objects.create_user("testuser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+        task = Task(project=project, created_by=user, title="Task")
+        task.save()
+        for i in range(3):
+            Note(task=task, author=user, body=f"Test note {i}").save()
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        response = client.get(f"/tasks/{task.id}")
+        self.assertNotContains(response, "Test note 0")
+        self.assertContains(response, "Test note 1")
+        self.assertContains(response, "Test note 2")
+        self.assertContains(response, f"/tasks/{task.id}?notes=4#notes")
+
+        response = client.get(f"/tasks/{task.id}?notes=4")
+        self.assertContains(response, "Test note 0")
+        self.assertNotContains(response, "?notes=")
+
     def test_detail_no_delete_task_permission(self):
         """Task details has no Archive button if the user does not have delete_task permission"""
 
@@ -1137,46 +2434,165 @@ class ViewsTests(TransactionTestCase):
         project = Project(title="Test Project")
         project.save()
         project.members.add(user)
-
+
+        task = Task(project=project, created_by=user, title="Test Task")
+        task.save()
+
+        client = Client()
+        client.login(username="testuser", password="test")
+        client.post(
+            "/tasks/" + str(task.id) + "/archive",
+            {"version": "0", "is_archived": "true"},
+        )
+
+        # self.assertEqual(response.status_code, 404)
+        task.refresh_from_db()
+        self.assertEqual(task.is_archived, False)
+
+    def test_archive_post(self):
+        """Task is archived"""
+
+        user = User.objects.create_user("testuser", password="test")
+        user.user_permissions.add(Permission.objects.get(codename="delete_task"))
+
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+
+        task = Task(
+            project=project, created_by=user, title="Test Task", is_archived=False,
+        )
+        task.save()
+
+        client = Client()
+        client.login(username="testuser", password="test")
+        response = client.post(
+            "/tasks/" + str(task.id) + "/archive",
+            {"version": "0", "is_archived": "true"},
+        )
+
+        self.assertRedirects(response, "/tasks/" + str(task.id), 302)
+        task.refresh_from_db()
+        self.assertEqual(task.is_archived, True)
+
+    def test_patch_fields(self):
+        """Single fields are changed with PATCH"""
+
+        user = User.objects.create_user("testuser", password="test")
+
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+        task = Task(project=project, created_by=user, title="Test Task")
+        task.save()
+
+        client = Client()
+        client.login(username="testuser", password="test")
+        response = client.patch(
+            f"/tasks/{task.id}/fields",
+            {"version": 0, "status": "done"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.json(), {"id": task.id, "version": 1})
+        task.refresh_from_db()
+        self.assertEqual(task.status, "done")
+        self.assertEqual(task.status_order, Task.STATUS_ORDER["done"])
+        self.assertEqual(task.version, 1)
+        self.assertEqual(task.title, "Test Task")
+        counts = stats.project_counts([project.id])[project.id]
+        self.assertEqual((counts.open, counts.done), (0, 1))
+
+        # The stale version is rejected
+        response = client.patch(
+            f"/tasks/{task.id}/fields",
+            {"version": 0, "status": "open"},
+            content_type="application/json",
+        )
+
+        self.assertContains(response, "The task has been modified", status_code=409)
+        task.refresh_from_db()
+        self.assertEqual(task.status, "done")
+
+    def test_patch_fields_permissions(self):
+        """Fields other than status need the change_task permission"""
+
+        user = User.objects.create_user("testuser", password="test")
+
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
         task = Task(project=project, created_by=user, title="Test Task")
         task.save()
+        other_task = Task(
+            project=Project.objects.create(title="Other Project"),
+            created_by=user,
+            title="Other Task",
+        )
+        other_task.save()
 
         client = Client()
         client.login(username="testuser", password="test")
-        client.post(
-            "/tasks/" + str(task.id) + "/archive",
-            {"version": "0", "is_archived": "true"},
+        response = client.patch(
+            f"/tasks/{task.id}/fields",
+            {"version": 0, "priority": 1},
+            content_type="application/json",
         )
+        self.assertEqual(response.status_code, 403)
 
-        # self.assertEqual(response.status_code, 404)
+        response = client.patch(
+            f"/tasks/{other_task.id}/fields",
+            {"version": 0, "status": "done"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+
+        user.user_permissions.add(Permission.objects.get(codename="change_task"))
+        response = client.patch(
+            f"/tasks/{task.id}/fields",
+            {"version": 0, "priority": 1, "due_date": "2020-01-02"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
         task.refresh_from_db()
-        self.assertEqual(task.is_archived, False)
+        self.assertEqual(task.priority, 1)
+        self.assertEqual(task.due_date, date(2020, 1, 2))
 
-    def test_archive_post(self):
-        """Task is archived"""
+    def test_patch_fields_invalid(self):
+        """Invalid changes are rejected with errors"""
 
         user = User.objects.create_user("testuser", password="test")
-        user.user_permissions.add(Permission.objects.get(codename="delete_task"))
 
         project = Project(title="Test Project")
         project.save()
         project.members.add(user)
-
-        task = Task(
-            project=project, created_by=user, title="Test Task", is_archived=False,
-        )
+        task = Task(project=project, created_by=user, title="Test Task")
         task.save()
 
         client = Client()
         client.login(username="testuser", password="test")
-        response = client.post(
-            "/tasks/" + str(task.id) + "/archive",
-            {"version": "0", "is_archived": "true"},
+
+        response = client.patch(
+            f"/tasks/{task.id}/fields", {"version": 0}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("__all__", response.json()["errors"])
+
+        response = client.patch(
+            f"/tasks/{task.id}/fields",
+            {"version": 0, "status": "nope"},
+            content_type="application/json",
         )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("status", response.json()["errors"])
+
+        response = client.patch(
+            f"/tasks/{task.id}/fields", "[]", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
 
-        self.assertRedirects(response, "/tasks/" + str(task.id), 302)
         task.refresh_from_db()
-        self.assertEqual(task.is_archived, True)
+        self.assertEqual(task.version, 0)
 
     def test_create_note_unauthenticated(self):
         """Creating note redirects to login when unauthenticated"""
@@ -1356,6 +2772,57 @@ class ViewsTests(TransactionTestCase):
 
         self.assertEqual(response.status_code, 404)
 
+    def test_assignees(self):
+        """Assignees are members of the visible projects, filtered by prefix"""
+
+        user = User.objects.create_user("testuser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+        project.members.add(user)
+
+        alice = User.objects.create_user("alice", first_name="Alice")
+        albert = User.objects.create_user("albert", last_name="Albert")
+        bob = User.objects.create_user("bob")
+        project.members.add(alice, albert, bob)
+        User.objects.create_user("alfred")
+        other_project = Project(title="Other Project")
+        other_project.save()
+        other_project.members.add(user)
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        response = client.get("/assignees?q=al")
+        self.assertEqual(
+            response.json()["results"],
+            [{"id": albert.id, "text": "Albert"}, {"id": alice.id, "text": "Alice"}],
+        )
+
+        response = client.get("/assignees?q=al&limit=1")
+        self.assertEqual(len(response.json()["results"]), 1)
+        response = client.get("/assignees?q=al&limit=-1")
+        self.assertEqual(len(response.json()["results"]), 1)
+
+        response = client.get(f"/assignees?project={other_project.id}")
+        self.assertEqual(
+            response.json()["results"], [{"id": user.id, "text": "testuser"}]
+        )
+
+    def test_assignees_not_member(self):
+        """Assignees of projects not visible to the user are not found"""
+
+        User.objects.create_user("testuser", password="test")
+        project = Project(title="Test Project")
+        project.save()
+
+        client = Client()
+        client.login(username="testuser", password="test")
+
+        response = client.get(f"/assignees?project={project.id}")
+        self.assertEqual(response.status_code, 404)
+        response = client.get("/assignees?project=foo")
+        self.assertEqual(response.status_code, 404)
+
 
 class ViewTestsWithTransaction(TransactionTestCase):
     """
@@ -1452,3 +2919,813 @@ class ViewTestsWithTransaction(TransactionTestCase):
         self.assertContains(response, "The task has been modified", status_code=409)
         updated_task = Task.objects.get(pk=task.id)
         self.assertEqual(updated_task.is_archived, True)
+
+
+def metric_sample(name: str) -> float:
+    """Value of a sample in the metrics, eg. 'name{label="value"}'"""
+
+    for line in metrics.exposition().splitlines():
+        if line.startswith(name + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0
+
+
+class MetricsTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="test")
+        self.user.user_permissions.add(
+            *Permission.objects.filter(codename__in=["change_task", "delete_task"])
+        )
+        self.project = Project.objects.create(title="Test Project")
+        self.project.members.add(self.user)
+        self.task = Task.objects.create(
+            project=self.project, created_by=self.user, title="Test Task"
+        )
+        self.client.login(username="testuser", password="test")
+
+    def test_requests(self):
+        """Request latencies are observed by URL name"""
+
+        count = metric_sample('minitask_request_duration_seconds_count{view="index"}')
+        self.client.get("/")
+
+        self.assertEqual(
+            metric_sample('minitask_request_duration_seconds_count{view="index"}'),
+            count + 1,
+        )
+        self.assertEqual(
+            metric_sample(
+                'minitask_request_duration_seconds_bucket{view="index",le="+Inf"}'
+            ),
+            count + 1,
+        )
+        # The test client keeps the connection open
+        self.assertEqual(
+            metric_sample('minitask_db_connections{database="default"}'), 1
+        )
+
+    def test_connections_closed(self):
+        """Connections are counted after the ones not kept are closed"""
+
+        self.client.get("/")
+        # The test client connects close_old_connections again after each
+        # request, connect the metrics after it like when serving
+        # pylint: disable=protected-access
+        request_finished.disconnect(metrics._on_request_finished)
+        request_finished.connect(metrics._on_request_finished)
+
+        # The in-memory test database is never closed, pretend it was
+        def close():
+            connection.connection = None
+
+        self.addCleanup(setattr, connection, "connection", connection.connection)
+        with mock.patch.object(connection, "close_if_unusable_or_obsolete", close):
+            request_finished.send(sender=self.__class__)
+
+        self.assertEqual(
+            metric_sample('minitask_db_connections{database="default"}'), 0
+        )
+
+    def test_task_updates(self):
+        """Task changes and concurrent updates are counted"""
+
+        created = metric_sample('minitask_task_changes_total{type="created"}')
+        archived = metric_sample('minitask_task_changes_total{type="archived"}')
+        saved = metric_sample(
+            'minitask_task_updates_total{view="archive",result="saved"}'
+        )
+        conflicts = metric_sample(
+            'minitask_task_updates_total{view="archive",result="conflict"}'
+        )
+
+        Task.objects.create(
+            project=self.project, created_by=self.user, title="Other Task"
+        )
+        for _ in range(2):
+            self.client.post(
+                f"/tasks/{self.task.id}/archive", {"version": 0, "is_archived": "true"}
+            )
+
+        self.assertEqual(
+            metric_sample('minitask_task_changes_total{type="created"}'), created + 1
+        )
+        self.assertEqual(
+            metric_sample('minitask_task_changes_total{type="archived"}'), archived + 1
+        )
+        self.assertEqual(
+            metric_sample('minitask_task_updates_total{view="archive",result="saved"}'),
+            saved + 1,
+        )
+        self.assertEqual(
+            metric_sample(
+                'minitask_task_updates_total{view="archive",result="conflict"}'
+            ),
+            conflicts + 1,
+        )
+
+    def test_shared_between_processes(self):
+        """Metrics of all processes are summed, gauges of running ones only"""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, "1-exited.json"), "w") as file:
+            json.dump(
+                {
+                    # No process has this pid
+                    "pid": 2 ** 22 + 1,
+                    "counters": [
+                        ["minitask_task_changes_total", [["type", "deleted"]], 5]
+                    ],
+                    "gauges": [
+                        ["minitask_db_connections", [["database", "default"]], 1]
+                    ],
+                },
+                file,
+            )
+
+        with override_settings(METRICS_DIR=directory):
+            own = metric_sample('minitask_task_changes_total{type="deleted"}') - 5
+            self.task.delete()
+
+            self.assertEqual(
+                metric_sample('minitask_task_changes_total{type="deleted"}'), own + 6,
+            )
+            self.client.get("/")
+            self.assertEqual(
+                metric_sample('minitask_db_connections{database="default"}'), 1
+            )
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_flush_throttled(self):
+        """Requests write the file of the process at most every few seconds"""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(METRICS_DIR=directory), mock.patch(
+            "os.replace", wraps=os.replace
+        ) as replace:
+            # Forced, like at exit
+            self.task.delete()
+            # pylint: disable=protected-access
+            metrics._store.flush(force=True)
+            self.assertEqual(replace.call_count, 1)
+
+            self.client.get("/")
+            self.client.get("/")
+            self.assertEqual(replace.call_count, 1)
+
+            with mock.patch.object(metrics, "FLUSH_SECONDS", 0):
+                self.client.get("/")
+            self.assertEqual(replace.call_count, 2)
+
+    def test_access(self):
+        """Metrics are only available to staff users or with the token"""
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 403)
+
+        with override_settings(METRICS_TOKEN="secret"):
+            response = Client().get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+            self.assertContains(response, "# TYPE minitask_task_changes_total counter")
+            response = Client().get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+            self.assertEqual(response.status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get("/metrics")
+        self.assertContains(response, "minitask_request_duration_seconds_bucket")
+
+
+def mock_connection(usable=True) -> mock.MagicMock:
+    """A psycopg2 connection, failing queries unless usable"""
+
+    psycopg_connection = mock.MagicMock(closed=0, isolation_level=1)
+    psycopg_connection.info.transaction_status = (
+        postgresql_base.extensions.TRANSACTION_STATUS_IDLE
+    )
+    if not usable:
+        cursor = psycopg_connection.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = postgresql_base.Database.OperationalError
+        psycopg_connection.cursor.return_value.execute.side_effect = (
+            postgresql_base.Database.OperationalError
+        )
+    return psycopg_connection
+
+
+class PostgresqlBackendTests(SimpleTestCase):
+    """Health checks and pooling with psycopg2 connections mocked"""
+
+    # pylint: disable=protected-access
+
+    def setUp(self):
+        self.new_connections = []
+
+        def get_new_connection(database, _conn_params):
+            database.isolation_level = 1
+            self.new_connections.append(mock_connection())
+            return self.new_connections[-1]
+
+        patcher = mock.patch.object(
+            postgresql_base.base.DatabaseWrapper,
+            "get_new_connection",
+            get_new_connection,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(postgresql_base._pools.pop, "pooled", None)
+
+    @staticmethod
+    def database(pool=True) -> postgresql_base.DatabaseWrapper:
+        settings_dict = {
+            "ENGINE": "minitask.db.postgresql",
+            "NAME": "minitask",
+            "USER": "",
+            "PASSWORD": "",
+            "HOST": "",
+            "PORT": "",
+            "OPTIONS": {},
+            "AUTOCOMMIT": True,
+            "ATOMIC_REQUESTS": False,
+            "CONN_MAX_AGE": 60,
+            "CONN_HEALTH_CHECKS": True,
+            "TIME_ZONE": None,
+            "TEST": {},
+        }
+        if pool:
+            settings_dict["POOL"] = {"size": 1, "timeout": 0.01}
+        return postgresql_base.DatabaseWrapper(settings_dict, "pooled")
+
+    def test_acquire_timeout(self):
+        """Waiting for a connection times out when all are in use"""
+
+        database = self.database()
+        database.get_new_connection({})
+
+        with self.assertRaises(postgresql_base.Database.OperationalError):
+            self.database().get_new_connection({})
+
+    def test_connect_failed(self):
+        """The connection is available again when connecting failed"""
+
+        database = self.database()
+        with mock.patch.object(
+            postgresql_base.base.DatabaseWrapper,
+            "get_new_connection",
+            side_effect=postgresql_base.Database.OperationalError,
+        ), self.assertRaises(postgresql_base.Database.OperationalError):
+            database.get_new_connection({})
+
+        self.assertIsNotNone(database.get_new_connection({}))
+
+    def test_reuse(self):
+        """Closed connections are rolled back and reused"""
+
+        database = self.database()
+        database.connection = database.get_new_connection({})
+        database.connection.info.transaction_status = (
+            postgresql_base.extensions.TRANSACTION_STATUS_INTRANS
+        )
+        database._close()
+
+        database.connection.rollback.assert_called_once_with()
+        database.connection.close.assert_not_called()
+        self.assertIs(self.database().get_new_connection({}), self.new_connections[0])
+        self.assertEqual(len(self.new_connections), 1)
+
+    def test_not_reused_when_broken(self):
+        """Connections failing to roll back are closed rather than reused"""
+
+        database = self.database()
+        database.connection = database.get_new_connection({})
+        database.connection.info.transaction_status = (
+            postgresql_base.extensions.TRANSACTION_STATUS_INERROR
+        )
+        database.connection.rollback.side_effect = (
+            postgresql_base.Database.OperationalError
+        )
+        database._close()
+
+        database.connection.close.assert_called_once_with()
+        self.assertIsNot(
+            self.database().get_new_connection({}), self.new_connections[0]
+        )
+
+    def test_health_check_pooled(self):
+        """Pooled connections not working anymore are replaced"""
+
+        broken = mock_connection(usable=False)
+        self.database()._get_pool().give((broken, 1))
+
+        replacement = self.database().get_new_connection({})
+
+        broken.close.assert_called_once_with()
+        self.assertIs(replacement, self.new_connections[0])
+
+    def test_health_check_persistent(self):
+        """Persistent connections are checked before their first query"""
+
+        database = self.database(pool=False)
+        broken = mock_connection(usable=False)
+        database.connection = broken
+        database.health_check_done = False
+
+        database._close_if_health_check_failed()
+
+        broken.close.assert_called_once_with()
+        self.assertIsNone(database.connection)
+        self.assertTrue(database.health_check_done)
+
+    def test_fork(self):
+        """Connections inherited from the parent process are not reused"""
+
+        pool = self.database()._get_pool()
+        with mock.patch.object(postgresql_base.os, "getpid", return_value=pool.pid + 1):
+            self.assertIsNot(self.database()._get_pool(), pool)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Routing decisions, no queries are made to the replica"""
+
+    def setUp(self):
+        # Overriding DATABASES warns about connections not being reset
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            replica = self.settings(
+                DATABASES={
+                    **settings.DATABASES,
+                    "replica": settings.DATABASES["default"],
+                }
+            )
+            replica.enable()
+        self.addCleanup(replica.disable)
+        self.session = CacheSessionStore()
+        self.reads = []
+
+    def request(self, method="get", write=False, primary=False):
+        def view(request):
+            with routers.use_primary() if primary else nullcontext():
+                self.reads.append(router.db_for_read(Task))
+            self.reads.append(router.db_for_read(Session))
+            if write:
+                router.db_for_write(Task)
+            return HttpResponse()
+
+        self.reads.clear()
+        request = getattr(RequestFactory(), method)("/")
+        request.session = self.session
+        routers.ReplicaMiddleware(view)(request)
+        return self.reads[0]
+
+    def test_reads(self):
+        """Reads of requests go to the replica"""
+
+        self.assertEqual(self.request(), "replica")
+        # Sessions always go to the primary
+        self.assertEqual(self.reads[1], "default")
+        self.assertEqual(self.request(primary=True), "default")
+        self.assertEqual(self.request("post"), "default")
+        self.assertEqual(router.db_for_read(Task), "default")
+
+    def test_read_your_writes(self):
+        """Reads after a write of the session go to the primary for a while"""
+
+        self.assertEqual(self.request(write=True), "replica")
+        self.assertEqual(self.request(), "default")
+        self.session[routers.PINNED_UNTIL_KEY] = 0
+        self.assertEqual(self.request(), "replica")
+
+    def test_streaming(self):
+        """Streamed responses read from the replica"""
+
+        def view(request):
+            yield router.db_for_read(Task)
+
+        request = RequestFactory().get("/")
+        request.session = self.session
+        response = routers.ReplicaMiddleware(
+            lambda request: StreamingHttpResponse(view(request))
+        )(request)
+
+        self.assertEqual(b"".join(response.streaming_content), b"replica")
+
+
+class EventsTests(TransactionTestCase):
+    """Events are published on commit, which needs real transactions"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("testuser", password="test")
+        self.project = Project.objects.create(title="Test Project")
+        self.project.members.add(self.user)
+        self.task = Task.objects.create(
+            project=self.project, created_by=self.user, title="Task"
+        )
+        hidden_project = Project.objects.create(title="Hidden Project")
+        self.hidden = Task.objects.create(
+            project=hidden_project, created_by=self.user, title="Hidden"
+        )
+        self.client.login(username="testuser", password="test")
+
+    @staticmethod
+    def scope(cookies=""):
+        return {
+            "type": "http",
+            "method": "GET",
+            "path": "/tasks/events",
+            "query_string": b"",
+            "headers": [(b"cookie", cookies.encode())],
+        }
+
+    def test_event_stream(self):
+        """Changes of visible tasks are streamed"""
+
+        session_cookie = self.client.cookies[settings.SESSION_COOKIE_NAME]
+
+        async def stream():
+            communicator = ApplicationCommunicator(
+                asgi.application,
+                self.scope(f"{session_cookie.key}={session_cookie.value}"),
+            )
+            await communicator.send_input({"type": "http.request"})
+            start = await communicator.receive_output(1)
+            self.assertEqual(start["status"], 200)
+            self.assertIn((b"content-type", b"text/event-stream"), start["headers"])
+            retry = await communicator.receive_output(1)
+            self.assertEqual(retry["body"], b"retry: 5000\n\n")
+
+            await sync_to_async(self.change_tasks)()
+            message = await communicator.receive_output(1)
+            await communicator.send_input({"type": "http.disconnect"})
+            await communicator.wait()
+            return message["body"].decode()
+
+        message = async_to_sync(stream)()
+        self.assertIn(
+            f'"type": "archived", "task_id": {self.task.id}, "version": 1', message
+        )
+        self.assertNotIn(f'"task_id": {self.hidden.id}', message)
+
+    def change_tasks(self):
+        self.hidden.title = "Changed"
+        self.hidden.save()
+        self.task.is_archived = True
+        self.task.save()
+
+    def test_event_stream_unauthenticated(self):
+        """The event stream requires signing in"""
+
+        async def stream():
+            communicator = ApplicationCommunicator(asgi.application, self.scope())
+            await communicator.send_input({"type": "http.request"})
+            return await communicator.receive_output(1)
+
+        self.assertEqual(async_to_sync(stream)()["status"], 403)
+
+    def test_bulk_change_events(self):
+        """Bulk changes publish an event per task"""
+
+        async def subscribe():
+            broker = events.get_broker()
+            subscription = broker.subscribe()
+            await sync_to_async(bulk_change)(
+                self.user, {self.task.id: 0, self.hidden.id: 0}, "status", "done"
+            )
+            try:
+                return await asyncio.wait_for(subscription.get(), 1)
+            finally:
+                broker.unsubscribe(subscription)
+
+        self.assertEqual(
+            async_to_sync(subscribe)(),
+            [events.TaskEvent("updated", self.task.id, self.project.id, 1)],
+        )
+
+    def test_event_stream_enabled(self):
+        """The task list only subscribes to the events when enabled"""
+
+        self.assertNotContains(self.client.get("/"), "data-task-events=")
+        with self.settings(TASK_EVENTS=True):
+            self.assertContains(
+                self.client.get("/"), 'data-task-events="/tasks/events"'
+            )
+
+    def test_task_row(self):
+        """The row of a task is rendered if it is still in the filtered list"""
+
+        response = self.client.get(f"/tasks/{self.task.id}/row?status=open")
+        self.assertContains(response, f'data-task-id="{self.task.id}"')
+        self.assertContains(response, "Task")
+
+        response = self.client.get(f"/tasks/{self.task.id}/row?status=done")
+        self.assertEqual(response.status_code, 204)
+
+        response = self.client.get(f"/tasks/{self.hidden.id}/row")
+        self.assertEqual(response.status_code, 204)
+
+
+class PostgresBrokerTests(SimpleTestCase):
+    """Listening to notifications with psycopg2 mocked"""
+
+    # pylint: disable=protected-access
+
+    def mock_listener(self):
+        """A listening connection and the socket notifying it"""
+
+        reader, writer = socket.socketpair()
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+        listener = mock.MagicMock(notifies=[])
+        listener.fileno.return_value = reader.fileno()
+        listener.poll.side_effect = lambda: reader.recv(1)
+        return listener, writer
+
+    @staticmethod
+    def notify(listener, writer, published):
+        listener.notifies.append(mock.Mock(payload=json.dumps(published)))
+        writer.send(b"\0")
+
+    def test_events(self):
+        """Notifications are delivered to the subscribers"""
+
+        listener, writer = self.mock_listener()
+
+        async def receive():
+            broker = events.PostgresBroker()
+            # Subscribed in the event loop like the event stream does
+            subscription = broker.subscribe()
+            await broker._connecting
+            self.notify(listener, writer, [["updated", 1, 2, 3]])
+            return await asyncio.wait_for(subscription.get(), 1)
+
+        with mock.patch("psycopg2.connect", return_value=listener) as connect:
+            received = async_to_sync(receive)()
+
+        self.assertEqual(received, [events.TaskEvent("updated", 1, 2, 3)])
+        connect.assert_called_once_with(**connection.get_connection_params())
+        cursor = listener.cursor.return_value.__enter__.return_value
+        cursor.execute.assert_called_once_with("LISTEN minitask_task_events")
+
+    @mock.patch.object(events.PostgresBroker, "RETRY_SECONDS", 0.01)
+    def test_listen_again(self):
+        """Listening starts again after failing, subscribers start over"""
+
+        failing, failing_writer = self.mock_listener()
+        failing.poll.side_effect = postgresql_base.Database.OperationalError
+        listener, writer = self.mock_listener()
+
+        async def receive():
+            broker = events.PostgresBroker()
+            subscription = broker.subscribe()
+            await broker._connecting
+            failing_writer.send(b"\0")
+            while broker._listener is not listener:
+                await asyncio.sleep(0.01)
+            self.assertTrue(subscription.lost_events)
+            subscription.reset()
+
+            self.notify(listener, writer, [["updated", 1, 2, 3]])
+            return await asyncio.wait_for(subscription.get(), 1)
+
+        with mock.patch(
+            "psycopg2.connect", side_effect=[failing, listener]
+        ), self.assertLogs("tasks.events", "ERROR"):
+            received = async_to_sync(asyncio.wait_for)(receive(), 1)
+
+        self.assertEqual(received, [events.TaskEvent("updated", 1, 2, 3)])
+        failing.close.assert_called_once_with()
+
+    def test_connect_failed(self):
+        """Subscribers start over when listening failed"""
+
+        async def subscribe():
+            broker = events.PostgresBroker()
+            subscription = broker.subscribe()
+            await broker._connecting
+            return subscription
+
+        with mock.patch(
+            "psycopg2.connect", side_effect=postgresql_base.Database.OperationalError
+        ), self.assertLogs("tasks.events", "ERROR"):
+            subscription = async_to_sync(subscribe)()
+
+        self.assertTrue(subscription.lost_events)
+
+
+class QueryCount(NamedTuple):
+    """Queries executed by one request"""
+
+    count: int
+    time: float
+
+
+class QueryBudgetTests(TestCase):
+    """
+    The number of queries of the views must not depend on the amount of data
+
+    Each view is requested with a small and a larger data set and the query
+    counts are compared, which catches N+1 query regressions.
+    """
+
+    SMALL = 1
+    LARGE = 10
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("testuser", password="test")
+        self.user.user_permissions.add(
+            *Permission.objects.filter(codename="change_task")
+        )
+        self.project = Project.objects.create(title="Test Project")
+        self.project.members.add(self.user)
+        self.task = Task.objects.create(
+            project=self.project, created_by=self.user, title="Test Task"
+        )
+        self.note = Note.objects.create(
+            task=self.task, author=self.user, body="Test Note"
+        )
+        self.seeded = 0
+        self.client.login(username="testuser", password="test")
+
+    def seed(self, count):
+        """Add tasks, notes, tags and users until there are count of each"""
+
+        for i in range(self.seeded, count):
+            user = User.objects.create_user(f"seeded{i}", first_name=f"Seeded {i}")
+            self.project.members.add(user)
+            task = Task.objects.create(
+                project=self.project,
+                created_by=user,
+                assignee=user,
+                title=f"Seeded Task {i}",
+            )
+            task.tags.add("seeded", f"seeded{i}")
+            self.task.tags.add(f"seeded{i}")
+            Note.objects.create(task=task, author=user, body=f"Seeded Note {i}")
+            Note.objects.create(task=self.task, author=user, body=f"Seeded Note {i}")
+        self.seeded = max(self.seeded, count)
+
+    def measure(self, request) -> QueryCount:
+        """Make a request and record the queries it executed"""
+
+        # Warm up, the first request may create tags or fill caches
+        request()
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertLess(response.status_code, 400)
+        return QueryCount(
+            count=len(queries),
+            time=sum(float(query["time"]) for query in queries.captured_queries),
+        )
+
+    def assertQueryCountConstant(self, request):  # pylint: disable=invalid-name
+        """The request executes the same number of queries for SMALL and LARGE"""
+
+        self.seed(self.SMALL)
+        small = self.measure(request)
+        self.seed(self.LARGE)
+        large = self.measure(request)
+        self.assertEqual(
+            small.count,
+            large.count,
+            f"{small.count} queries ({small.time * 1000:.1f}ms) with "
+            f"{self.SMALL} and {large.count} queries ({large.time * 1000:.1f}ms) "
+            f"with {self.LARGE} of each object",
+        )
+
+    def test_index(self):
+        """Task list queries do not grow with the data"""
+
+        self.assertQueryCountConstant(lambda: self.client.get("/"))
+
+    def test_index_filtered(self):
+        """Filtered task list queries do not grow with the data"""
+
+        self.assertQueryCountConstant(
+            lambda: self.client.get(
+                "/", {"project": self.project.id, "tags": "seeded", "status": "open"}
+            )
+        )
+
+    def test_index_search(self):
+        """Search results queries do not grow with the data"""
+
+        self.assertQueryCountConstant(lambda: self.client.get("/", {"q": "seeded"}))
+
+    def test_export(self):
+        """Exports make one query for the tasks and one per chunk for the tags"""
+
+        self.seed(self.LARGE)
+        tasks = Task.objects.all_visible()
+        ContentType.objects.get_for_model(Task)
+
+        with CaptureQueriesContext(connection) as queries:
+            lines = list(export.json_lines(tasks, chunk_size=4))
+
+        self.assertEqual(len(lines), tasks.count() + 1)
+        self.assertEqual(len(queries), 1 + math.ceil(tasks.count() / 4))
+
+    def test_bulk_edit(self):
+        """Bulk change queries do not grow with the number of tasks"""
+
+        def bulk_edit():
+            return self.client.post(
+                "/tasks/bulk",
+                {
+                    "tasks": [
+                        f"{task.id}:{task.version}" for task in Task.objects.all()
+                    ],
+                    "action": "add_tags",
+                    "tags": "seeded, bulk",
+                },
+            )
+
+        self.assertQueryCountConstant(bulk_edit)
+
+    def test_import(self):
+        """Import queries do not grow with the number of rows in a batch"""
+
+        self.seed(self.LARGE)
+        users = list(User.objects.values_list("username", flat=True))
+
+        def import_rows(count):
+            rows = [
+                {
+                    "project": "Test Project",
+                    "title": f"Imported {i}",
+                    "assignee": users[i],
+                    "tags": f"seeded, seeded{i}",
+                }
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                imports.import_tasks(rows, self.user)
+            return len(queries)
+
+        import_rows(1)
+        self.assertEqual(import_rows(self.SMALL), import_rows(self.LARGE))
+
+    def test_task_detail(self):
+        """Task detail with notes queries do not grow with the data"""
+
+        self.assertQueryCountConstant(lambda: self.client.get(f"/tasks/{self.task.id}"))
+
+    def test_edit_task_form(self):
+        """Task edit form queries do not grow with the data"""
+
+        self.assertQueryCountConstant(
+            lambda: self.client.get(f"/tasks/{self.task.id}/edit")
+        )
+
+    def test_edit_task(self):
+        """Saving a task queries do not grow with the data"""
+
+        def edit_task():
+            self.task.refresh_from_db()
+            return self.client.post(
+                f"/tasks/{self.task.id}/edit",
+                {
+                    "project": self.project.id,
+                    "title": "Edited Task",
+                    "priority": 2,
+                    "status": "open",
+                    "assignee": self.user.id,
+                    "tags": "seeded, seeded0",
+                    "version": self.task.version,
+                },
+            )
+
+        self.assertQueryCountConstant(edit_task)
+
+    def test_create_task(self):
+        """Creating a task queries do not grow with the data"""
+
+        self.assertQueryCountConstant(
+            lambda: self.client.post(
+                "/tasks",
+                {
+                    "version": 0,
+                    "project": self.project.id,
+                    "title": "New Task",
+                    "priority": 2,
+                    "status": "open",
+                    "assignee": self.user.id,
+                    "tags": "seeded, seeded0",
+                },
+            )
+        )
+
+    def test_edit_note_form(self):
+        """Note edit form queries do not grow with the data"""
+
+        self.assertQueryCountConstant(
+            lambda: self.client.get(f"/notes/{self.note.id}/edit")
+        )
+
+    def test_edit_note(self):
+        """Saving a note queries do not grow with the data"""
+
+        self.assertQueryCountConstant(
+            lambda: self.client.post(
+                f"/notes/{self.note.id}/edit", {"body": "Edited Note"}
+            )
+        )
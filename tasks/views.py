@@ -1,35 +1,62 @@
+import csv
+import io
+import json
+import os
+from hashlib import md5
 from urllib.parse import SplitResult, urlsplit
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
+from django.core.exceptions import PermissionDenied
 from django.db import transaction
-from django.http import Http404
+from django.db.models import Count, Exists, Max, OuterRef, Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.http.request import validate_host
+from django.middleware.csrf import get_token
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils import timezone, translation
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.utils.translation import gettext_lazy as _
+from django.views.decorators.http import require_http_methods, require_POST
 from ool import ConcurrentUpdate
 
 from accounts.models import User
+from minitask import metrics
+from minitask.routers import use_primary
 
+from . import export, imports, row_cache, stats
+from .bulk import bulk_change
+from .choices import choices_for_user
+from .event_stream import EVENTS_PATH
 from .forms.archive_task_form import ArchiveTaskForm
-from .forms.new_task_form import NewTaskForm
+from .forms.bulk_task_form import BulkTaskForm
+from .forms.import_form import ImportForm
+from .forms.new_task_form import UNRESTRICTED_FIELDS, NewTaskForm
 from .forms.note_form import NoteForm
+from .forms.task_fields_form import TaskFieldsForm
 from .forms.task_filter_form import TaskFilterForm
-from .models import Note, Project, Task
+from .models import Note, Project, ProjectMembership, Task
+from .pagination import TaskCursor, TaskPage, paginate_tasks
+from .patch import patch_task
 from .templatetags.tasks_extras import user_str
 
+ASSIGNEES_LIMIT = 20
+"""Default and maximum number of users returned by the assignees endpoint"""
+
+TASK_UPDATES = metrics.Counter(
+    "minitask_task_updates_total",
+    "Updates of tasks by URL name, saved or refused for a concurrent update",
+    ["view", "result"],
+)
+
 
 @login_required
 def index(request):
-    projects = Project.objects.visible_to_user(request.user)
-
     # Set up the filter form
-    project_choices = [(project.id, str(project)) for project in projects]
-    assignee_choices = [(user.id, user_str(user)) for user in User.objects.all()]
-    form = TaskFilterForm(
-        request.GET, project_choices=project_choices, assignee_choices=assignee_choices
-    )
+    project_choices = stats.with_task_counts(choices_for_user(request.user).projects)
+    form = TaskFilterForm(request.GET, project_choices=project_choices)
 
     # Warning: form.is_valid() has the side-effect of populating form.cleaned_data
     form.is_valid()
@@ -40,34 +67,117 @@ def index(request):
     elif "next_due_date" in request.GET:
         form.next_due_date()
 
+    if "previous_created_at" in request.GET:
+        form.previous_created_at()
+
+    elif "next_created_at" in request.GET:
+        form.next_created_at()
+
     # "Remember" the last filter query so that the "back to the task list"
     # links can return to a *filtered* list
     request.session["last_task_filter"] = form.data
 
-    tasks = (
-        Task.objects.visible_to_user(request.user)
-        .filtered_by(
-            project=form.cleaned_data.get("project"),
-            due_date_before=form.cleaned_data.get("due_date_before"),
-            due_date_after=form.cleaned_data.get("due_date_after"),
-            status=form.cleaned_data.get("status"),
-            assignee=form.cleaned_data.get("assignee"),
-            tags=form.cleaned_data.get("tags"),
+    tasks = get_filtered_tasks(request.user, form)
+
+    if form.cleaned_data.get("q"):
+        # Search results are ordered by relevance, which can not be paginated
+        # with cursors. Only the best matches are shown.
+        page = TaskPage(
+            tasks=list(tasks[: settings.TASKS_PER_PAGE]),
+            next_cursor=None,
+            previous_cursor=None,
         )
-        .all_visible(is_archived=form.cleaned_data.get("is_archived"))
-        .all()
+    else:
+        page = paginate_tasks(
+            tasks,
+            per_page=settings.TASKS_PER_PAGE,
+            after=TaskCursor.parse(request.GET.get("after")),
+            before=TaskCursor.parse(request.GET.get("before")),
+        )
+
+    # Answer reloads of an unchanged page without rendering it. The page is
+    # validated by the cache keys of its rows, which change with the tasks,
+    # and by the adjacent pages, which change when tasks are added around.
+    etag = get_etag(
+        request,
+        [row_cache.row_key(task) for task in page.tasks],
+        page.next_cursor,
+        page.previous_cursor,
+        project_choices,
     )
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
 
     has_filter = (
         next((k for (k, v) in form.cleaned_data.items() if v is not None), None)
         is not None
     )
 
-    return render(
+    response = render(
         request,
         "index.html",
-        {"user": request.user, "tasks": tasks, "form": form, "has_filter": has_filter},
+        {
+            "user": request.user,
+            "tasks": page.tasks,
+            "task_rows": row_cache.render_rows(page.tasks),
+            "form": form,
+            "has_filter": has_filter,
+            "previous_page_query": get_page_query(
+                form.data, "before", page.previous_cursor
+            ),
+            "next_page_query": get_page_query(form.data, "after", page.next_cursor),
+            "filter_query": "?" + get_filter_query(form.data).urlencode(),
+            "events_url": EVENTS_PATH if settings.TASK_EVENTS else None,
+        },
     )
+    return set_etag(response, etag)
+
+
+@login_required
+def task_row(request, task_id):
+    """
+    The row of a task in the task list filtered by the query
+
+    Used for live updating the list. No content if the task is not in the
+    list any more.
+    """
+
+    form = TaskFilterForm(
+        request.GET, project_choices=choices_for_user(request.user).projects
+    )
+    form.is_valid()
+    task = get_filtered_tasks(request.user, form).filter(pk=task_id).first()
+    if task is None:
+        return HttpResponse(status=204)
+    return HttpResponse(row_cache.render_rows([task])[0])
+
+
+@login_required
+def export_tasks(request, file_format):
+    """Download the tasks matching the filters of the task list"""
+
+    form = TaskFilterForm(
+        request.GET, project_choices=choices_for_user(request.user).projects
+    )
+    form.is_valid()
+    tasks = get_filtered_tasks(request.user, form)
+
+    if file_format == "csv":
+        response = StreamingHttpResponse(
+            export.csv_lines(tasks), content_type="text/csv; charset=utf-8"
+        )
+    elif file_format == "json":
+        # Streamed, which JsonResponse is not
+        # pylint: disable=http-response-with-content-type-json
+        response = StreamingHttpResponse(
+            export.json_lines(tasks), content_type="application/json"
+        )
+    else:
+        raise Http404(_("Unknown export format"))
+
+    response["Content-Disposition"] = f'attachment; filename="tasks.{file_format}"'
+    return response
 
 
 @login_required
@@ -101,15 +211,34 @@ def copy_task(request, task_id):
 
 @login_required
 def task_detail(request, task_id):
-    task = get_object_or_404(Task.objects.visible_to_user(request.user), pk=task_id)
+    # Answer reloads of an unchanged task without fetching and rendering it
+    validators = (
+        Task.objects.visible_to_user(request.user)
+        .filter(pk=task_id)
+        .annotate(notes_updated_at=Max("notes__updated_at"), notes_count=Count("notes"))
+        .values_list("version", "project__title", "notes_updated_at", "notes_count")
+        .first()
+    )
+    if validators is None:
+        raise Http404("No Task matches the given query.")
+    etag = get_etag(request, validators, request.session.get("last_task_filter"))
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    task = get_object_or_404(
+        Task.objects.visible_to_user(request.user).with_details(), pk=task_id
+    )
     note_form = NoteForm(request.POST)
     archive_task_form = ArchiveTaskForm(None, instance=task)
-    return render_task_detail(
+    response = render_task_detail(
         request, task, note_form=note_form, archive_task_form=archive_task_form,
     )
+    return set_etag(response, etag)
 
 
 @login_required
+@use_primary()
 def edit_task(request, task_id):
     task = get_object_or_404(Task.objects.visible_to_user(request.user), pk=task_id)
     can_change_task = request.user.has_perm("tasks.change_task")
@@ -125,10 +254,12 @@ def edit_task(request, task_id):
             try:
                 form.save()
             except ConcurrentUpdate:
+                TASK_UPDATES.inc(view="edit", result="conflict")
                 return render_task_edit(
                     request, task, form, is_concurrent_update=True, status=409,
                 )
 
+            TASK_UPDATES.inc(view="edit", result="saved")
             action = request.POST.get("action")
             if action == "copy":
                 return redirect("copy", task.id)
@@ -146,6 +277,7 @@ def edit_task(request, task_id):
 # TODO consider adding a custom "tasks.archive_task" permission
 @login_required
 @permission_required("tasks.delete_task")
+@use_primary()
 def archive_task(request, task_id):
     """Set the is_archived flag on a task"""
 
@@ -158,6 +290,7 @@ def archive_task(request, task_id):
             try:
                 form.save()
             except ConcurrentUpdate:
+                TASK_UPDATES.inc(view="archive", result="conflict")
                 return render_task_detail(
                     request,
                     task,
@@ -166,6 +299,7 @@ def archive_task(request, task_id):
                     is_concurrent_update=True,
                     status=409,
                 )
+            TASK_UPDATES.inc(view="archive", result="saved")
             return redirect("detail", task.id)
         else:
             return redirect("detail", task.id)
@@ -173,6 +307,126 @@ def archive_task(request, task_id):
         return redirect("detail", task.id)
 
 
+@login_required
+@require_POST
+def bulk_edit_tasks(request):
+    """
+    Change many tasks at once
+
+    Tasks are posted as "id:version" pairs, tasks changed since that version
+    are not updated but reported as conflicts.
+    """
+
+    form = BulkTaskForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+
+    action = form.cleaned_data["action"]
+    if action == "archive":
+        permitted = request.user.has_perm("tasks.delete_task")
+    elif action in UNRESTRICTED_FIELDS:
+        permitted = True
+    else:
+        permitted = request.user.has_perm("tasks.change_task")
+    if not permitted:
+        raise PermissionDenied
+
+    result = bulk_change(request.user, form.cleaned_data["tasks"], action, form.value())
+    return JsonResponse(result._asdict())
+
+
+@login_required
+@require_http_methods(["PATCH"])
+def patch_task_fields(request, task_id):
+    """
+    Change single fields of a task
+
+    Expects a JSON object with the version of the task and the fields to
+    change. Responds with the new version, or with 409 if the task was
+    changed since that version.
+    """
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return JsonResponse(
+            {"errors": {"__all__": [_("Send the changes as a JSON object.")]}},
+            status=400,
+        )
+
+    form = TaskFieldsForm(data)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+
+    changes = form.changes()
+    if not changes.keys() <= UNRESTRICTED_FIELDS and not request.user.has_perm(
+        "tasks.change_task"
+    ):
+        raise PermissionDenied
+
+    try:
+        version = patch_task(
+            request.user, task_id, form.cleaned_data["version"], changes
+        )
+    except Task.DoesNotExist as error:
+        raise Http404("No Task matches the given query.") from error
+    except ConcurrentUpdate:
+        TASK_UPDATES.inc(view="patch", result="conflict")
+        return JsonResponse(
+            {
+                "errors": {
+                    "version": [
+                        _(
+                            "The task has been modified (possibly by someone else) "
+                            "in the meantime."
+                        )
+                    ]
+                }
+            },
+            status=409,
+        )
+
+    TASK_UPDATES.inc(view="patch", result="saved")
+    return JsonResponse({"id": task_id, "version": version})
+
+
+@login_required
+@permission_required("tasks.add_task")
+def import_tasks(request):
+    """Create tasks from an uploaded CSV or JSON file"""
+
+    form = ImportForm(request.POST or None, request.FILES or None)
+    result = None
+    errors = None
+
+    if request.method == "POST" and form.is_valid():
+        upload = form.cleaned_data["file"]
+        file_format = os.path.splitext(upload.name)[1][1:].lower()
+        try:
+            rows = imports.read_rows(
+                io.TextIOWrapper(upload, encoding="utf-8-sig", newline=""), file_format,
+            )
+            result = imports.import_tasks(
+                rows, request.user, skip=form.cleaned_data["skip"] or 0
+            )
+        except imports.ImportFailed as error:
+            result = error.result
+            errors = error.errors
+            # Resume after the imported rows when the fixed file is uploaded
+            form = ImportForm(initial={"skip": error.result.last_row})
+        except (ValueError, csv.Error) as error:
+            form.add_error("file", _("The file could not be read: %s") % error)
+
+    return render(
+        request,
+        "tasks/import.html",
+        {"user": request.user, "form": form, "result": result, "errors": errors},
+        status=400 if errors or form.errors else 200,
+    )
+
+
 @login_required
 @transaction.atomic
 def create_task(request):
@@ -253,21 +507,86 @@ def create_note(request, task_id):
         return redirect("detail", task.id)
 
 
+@login_required
+def assignees(request):
+    """
+    Active users for the assignee dropdowns as JSON
+
+    Users are filtered by name prefix (q) and limited to the members of a
+    project (project) or, if not given, to the members of the projects
+    visible to the current user.
+    """
+
+    projects = Project.objects.visible_to_user(request.user)
+    project_id = request.GET.get("project", "")
+    if project_id:
+        projects = projects.filter(pk=project_id if project_id.isdigit() else None)
+        if not projects.exists():
+            raise Http404(_("Project not found"))
+    elif request.user.is_superuser:
+        projects = None
+
+    users = User.objects.filter(is_active=True)
+
+    if projects is not None:
+        users = users.filter(
+            Exists(
+                ProjectMembership.objects.active().filter(
+                    user=OuterRef("pk"), project__in=projects
+                )
+            )
+        )
+
+    prefix = request.GET.get("q", "").strip()
+    if prefix:
+        users = users.filter(
+            Q(username__istartswith=prefix)
+            | Q(first_name__istartswith=prefix)
+            | Q(last_name__istartswith=prefix)
+        )
+
+    try:
+        limit = max(
+            1, min(int(request.GET.get("limit", ASSIGNEES_LIMIT)), ASSIGNEES_LIMIT)
+        )
+    except ValueError:
+        limit = ASSIGNEES_LIMIT
+
+    users = users.order_by("first_name", "last_name", "username")[:limit]
+    return JsonResponse(
+        {"results": [{"id": user.id, "text": user_str(user)} for user in users]}
+    )
+
+
 def render_task_detail(
     request, task, note_form, archive_task_form, is_concurrent_update=False, **kwargs
 ):
+    # Only show the latest notes unless more are requested
+    try:
+        notes_limit = max(int(request.GET["notes"]), settings.NOTES_PER_PAGE)
+    except (KeyError, ValueError):
+        notes_limit = settings.NOTES_PER_PAGE
+    notes = task.notes.select_related("author").order_by("-created_at", "-id")
+    notes = list(notes[: notes_limit + 1])
+    has_more_notes = len(notes) > notes_limit
+    notes = notes[:notes_limit][::-1]
+
     return render(
         request,
         "tasks/detail.html",
         {
             "user": request.user,
             "task": task,
+            "notes": notes,
+            "more_notes_limit": notes_limit + settings.NOTES_PER_PAGE
+            if has_more_notes
+            else None,
             "note_form": note_form,
             "archive_task_form": archive_task_form,
             "is_concurrent_update": is_concurrent_update,
             "last_task_filter": request.session.get("last_task_filter"),
         },
-        **kwargs
+        **kwargs,
     )
 
 
@@ -282,9 +601,94 @@ def render_task_edit(request, task, form, is_concurrent_update=False, **kwargs):
             "is_concurrent_update": is_concurrent_update,
             "last_task_filter": request.session.get("last_task_filter"),
         },
-        **kwargs
+        **kwargs,
+    )
+
+
+def get_filtered_tasks(user, form):
+    """Tasks visible to the user matching the filters of a validated form"""
+
+    tasks = (
+        Task.objects.visible_to_user(user)
+        .filtered_by(
+            project=form.cleaned_data.get("project"),
+            due_date_before=form.cleaned_data.get("due_date_before"),
+            due_date_after=form.cleaned_data.get("due_date_after"),
+            created_before=form.cleaned_data.get("created_before"),
+            created_after=form.cleaned_data.get("created_after"),
+            status=form.cleaned_data.get("status"),
+            assignee=form.cleaned_data.get("assignee"),
+            tags=form.cleaned_data.get("tags"),
+            tags_match=form.cleaned_data.get("tags_match"),
+        )
+        .all_visible(is_archived=form.cleaned_data.get("is_archived"))
     )
 
+    if form.cleaned_data.get("q"):
+        tasks = tasks.search(form.cleaned_data["q"])
+
+    return tasks
+
+
+def get_page_query(data, direction, cursor):
+    """Query string of a task list page retaining the current filters"""
+
+    if cursor is None:
+        return None
+
+    query = get_filter_query(data)
+    query[direction] = str(cursor)
+    return "?" + query.urlencode()
+
+
+def get_etag(request, *validators) -> str:
+    """
+    Quoted ETag of a page of the user
+
+    The validators describe the data shown on the page. The user, language,
+    time zone, URL and CSRF token of the request are added to them. Changes
+    of user names or permissions are not noticed until the data changes.
+    """
+
+    # Pages with forms embed the CSRF token, set it from the first response on
+    get_token(request)
+    key = repr(
+        (
+            request.user.pk,
+            request.user.is_staff,
+            translation.get_language(),
+            timezone.get_current_timezone_name(),
+            request.get_full_path(),
+            request.META.get("CSRF_COOKIE"),
+            validators,
+        )
+    )
+    return quote_etag(md5(key.encode()).hexdigest())
+
+
+def set_etag(response, etag: str):
+    """Set the ETag of the response and make clients revalidate it"""
+
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def get_filter_query(data):
+    """The task list query parameters without the navigation parameters"""
+
+    query = data.copy()
+    for key in (
+        "after",
+        "before",
+        "previous_due_date",
+        "next_due_date",
+        "previous_created_at",
+        "next_created_at",
+    ):
+        query.pop(key, None)
+    return query
+
 
 def get_local_referrer(request):
     """Get the referrer URL if it is not external to this application"""